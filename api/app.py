@@ -2,7 +2,8 @@ from fastapi.middleware.cors import CORSMiddleware
 import fastapi
 from api.routers.admin import router as admin_router
 from api.routers.user import router as user_router
-app = fastapi.FastAPI()
+from api.lifespan import lifespan
+app = fastapi.FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
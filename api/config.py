@@ -4,19 +4,135 @@ import dotenv
 
 dotenv.load_dotenv(os.environ.get("ENV_PATH", None))
 
+@environ.config()
+class DbPool:
+    size: int = environ.var(default=5, converter=int)
+    max_overflow: int = environ.var(default=10, converter=int)
+    timeout: float = environ.var(default=30, converter=float)
+    recycle: int = environ.var(default=-1, converter=int)
+    statement_cache_size: int = environ.var(default=100, converter=int)
+
 @environ.config()
 class Jwt:
     secret: str = environ.var()
+    ttl: float = environ.var(default=3600, converter=float)
+    identity_cache_size: int = environ.var(default=1024, converter=int)
+    identity_ttl: float = environ.var(default=300, converter=float)
 
 @environ.config()
 class Password:
     salt: str = environ.var()
     token_key: str = environ.var()
+    hash_workers: int = environ.var(default=2, converter=int)
+    max_pending: int = environ.var(default=8, converter=int)
 
 @environ.config()
 class Opencti:
     url: str = environ.var()
     token: str = environ.var()
+    workers: int = environ.var(default=4, converter=int)
+    timeout: float = environ.var(default=15, converter=float)
+    cache_size: int = environ.var(default=50000, converter=int)
+    cache_ttl: float = environ.var(default=3600, converter=float)
+
+@environ.config()
+class Journal:
+    retention: int = environ.var(default=100000, converter=int)
+    prune_interval: float = environ.var(default=300, converter=float)
+
+@environ.config()
+class Apikey:
+    cache_size: int = environ.var(default=4096, converter=int)
+    ttl: float = environ.var(default=60, converter=float)
+    negative_ttl: float = environ.var(default=5, converter=float)
+
+@environ.config()
+class Push:
+    queue_size: int = environ.var(default=64, converter=int)
+    send_timeout: float = environ.var(default=10, converter=float)
+
+@environ.config()
+class Ingest:
+    max_batch: int = environ.var(default=5000, converter=int)
+
+@environ.config()
+class IocBuffer:
+    enabled: bool = environ.bool_var(default=False)
+    flush_ms: int = environ.var(default=500, converter=int)
+    max_entries: int = environ.var(default=1000, converter=int)
+    max_pending: int = environ.var(default=10000, converter=int)
+    max_known: int = environ.var(default=100000, converter=int)
+    overflow: str = environ.var(default="bypass")
+    max_retries: int = environ.var(default=3, converter=int)
+
+@environ.config()
+class ActivityLog:
+    mode: str = environ.var(default="async")
+    queue_size: int = environ.var(default=10000, converter=int)
+    batch_size: int = environ.var(default=500, converter=int)
+    flush_ms: int = environ.var(default=1000, converter=int)
+
+@environ.config()
+class Abuseipdb:
+    url: str = environ.var(default="https://api.abuseipdb.com/api/v2")
+    connect_timeout: float = environ.var(default=3, converter=float)
+    read_timeout: float = environ.var(default=10, converter=float)
+    positive_ttl: float = environ.var(default=6 * 3600, converter=float)
+    negative_ttl: float = environ.var(default=300, converter=float)
+    stale_ttl: float = environ.var(default=7 * 24 * 3600, converter=float)
+    cache_size: int = environ.var(default=50000, converter=int)
+    pool_size: int = environ.var(default=8, converter=int)
+
+@environ.config()
+class BulkEnrich:
+    concurrency: int = environ.var(default=16, converter=int)
+    max_ips: int = environ.var(default=1000, converter=int)
+    opencti_timeout: float = environ.var(default=20, converter=float)
+    abuseipdb_timeout: float = environ.var(default=15, converter=float)
+    failure_threshold: int = environ.var(default=5, converter=int)
+    reset_timeout: float = environ.var(default=30, converter=float)
+
+@environ.config()
+class Enrichment:
+    enabled: bool = environ.bool_var(default=True)
+    batch_size: int = environ.var(default=50, converter=int)
+    scan_interval: float = environ.var(default=60, converter=float)
+    lease: float = environ.var(default=600, converter=float)
+    max_age: float = environ.var(default=7 * 24 * 3600, converter=float)
+    hot_max_age: float = environ.var(default=24 * 3600, converter=float)
+    hot_sightings: int = environ.var(default=100, converter=int)
+
+@environ.config()
+class Totals:
+    mode: str = environ.var(default="auto")
+    exact_threshold: int = environ.var(default=10000, converter=int)
+
+@environ.config()
+class Stats:
+    cache_ttl: float = environ.var(default=5, converter=float)
+    reconcile_interval: float = environ.var(default=3600, converter=float)
+    shards: int = environ.var(default=16, converter=int)
+
+@environ.config()
+class Whitelist:
+    sync_interval: float = environ.var(default=30, converter=float)
+
+@environ.config()
+class Aggregate:
+    coverage: float = environ.var(default=90, converter=float)
+    min_prefix_v4: int = environ.var(default=16, converter=int)
+    min_prefix_v6: int = environ.var(default=48, converter=int)
+    cache_size: int = environ.var(default=1024, converter=int)
+    cache_ttl: float = environ.var(default=3600, converter=float)
+
+@environ.config()
+class Export:
+    ipset_name: str = environ.var(default="blocklist")
+    nft_table: str = environ.var(default="centralized_firewall")
+    nft_set: str = environ.var(default="blocklist")
+    compress_min: int = environ.var(default=1024, converter=int)
+    cache_size: int = environ.var(default=256, converter=int)
+    cache_ttl: float = environ.var(default=3600, converter=float)
 
 @environ.config(prefix="")
 class Config:
@@ -24,9 +140,24 @@ class Config:
     class config
     """
     db: str = environ.var()
+    db_pool: DbPool = environ.group(DbPool)
     jwt: Jwt = environ.group(Jwt)
     password: Password = environ.group(Password)
     opencti: Opencti = environ.group(Opencti)
     abuseipdb_api_key: str = environ.var()
+    abuseipdb: Abuseipdb = environ.group(Abuseipdb)
+    journal: Journal = environ.group(Journal)
+    apikey: Apikey = environ.group(Apikey)
+    push: Push = environ.group(Push)
+    ingest: Ingest = environ.group(Ingest)
+    ioc_buffer: IocBuffer = environ.group(IocBuffer)
+    activity_log: ActivityLog = environ.group(ActivityLog)
+    bulk_enrich: BulkEnrich = environ.group(BulkEnrich)
+    enrichment: Enrichment = environ.group(Enrichment)
+    totals: Totals = environ.group(Totals)
+    stats: Stats = environ.group(Stats)
+    whitelist: Whitelist = environ.group(Whitelist)
+    aggregate: Aggregate = environ.group(Aggregate)
+    export: Export = environ.group(Export)
 
 cfg: Config = environ.to_config(Config)
@@ -7,7 +7,6 @@ from sqlalchemy.ext.asyncio import AsyncConnection
 
 from api.config import cfg
 from core.db import engine
-from exceptions import AdminNotFoundError
 from facades.admin import Admin
 from helpers.token_maker import TokenMaker
 
@@ -22,26 +21,40 @@ async def get_connection() -> AsyncConnection:
         yield conn
 
 
-async def get_name(token: str = Depends(admin_login_schema)) -> str:
+async def get_claims(token: str = Depends(admin_login_schema)) -> dict:
     """
-    get name from token
+    get claims from token
     """
     try:
-        new_token = TokenMaker().verify_token(token, cfg.password.token_key)
-        return new_token["uuid"]
+        return TokenMaker().verify_token(token, cfg.password.token_key)
     except JWTError as e:
         raise HTTPException(401, {"msg": str(e)}) from e
 
+async def get_name(claims: dict = Depends(get_claims)) -> str:
+    """
+    get name from token
+    """
+    return claims["uuid"]
+
+async def get_admin_id(claims: dict = Depends(get_claims)) -> int:
+    """
+    get id by token, from the ``id`` claim when the token carries it so no
+    query is needed, else from the cached uuid lookup
+    """
+    admin_id = claims.get("id")
+    if admin_id is None:
+        async with engine.connect() as conn:
+            admin_id = await Admin(conn).resolve_admin_id(claims.get("uuid"))
+        if admin_id is None:
+            raise HTTPException(401, {"msg": "silahkan login"})
+
+    return admin_id
+
 async def get_id(
-    conn: AsyncConnection = Depends(get_connection), uuid_: str = Depends(get_name)
+    admin_id: int = Depends(get_admin_id), conn: AsyncConnection = Depends(get_connection)
 ) -> AsyncIterator[Tuple[int, AsyncConnection]]:
     """
-    get id by token
+    get id by token with a transaction for the route, routes calling only
+    external services depend on ``get_admin_id`` and hold no connection
     """
-    a = Admin(conn)
-    try:
-        row = await a.read_by_name(uuid_)
-    except AdminNotFoundError as e:
-        raise HTTPException(401, {"msg": "silahkan login"}) from e
-
-    yield row.id, conn
+    yield admin_id, conn
@@ -0,0 +1,67 @@
+import contextlib
+
+import fastapi
+
+from api.config import cfg
+from core.db import engine
+from helpers.periodic import PeriodicTask
+from services.activity_log import activity_log
+from services.enrich import ioc_buffer
+from services.enrichment import enrichment_worker
+from services.journal import BlockJournal
+from services.opencti import opencti_lookup
+from services.passwords import hashing_pool
+from services.push import block_change_listener
+from services.reputation import reputation_client
+from services.stats import DashboardStats
+from services.whitelist import whitelist_index
+
+
+async def prune_journal() -> None:
+    """
+    Keep the block journal bounded, agents behind the retention get a full list
+    """
+    async with engine.begin() as conn:
+        await BlockJournal(conn).prune(cfg.journal.retention)
+
+
+journal_pruner = PeriodicTask(prune_journal, cfg.journal.prune_interval, 'prune-journal')
+
+
+async def reconcile_stats() -> None:
+    """
+    Recount the dashboard counters to correct drift
+    """
+    async with engine.begin() as conn:
+        await DashboardStats(conn).reconcile()
+
+
+stats_reconciler = PeriodicTask(reconcile_stats, cfg.stats.reconcile_interval, 'reconcile-stats')
+whitelist_syncer = PeriodicTask(whitelist_index.sync, cfg.whitelist.sync_interval, 'sync-whitelist')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    """
+    Start and stop background jobs of a worker
+    """
+    activity_log.start()
+    journal_pruner.start()
+    stats_reconciler.start()
+    whitelist_syncer.start()
+    block_change_listener.start()
+    if cfg.ioc_buffer.enabled:
+        ioc_buffer.start()
+    if cfg.enrichment.enabled:
+        enrichment_worker.start()
+    yield
+    await enrichment_worker.stop()
+    await ioc_buffer.stop()
+    await block_change_listener.stop()
+    await whitelist_syncer.stop()
+    await stats_reconciler.stop()
+    await journal_pruner.stop()
+    await activity_log.stop()
+    reputation_client.close()
+    opencti_lookup.close()
+    hashing_pool.close()
@@ -1,17 +1,22 @@
+import ipaddress
+import json
 from typing import Tuple, Optional
 
-from fastapi import APIRouter, WebSocket
+from fastapi import APIRouter
 from fastapi import HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncConnection
 from api.config import cfg
-from api.depends.admin import get_id
+from api.depends.admin import get_id, get_admin_id
 from core.db import engine
-from exceptions import AdminPasswordError, AdminIsNotLoginError, GroupNotFoundError
+from exceptions import AdminPasswordError, AdminIsNotLoginError, GroupNotFoundError, ReputationQuotaExceededError, \
+    EnrichTimeoutError, InvalidCursorError, WhitelistedIpError, HashingBusyError
 from facades.admin import Admin
-from helpers.authentication import BasicSalt, PasswordHasher
-from schemas.admin import AdminLoginSchema, UpdateAdminSchema
+from helpers.serialize import FastJSONResponse
+from schemas.admin import AdminLoginSchema, UpdateAdminSchema, BulkEnrichSchema, TotalModeEnum, \
+    WhitelistSchema
 
 router = APIRouter(prefix='/admin', tags=["Admin"])
 
@@ -22,20 +27,19 @@ async def login(data: OAuth2PasswordRequestForm = Depends()):
     :param data:
     :return:
     """
-    salt = BasicSalt(cfg.password.salt)
-    hash_ = PasswordHasher(salt)
-    async with engine.begin() as conn:
-        try:
-            return await Admin(
-                conn
-            ).login(
-                AdminLoginSchema(
-                    name=data.username,
-                    password=data.password
-                ), hash_
-            )
-        except AdminPasswordError:
-            raise HTTPException(401, detail="Login Failed")
+    schema = AdminLoginSchema(
+        name=data.username,
+        password=data.password
+    )
+    # the connection is released before bcrypt runs
+    async with engine.connect() as conn:
+        credentials = await Admin(conn).read_login(schema.name)
+    try:
+        return await Admin().login(schema, credentials)
+    except AdminPasswordError:
+        raise HTTPException(401, detail="Login Failed")
+    except HashingBusyError:
+        raise HTTPException(429, detail="Too many login attempts", headers={"Retry-After": "1"})
 
 @router.post("/create-apikey")
 async def generate_apikey(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
@@ -61,7 +65,7 @@ async def generate_apikey(admin_conn: Tuple[int, AsyncConnection] = Depends(get_
 async def get_apikey(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).get_apikey(admin_id)
+        return FastJSONResponse(await Admin(conn).get_apikey(admin_id))
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
 
@@ -99,7 +103,7 @@ async def add_host(
 async def report(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).report()
+        return FastJSONResponse(await Admin(conn).report())
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
 
@@ -107,38 +111,65 @@ async def report(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
 async def list_hosts(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).listing_host()
+        return FastJSONResponse(await Admin(conn).listing_host())
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
 
 
 @router.get("/enrich/{ip_address}")
-async def enrich(ip_address: str, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
-    admin_id, conn = admin_conn
+async def enrich(ip_address: str, admin_id: int = Depends(get_admin_id)):
     try:
-        return Admin(conn).enrich(ip_address)
+        return await Admin().enrich(ip_address)
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except EnrichTimeoutError:
+        raise HTTPException(504, detail="OpenCTI did not answer in time")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
+@router.post("/enrich-bulk")
+async def enrich_bulk(data: BulkEnrichSchema, admin_id: int = Depends(get_admin_id)):
+    """
+    Enrich many ips with OpenCTI and AbuseIPDB at once, one ndjson line per ip
+    is streamed back as soon as both providers answered for it
+    :param data:
+    :param admin_id:
+    :return:
+    """
+    if len(data.ips) > cfg.bulk_enrich.max_ips:
+        raise HTTPException(413, detail=f"At most {cfg.bulk_enrich.max_ips} ips per request")
+    try:
+        ips = [str(ipaddress.ip_address(ip.strip())) for ip in data.ips]
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    async def lines():
+        async for item in Admin().enrich_bulk(ips):
+            yield json.dumps(item, default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @router.get("/list-mal-ip")
-async def list_mal_ip(hostname: Optional[str] = None, is_blocked: Optional[bool] = None, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id), page: Optional[int] = 1, per_page: Optional[int] = 5):
+async def list_mal_ip(hostname: Optional[str] = None, is_blocked: Optional[bool] = None, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id), page: Optional[int] = 1, per_page: Optional[int] = 5, cursor: Optional[str] = None, total: Optional[TotalModeEnum] = None):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).list_mal_ip(hostname, is_blocked, page, per_page)
+        return FastJSONResponse(await Admin(conn).list_mal_ip(hostname, is_blocked, page, per_page, cursor, total))
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except InvalidCursorError:
+        raise HTTPException(400, detail="Invalid cursor")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
 @router.get("/list-ioc")
-async def list_ioc(ip:Optional[str] = None, page: Optional[int] = 1, per_page: Optional[int] = 5, hostname: Optional[str] = None, is_blocked: Optional[bool] = None, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
+async def list_ioc(ip:Optional[str] = None, page: Optional[int] = 1, per_page: Optional[int] = 5, hostname: Optional[str] = None, is_blocked: Optional[bool] = None, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id), cursor: Optional[str] = None, total: Optional[TotalModeEnum] = None):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).list_ioc(page, per_page, hostname, is_blocked, ip)
+        return FastJSONResponse(await Admin(conn).list_ioc(page, per_page, hostname, is_blocked, ip, cursor, total))
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except InvalidCursorError:
+        raise HTTPException(400, detail="Invalid cursor")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
@@ -149,16 +180,22 @@ async def block_ip(ip: str, hostname: str, admin_conn: Tuple[int, AsyncConnectio
         return await Admin(conn).block_ip(ip, hostname)
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except WhitelistedIpError as e:
+        raise HTTPException(403, detail=str(e))
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
 @router.patch("/me/update")
-async def update_me(data: UpdateAdminSchema, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
-    admin_id, conn = admin_conn
+async def update_me(data: UpdateAdminSchema, admin_id: int = Depends(get_admin_id)):
     try:
-        return await Admin(conn).update_me(admin_id, data)
+        # the new password is hashed before a connection is taken
+        values = await Admin().prepare_update(data)
+        async with engine.begin() as conn:
+            return await Admin(conn).update_me(admin_id, values)
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except HashingBusyError:
+        raise HTTPException(429, detail="Too many password changes", headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
@@ -166,34 +203,66 @@ async def update_me(data: UpdateAdminSchema, admin_conn: Tuple[int, AsyncConnect
 async def get_admin(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).get_admin(admin_id)
+        return FastJSONResponse(await Admin(conn).get_admin(admin_id))
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
 @router.get("/log-activity")
-async def log_activity(page: Optional[int] = 1, per_page: Optional[int] = 5, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
+async def log_activity(page: Optional[int] = 1, per_page: Optional[int] = 5, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id), cursor: Optional[str] = None, total: Optional[TotalModeEnum] = None):
     admin_id, conn = admin_conn
     try:
-        return await Admin(conn).list_log(page, per_page)
+        return FastJSONResponse(await Admin(conn).list_log(page, per_page, cursor, total))
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except InvalidCursorError:
+        raise HTTPException(400, detail="Invalid cursor")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
 
 @router.get("/check-reputation/{ip_address}")
-def check_reputation(ip_address: str, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
-    admin_id, conn = admin_conn
+async def check_reputation(ip_address: str, admin_id: int = Depends(get_admin_id)):
     try:
-        return Admin(conn).check_reputation(ip_address)
+        return await Admin().check_reputation(ip_address)
     except AdminIsNotLoginError:
         raise HTTPException(401, detail="Admin is not login")
+    except ReputationQuotaExceededError:
+        raise HTTPException(429, detail="AbuseIPDB quota exceeded")
     except Exception as e:
         raise HTTPException(500, detail=str(e))
 
 
+@router.post("/whitelist")
+async def add_whitelist(data: WhitelistSchema, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
+    """
+    Whitelist ips and cidrs, they can no longer be reported or blocked
+    :param data:
+    :param admin_conn:
+    :return:
+    """
+    admin_id, conn = admin_conn
+    try:
+        return await Admin(conn).add_whitelist(data.entries)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
 
+@router.get("/whitelist")
+async def list_whitelist(admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
+    admin_id, conn = admin_conn
+    return await Admin(conn).list_whitelist()
 
+@router.delete("/whitelist")
+async def delete_whitelist(entry: str, admin_conn: Tuple[int, AsyncConnection] = Depends(get_id)):
+    admin_id, conn = admin_conn
+    try:
+        if not await Admin(conn).delete_whitelist(entry):
+            raise HTTPException(404, detail="Entry is not whitelisted")
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    return True
 
+@router.get("/metrics")
+async def metrics(admin_id: int = Depends(get_admin_id)):
+    return Admin().metrics()
@@ -1,10 +1,17 @@
+import asyncio
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status, Request, Response
 
+from api.config import cfg
 from core.db import engine
+from exceptions import AdminIsNotLoginError, WhitelistedIpError
 from facades.admin import Admin
-
+from helpers.ingest import parse_batch
+from helpers.serialize import FastJSONResponse
+from helpers.export import negotiate, pick_encoding, etag_matches, JSON
+from schemas.admin import AggregateModeEnum, ExportFormatEnum
+from services.push import agent_hub, AgentChannel
 
 
 router = APIRouter(prefix='/general', tags=["General"])
@@ -25,26 +32,110 @@ async def add_ip(
     :return:
     """
     async with engine.begin() as conn:
+        try:
+            return await Admin(conn).add_ioc(ip, hostname, apikey, comment)
+        except WhitelistedIpError as e:
+            raise HTTPException(403, detail=str(e))
+
+
+@router.post("/add-ips")
+async def add_ips(
+    request: Request,
+    apikey: str,
+):
+    """
+    Add a batch of malicious IP in one request, the body is a JSON array or
+    NDJSON of ``{"ip": .., "hostname": .., "comment": ..}``
+    :param request:
+    :param apikey:
+    :return: result per item
+    """
+    try:
+        items = parse_batch(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(400, detail=f"Invalid batch: {e}")
+
+    if len(items) > cfg.ingest.max_batch:
+        raise HTTPException(413, detail=f"Batch is limited to {cfg.ingest.max_batch} items")
 
-        return await Admin(conn).add_ioc(ip, hostname, apikey, comment)
+    async with engine.begin() as conn:
+        try:
+            return FastJSONResponse(await Admin(conn).add_iocs(items, apikey))
+        except AdminIsNotLoginError:
+            raise HTTPException(401, detail="Admin is not login")
 
 
 @router.get("/list-ips")
 async def list_ips(
+    request: Request,
     hostname: str,
     apikey: str,
+    since: Optional[int] = None,
+    aggregate: Optional[AggregateModeEnum] = None,
+    coverage: Optional[float] = None,
+    format: Optional[ExportFormatEnum] = None,
 ):
     """
     List all malicious IP addresses
     :param hostname:
     :param is_blocked:
+    :param since: cursor of the previous poll, only changes after it are returned
+    :param aggregate: return cidrs instead of rows, ``exact`` or ``lossy``
+    :param coverage: percent of a prefix that must be listed in ``lossy`` mode
+    :param format: ``json``, ``ipset``, ``nft`` or ``binary``, negotiated from
+        the Accept header when omitted
     :param admin_conn:
-    :return:
+    :return: ``304`` without a body when ``If-None-Match`` holds the current ETag
     """
     is_blocked = False
+    fmt = negotiate(request.headers.get("accept"), format.value if format else None)
+    if aggregate is not None and since is not None:
+        raise HTTPException(400, detail="since and aggregate cannot be combined")
+    if fmt != JSON and since is not None:
+        raise HTTPException(400, detail="since is only supported with the json format")
+
+    accept_encoding = request.headers.get("accept-encoding")
+    variant = (
+        fmt,
+        pick_encoding(accept_encoding) if fmt != JSON else None,
+        is_blocked,
+        aggregate.value if aggregate else None,
+        coverage,
+        since,
+    )
+
     async with engine.begin() as conn:
+        # answered from the journal head alone, before any list query
+        etag = await Admin(conn).blocklist_etag(hostname, apikey, variant, aggregate == AggregateModeEnum.LOSSY)
+        headers = {"Vary": "Accept, Accept-Encoding"}
+        if etag:
+            headers["ETag"] = etag
+            if etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(status_code=304, headers=headers)
+
+        if fmt != JSON:
+            try:
+                exported = await Admin(conn).export_mal_ip(
+                    hostname, is_blocked, apikey, fmt, accept_encoding, aggregate, coverage
+                )
+            except ValueError as e:
+                raise HTTPException(400, detail=str(e))
+            headers["X-Blocklist-Cursor"] = str(exported.cursor)
+            if exported.encoding:
+                headers["Content-Encoding"] = exported.encoding
+            return Response(content=exported.body, media_type=exported.media_type, headers=headers)
 
-        return await Admin(conn).list_mal_ip_general(hostname, is_blocked, apikey)
+        if aggregate is not None:
+            try:
+                content = await Admin(conn).list_mal_ip_aggregated(hostname, is_blocked, apikey, aggregate, coverage)
+            except ValueError as e:
+                raise HTTPException(400, detail=str(e))
+        elif since is not None:
+            content = await Admin(conn).list_mal_ip_since(hostname, is_blocked, apikey, since)
+        else:
+            content = await Admin(conn).list_mal_ip_general(hostname, is_blocked, apikey)
+
+        return FastJSONResponse(content, headers=headers)
 
 @router.patch("/update-status")
 async def update_status(
@@ -63,3 +154,78 @@ async def update_status(
     async with engine.begin() as conn:
         return await Admin(conn).update_statis(ip, status, apikey)
 
+
+async def _push_changes(websocket: WebSocket, channel: AgentChannel):
+    """
+    Forward queued changes to the agent, a consumer slower than the send
+    timeout is disconnected instead of buffering for it
+    """
+    while True:
+        message = await channel.next()
+        await asyncio.wait_for(websocket.send_json(message), cfg.push.send_timeout)
+
+
+async def _wait_disconnect(websocket: WebSocket):
+    """
+    Consume frames from the agent until it goes away
+    """
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.websocket("/ws")
+async def agent_ws(
+    websocket: WebSocket,
+    hostname: str,
+    apikey: str,
+):
+    """
+    Push channel of blocklist changes for an agent.
+
+    The first message carries the current cursor, after that every change of
+    the host blocklist is sent as it is committed. A ``resync`` message means
+    changes were dropped and the agent must poll ``/list-ips?since=<cursor>``.
+    :param websocket:
+    :param hostname:
+    :param apikey:
+    :return:
+    """
+    # the database connection is only held for the handshake, not for the
+    # lifetime of the socket
+    async with engine.connect() as conn:
+        admin = Admin(conn)
+        if not await admin.check_cred(apikey, hostname):
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        # subscribe before reading the cursor, a change committed in between
+        # is then either counted in the cursor or pushed after the hello
+        channel = agent_hub.subscribe(hostname)
+        try:
+            channel.hello(await admin.blocklist_head(hostname))
+        except BaseException:
+            agent_hub.unsubscribe(channel)
+            raise
+
+    tasks = ()
+    try:
+        await websocket.accept()
+        sender = asyncio.create_task(_push_changes(websocket, channel))
+        receiver = asyncio.create_task(_wait_disconnect(websocket))
+        tasks = (sender, receiver)
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # retrieve both outcomes, the sender ends with the send timeout
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        agent_hub.unsubscribe(channel)
+
+    if isinstance(outcomes[1], asyncio.CancelledError):
+        # the agent is still there, sender gave up on a slow or broken agent
+        try:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except RuntimeError:
+            pass
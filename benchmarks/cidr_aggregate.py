@@ -0,0 +1,75 @@
+"""
+Blocklist aggregation benchmark.
+
+Generates an attack-like blocklist of ``--addresses`` IPv4 addresses packed
+in a few ranges plus scattered IPv6 addresses, collapses it exactly and in
+lossy mode, and checks the exact output against ``ipaddress.collapse_addresses``
+and that no lossy prefix covers a whitelisted address that is not listed.
+
+    python -m benchmarks.cidr_aggregate --addresses 100000 --coverage 90
+"""
+import argparse
+import ipaddress
+import random
+import sys
+import time
+
+from helpers.cidr import aggregate
+
+
+def blocklist(rng: random.Random, size: int, density: float) -> list:
+    addresses = set()
+    while len(addresses) < size:
+        base = rng.getrandbits(32) >> 12 << 12
+        for offset in range(1 << 12):
+            if rng.random() < density:
+                addresses.add(str(ipaddress.IPv4Address(base + offset)))
+    for _ in range(size // 20):
+        addresses.add(str(ipaddress.IPv6Address(rng.getrandbits(128))))
+    return list(addresses)
+
+
+def main(args) -> int:
+    rng = random.Random(args.seed)
+    addresses = blocklist(rng, args.addresses, args.density)
+    whitelist = [ipaddress.ip_network(rng.choice(addresses)).supernet(8) for _ in range(args.whitelist)]
+
+    started = time.perf_counter()
+    exact = aggregate(addresses)
+    print(f"exact    {len(addresses):,} addresses -> {len(exact):,} prefixes in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    lossy = aggregate(addresses, args.coverage / 100, whitelist)
+    print(f"lossy    {len(addresses):,} addresses -> {len(lossy):,} prefixes in {time.perf_counter() - started:.2f}s"
+          f"  ({args.coverage:g}% coverage)")
+
+    wrong = 0
+    parsed = [ipaddress.ip_address(address) for address in addresses]
+    expected = [
+        str(network)
+        for version in (4, 6)
+        for network in ipaddress.collapse_addresses(address for address in parsed if address.version == version)
+    ]
+    if exact != expected:
+        wrong += 1
+        print("exact output differs from ipaddress.collapse_addresses")
+
+    listed = set(parsed)
+    prefixes = [ipaddress.ip_network(prefix) for prefix in lossy]
+    for network in whitelist:
+        for address in (network.network_address, network.broadcast_address):
+            if address not in listed and any(address in prefix for prefix in prefixes):
+                wrong += 1
+                print(f"lossy prefix covers whitelisted {address}")
+    print(f"checked  exact output and {len(whitelist)} whitelist entries, {wrong} wrong")
+    return 1 if wrong else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--addresses', type=int, default=100000)
+    parser.add_argument('--density', type=float, default=0.9)
+    parser.add_argument('--coverage', type=float, default=90)
+    parser.add_argument('--whitelist', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=18)
+    sys.exit(main(parser.parse_args()))
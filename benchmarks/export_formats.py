@@ -0,0 +1,67 @@
+"""
+Blocklist export size benchmark.
+
+Renders a blocklist of ``--addresses`` addresses in the JSON shape of
+``/general/list-ips`` and in every export format, and prints the body size
+raw and compressed with the render time. Applying the text formats is one
+``ipset restore`` / ``nft -f`` call instead of one ``ipset add`` per address,
+which is not measured here since it needs root on a firewall host.
+
+    python -m benchmarks.export_formats --addresses 100000
+"""
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+
+from benchmarks.cidr_aggregate import blocklist
+from helpers.cidr import aggregate
+from helpers.export import parse_binary, render_binary, render_ipset, render_nft, zstandard
+
+
+def sizes(name: str, body: bytes, elapsed: float) -> None:
+    line = f"{name:8} {len(body):>12,} B  gzip {len(gzip.compress(body, 6)):>10,} B"
+    if zstandard is not None:
+        line += f"  zstd {len(zstandard.ZstdCompressor(level=3).compress(body)):>10,} B"
+    print(f"{line}  rendered in {elapsed * 1000:.0f} ms")
+
+
+def main(args) -> int:
+    addresses = blocklist(random.Random(args.seed), args.addresses, args.density)
+
+    started = time.perf_counter()
+    body = json.dumps([
+        {"id": i, "ip_address": address, "hostname": "agent-01", "executed_time": None}
+        for i, address in enumerate(addresses)
+    ]).encode()
+    sizes('json', body, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    prefixes = aggregate(addresses)
+    print(f"collapse {len(addresses):,} addresses -> {len(prefixes):,} cidrs in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+
+    started = time.perf_counter()
+    sizes('ipset', render_ipset(prefixes, 'blocklist'), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    sizes('nft', render_nft(prefixes, 'centralized_firewall', 'blocklist'), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    body = render_binary(addresses)
+    sizes('binary', body, time.perf_counter() - started)
+
+    if set(parse_binary(body)) != set(addresses):
+        print("binary round trip differs from the blocklist")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--addresses', type=int, default=100000)
+    parser.add_argument('--density', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=19)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""
+Per-request overhead of the agent hot paths.
+
+Replays the database work of ``/general/list-ips`` (journal head, then the
+host blocklist) and ``/general/add-ip`` (ioc upsert, then the dashboard
+counter) ``--requests`` times on one connection, first with the statements
+built per call and run through ``conn.execute`` as the services used to, then
+through ``hot_statements``. Prints wall and CPU time per request, the CPU time
+is the Python overhead since the database runs in its own process. Everything
+runs in one transaction that is rolled back.
+
+    python -m benchmarks.hot_statements --requests 5000 --rows 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import select, func, update
+
+from core.db import engine
+from core.statements import hot_statements
+from models.block_journal import BlockJournalModel
+from models.blocked import BlockedModel
+from models.dashboard_stats import DashboardStatsModel
+from services.enrich import ioc_upsert_query
+from services.stats import STATS_ID
+
+HOSTNAME = 'bench-host'
+
+
+async def legacy_list_ips(conn) -> int:
+    head = (await conn.execute(select(
+        func.max(BlockJournalModel.c.seq)
+    ).select_from(
+        BlockJournalModel
+    ).where(
+        BlockJournalModel.c.hostname == HOSTNAME
+    ))).scalar() or 0
+    query = select(
+        BlockedModel.c.id,
+        BlockedModel.c.mal_ip,
+        BlockedModel.c.hostname,
+        BlockedModel.c.executed_time
+    ).select_from(
+        BlockedModel
+    ).where(
+        BlockedModel.c.hostname == HOSTNAME
+    ).where(
+        BlockedModel.c.is_blocked == False
+    )
+    rows = (await conn.execute(query)).fetchall()
+    return head + len(rows)
+
+
+async def hot_list_ips(conn) -> int:
+    head = await hot_statements.scalar(conn, 'journal_head', hostname=HOSTNAME) or 0
+    rows = await hot_statements.fetch(conn, 'blocked_by_host_status', hostname=HOSTNAME, is_blocked=False)
+    return head + len(rows)
+
+
+async def legacy_add_ip(conn, ip: str) -> None:
+    await conn.execute(ioc_upsert_query([
+        {"ip_address": ip, "hostname": HOSTNAME, "comment": None, "counter": 1}
+    ]))
+    await conn.execute(
+        update(DashboardStatsModel).where(DashboardStatsModel.c.id == STATS_ID).values(
+            active_alerts=DashboardStatsModel.c.active_alerts + 1
+        )
+    )
+
+
+async def hot_add_ip(conn, ip: str) -> None:
+    await hot_statements.first(
+        conn, 'ioc_upsert', ip_address=ip, hostname=HOSTNAME, comment=None, counter=1
+    )
+    await hot_statements.execute(
+        conn, 'stats_add', shard=STATS_ID, connected_agents=0, blocked_ips=0, active_alerts=1
+    )
+
+
+async def measure(name: str, request, requests: int) -> None:
+    # warm up the compiled and prepared statement caches
+    for i in range(min(requests, 100)):
+        await request(i)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    for i in range(requests):
+        await request(i)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(f"{name:18} wall {wall / requests * 1e6:8.1f} us/request  cpu {cpu / requests * 1e6:8.1f} us/request")
+
+
+async def main(args) -> int:
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(BlockedModel.insert(), [
+                {"mal_ip": f"198.18.{i // 256 % 256}.{i % 256}", "hostname": HOSTNAME, "is_blocked": False}
+                for i in range(args.rows)
+            ])
+            await conn.execute(BlockJournalModel.insert().values(
+                op='insert', mal_ip='198.18.0.0', hostname=HOSTNAME, is_blocked=False
+            ))
+
+            def ip(i: int) -> str:
+                return f"198.19.{i // 256 % 256}.{i % 256}"
+
+            await measure('list-ips legacy', lambda i: legacy_list_ips(conn), args.requests)
+            await measure('list-ips hot', lambda i: hot_list_ips(conn), args.requests)
+            await measure('add-ip legacy', lambda i: legacy_add_ip(conn, ip(i)), args.requests)
+            await measure('add-ip hot', lambda i: hot_add_ip(conn, ip(i)), args.requests)
+            print(f"registry {hot_statements.stats()}")
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--rows', type=int, default=50, help='blocklist rows of the host')
+    sys.exit(asyncio.run(main(parser.parse_args())))
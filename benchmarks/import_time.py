@@ -0,0 +1,67 @@
+"""
+Startup-time regression check.
+
+Imports ``api.app`` in a fresh interpreter with ``python -X importtime`` and
+fails when the cumulative import time goes over the budget, or when a module
+that must stay lazy (pycti, requests) is imported at startup.
+
+    python -m benchmarks.import_time --budget-ms 1500
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+LAZY_MODULES = ('pycti', 'requests')
+
+
+def import_times(module: str) -> dict:
+    """
+    Cumulative import time in microseconds of every module imported by ``module``
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"cannot import {module}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(args) -> int:
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    # the best run is the least disturbed by a cold disk cache
+    total = min(run[args.module] for run in runs) / 1000
+    times = runs[-1]
+
+    print(f"{args.module}: {total:.0f} ms (budget {args.budget_ms} ms)")
+    for name, cumulative in sorted(times.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    for name in LAZY_MODULES:
+        if name in times:
+            print(f"FAIL: {name} is imported at startup")
+            failed = True
+    if total > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='api.app')
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15)
+    sys.exit(main(parser.parse_args()))
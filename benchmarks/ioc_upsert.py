@@ -0,0 +1,102 @@
+"""
+Concurrency benchmark of ioc ingestion.
+
+The same burst of sightings goes through the previous read-then-write code and
+through ``ioc_upsert_query``, each on a scratch copy of ``iocs`` in the
+``bench`` schema, with one transaction per sighting like ``/general/add-ip``.
+The upsert run fails when a single increment is lost.
+
+    python -m benchmarks.ioc_upsert --workers 64 --sightings 20000 --keys 50
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from sqlalchemy import MetaData, Table, select, func, text
+
+from core.db import engine
+from models.ioc import IocModel
+from services.enrich import ioc_upsert_query
+
+HOSTNAME = 'bench-host'
+
+
+async def legacy_sighting(table: Table, ip: str) -> None:
+    """
+    ``add_iochost`` before the upsert: read the counter, then insert or update
+    """
+    async with engine.begin() as conn:
+        query = select(table.c.counter).where(table.c.ip_address == ip, table.c.hostname == HOSTNAME)
+        counter = (await conn.execute(query)).scalar()
+        if counter is None:
+            await conn.execute(table.insert().values(
+                ip_address=ip, hostname=HOSTNAME, is_process=False, counter=1
+            ))
+        else:
+            await conn.execute(table.update().where(table.c.ip_address == ip).values(counter=counter + 1))
+
+
+async def upsert_sighting(table: Table, ip: str) -> None:
+    """
+    ``add_iochost`` with the single statement upsert
+    """
+    async with engine.begin() as conn:
+        await conn.execute(ioc_upsert_query([
+            {"ip_address": ip, "hostname": HOSTNAME, "comment": None, "counter": 1}
+        ], table))
+
+
+async def run(name: str, sighting, table: Table, ips: list, workers: int) -> bool:
+    queue = list(ips)
+
+    async def worker():
+        while queue:
+            await sighting(table, queue.pop())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    async with engine.connect() as conn:
+        counted = (await conn.execute(select(func.coalesce(func.sum(table.c.counter), 0)))).scalar()
+        rows = (await conn.execute(select(func.count()).select_from(table))).scalar()
+
+    lost = len(ips) - counted
+    print(f"{name:8} {len(ips) / elapsed:10.0f} sightings/s  rows={rows:<6} counted={counted:<8} lost={lost}")
+    return lost == 0
+
+
+async def main(args) -> int:
+    meta = MetaData(schema='bench')
+    legacy_table = Table('iocs_legacy', meta, *[column._copy() for column in IocModel.columns])
+    upsert_table = IocModel.to_metadata(meta, name='iocs_upsert')
+
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE SCHEMA IF NOT EXISTS bench"))
+        await conn.run_sync(meta.drop_all)
+        await conn.run_sync(meta.create_all)
+
+    rng = random.Random(args.seed)
+    keys = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(args.keys)]
+    ips = [rng.choice(keys) for _ in range(args.sightings)]
+
+    try:
+        await run("legacy", legacy_sighting, legacy_table, ips, args.workers)
+        exact = await run("upsert", upsert_sighting, upsert_table, ips, args.workers)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(meta.drop_all)
+        await engine.dispose()
+
+    return 0 if exact else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--sightings', type=int, default=20000)
+    parser.add_argument('--keys', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=247)
+    sys.exit(asyncio.run(main(parser.parse_args())))
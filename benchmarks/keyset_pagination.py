@@ -0,0 +1,89 @@
+"""
+Deep page latency of offset and cursor pagination.
+
+A scratch copy of ``activity_log`` in the ``bench`` schema is grown step by
+step, at each size the page at ``--depth`` (fraction of the table) is read
+with ``page``/``per_page`` and with the cursor of the row just before it.
+Offset latency grows with the table, cursor latency must stay flat: the run
+fails when the cursor page on the largest table is more than ``--max-ratio``
+times slower than on the smallest one.
+
+    python -m benchmarks.keyset_pagination --sizes 10000,100000,1000000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import MetaData, select, text
+
+from core.db import engine
+from helpers.pagination import encode_cursor, paginate
+from models.log import LogsModel
+
+
+async def timed(conn, query, repeat: int) -> float:
+    """
+    Median latency of a query in milliseconds
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        (await conn.execute(query)).fetchall()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main(args) -> int:
+    meta = MetaData(schema='bench')
+    table = LogsModel.to_metadata(meta)
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE SCHEMA IF NOT EXISTS bench"))
+        await conn.run_sync(meta.drop_all)
+        await conn.run_sync(meta.create_all)
+
+    base = select(table.c.id, table.c.activity)
+    cursor_latency = []
+    filled = 0
+    try:
+        print(f"{'rows':>10} {'page':>8} {'offset ms':>10} {'cursor ms':>10}")
+        for size in sizes:
+            async with engine.begin() as conn:
+                await conn.execute(text(
+                    f"INSERT INTO bench.{table.name} (activity) "
+                    f"SELECT 'bench activity ' || n FROM generate_series(1, :rows) AS n"
+                ), {"rows": size - filled})
+                await conn.execute(text(f"ANALYZE bench.{table.name}"))
+            filled = size
+
+            page = max(1, int(size * args.depth) // args.per_page)
+            # ids are 1..size, newest first: the page starts right below this id
+            last_seen = size - (page - 1) * args.per_page + 1
+            async with engine.connect() as conn:
+                offset_ms = await timed(conn, paginate(base, table.c.id, page, args.per_page), args.repeat)
+                cursor_ms = await timed(
+                    conn, paginate(base, table.c.id, None, args.per_page, encode_cursor(last_seen)), args.repeat
+                )
+            cursor_latency.append(cursor_ms)
+            print(f"{size:>10} {page:>8} {offset_ms:>10.2f} {cursor_ms:>10.2f}")
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(meta.drop_all)
+        await engine.dispose()
+
+    ratio = cursor_latency[-1] / max(cursor_latency[0], 0.01)
+    print(f"cursor latency ratio largest/smallest: {ratio:.2f}")
+    return 0 if ratio <= args.max_ratio else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--depth', type=float, default=0.9)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-ratio', type=float, default=3.0)
+    sys.exit(asyncio.run(main(parser.parse_args())))
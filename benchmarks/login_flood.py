@@ -0,0 +1,79 @@
+"""
+Login flood benchmark.
+
+Measures how late a stand-in for agent polls gets scheduled on the event loop
+(a coroutine waking up every ``--interval`` ms, as an agent request waits on
+its database reads) while ``--logins`` bcrypt verifications arrive at once,
+first run inline on the loop as ``/admin/login`` used to, then through
+``HashingPool``. Prints the p50 / p99 / max lateness and the logins served and
+rejected.
+
+    python -m benchmarks.login_flood --logins 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from exceptions import HashingBusyError
+from helpers.authentication import BasicSalt, PasswordHasher
+from services.passwords import HashingPool
+
+
+async def probe(stop: asyncio.Event, interval: float, lags: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def percentile(values: list, share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000
+
+
+async def flood(name: str, login, logins: int, interval: float) -> None:
+    stop = asyncio.Event()
+    lags = []
+    prober = asyncio.create_task(probe(stop, interval, lags))
+    await asyncio.sleep(interval * 5)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(interval * 5)
+    stop.set()
+    await prober
+
+    rejected = sum(isinstance(result, HashingBusyError) for result in results)
+    print(f"{name:8} poll lag p50 {statistics.median(lags) * 1000:7.1f} ms  p99 {percentile(lags, 0.99):7.1f} ms  "
+          f"max {max(lags) * 1000:7.1f} ms  served {logins - rejected}  rejected {rejected}  in {elapsed:.2f}s")
+
+
+async def main(args) -> int:
+    hasher = PasswordHasher(BasicSalt('benchmark'))
+    hashed = hasher.hash('secret')
+    interval = args.interval / 1000
+
+    async def inline():
+        return hasher.verify('secret', hashed)
+
+    pool = HashingPool(hasher=hasher, workers=args.workers, max_pending=args.max_pending)
+
+    async def pooled():
+        return await pool.verify('secret', hashed)
+
+    await flood('inline', inline, args.logins, interval)
+    await flood('pool', pooled, args.logins, interval)
+    pool.close()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=5, help='ms between polls')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=8)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,91 @@
+"""
+Connection pool drain benchmark.
+
+Runs ``--agents`` agents polling with one short query per poll while
+``--enrich`` admins wait ``--upstream`` ms on a slow OpenCTI, first with the
+upstream call inside the request transaction as ``get_id`` used to hold it,
+then with the transaction covering only the database work. Prints the poll
+latency and the pool counters of ``/admin/metrics`` for both runs, size the
+pool with ``DB_POOL_SIZE`` and ``DB_POOL_MAX_OVERFLOW`` before running.
+
+    python -m benchmarks.pool_drain --agents 200 --enrich 20 --upstream 2000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import exc, text
+
+from core.db import engine, pool_metrics
+from core.pool import pool_stats
+
+
+async def poll(latencies: list, errors: list) -> None:
+    started = time.perf_counter()
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT 1"))
+    except exc.TimeoutError:
+        errors.append(1)
+        return
+    latencies.append(time.perf_counter() - started)
+
+
+async def agent(stop: asyncio.Event, interval: float, latencies: list, errors: list) -> None:
+    while not stop.is_set():
+        await poll(latencies, errors)
+        await asyncio.sleep(interval)
+
+
+async def enrich(upstream: float, held: bool, errors: list) -> None:
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SELECT 1"))
+            if held:
+                await asyncio.sleep(upstream)
+    except exc.TimeoutError:
+        errors.append(1)
+        return
+    if not held:
+        await asyncio.sleep(upstream)
+
+
+async def run(name: str, args, held: bool) -> None:
+    pool_stats.waiting = pool_stats.checkouts = pool_stats.timeouts = 0
+    pool_stats.wait_total = pool_stats.wait_max = 0.0
+    stop = asyncio.Event()
+    latencies, errors, enrich_errors = [], [], []
+    agents = [
+        asyncio.create_task(agent(stop, args.interval / 1000, latencies, errors)) for _ in range(args.agents)
+    ]
+    admins = [asyncio.create_task(enrich(args.upstream / 1000, held, enrich_errors)) for _ in range(args.enrich)]
+    await asyncio.sleep(args.duration)
+    peak = pool_metrics()
+    stop.set()
+    await asyncio.gather(*agents, *admins)
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    median = statistics.median(latencies) if latencies else 0.0
+    print(f"{name:7} polls {len(latencies):6}  failed {len(errors):5}  p50 {median * 1000:8.1f} ms  "
+          f"p99 {p99 * 1000:8.1f} ms  enrich failed {len(enrich_errors)}")
+    print(f"        pool {pool_metrics()} waiting at {args.duration}s {peak['waiting']}")
+
+
+async def main(args) -> int:
+    await run('held', args, held=True)
+    await run('scoped', args, held=False)
+    await engine.dispose()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=200)
+    parser.add_argument('--enrich', type=int, default=20)
+    parser.add_argument('--upstream', type=float, default=2000, help='ms OpenCTI takes to answer')
+    parser.add_argument('--interval', type=float, default=100, help='ms between polls of an agent')
+    parser.add_argument('--duration', type=float, default=3, help='seconds per run')
+    sys.exit(asyncio.run(main(parser.parse_args())))
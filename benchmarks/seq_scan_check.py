@@ -0,0 +1,219 @@
+"""
+Plan check of the hot queries.
+
+Builds the schema with the migrations in a scratch ``bench`` schema, seeds
+it with ``--rows`` rows per large table, then runs the listing, agent and
+enrichment code paths while recording every statement they send, and
+``EXPLAIN``s each of them, together with every statement of
+``hot_statements``, which run on the driver connection and are not seen by
+the recorder. The check fails when a plan reads one of the
+large tables with a sequential scan, i.e. when a query shape lost its index.
+
+    python -m benchmarks.seq_scan_check --rows 200000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.sql.elements import TextClause
+
+from api.config import cfg
+from core.statements import hot_statements
+from helpers.pagination import encode_cursor
+from migrations.runner import migrate
+from services.admin import AdminRead
+from services.enrich import EnrichService
+from services.enrichment import EnrichmentWorker
+from services.journal import BlockJournal
+
+SCHEMA = 'bench'
+HOSTS = 200
+APIKEY = 'bench-apikey'
+LARGE_TABLES = ('iocs', 'block', 'activity_log', 'block_journal', 'ioc_enrichment')
+
+SEED = [
+    "INSERT INTO admin (name, password, uuid, api_key) "
+    "VALUES ('bench', 'x', gen_random_uuid(), :apikey)",
+    "INSERT INTO iocs (ip_address, hostname, is_process, counter) "
+    "SELECT '10.' || (n >> 16 & 255) || '.' || (n >> 8 & 255) || '.' || (n & 255), "
+    "'host-' || n % :hosts, n % 10 = 0, 1 FROM generate_series(1, :rows) AS n",
+    "INSERT INTO block (mal_ip, hostname, is_blocked, executed_time) "
+    "SELECT '10.' || (n >> 16 & 255) || '.' || (n >> 8 & 255) || '.' || (n & 255), "
+    "'host-' || n % :hosts, n % 10 = 0, n FROM generate_series(1, :rows) AS n",
+    "INSERT INTO activity_log (activity) SELECT 'bench activity ' || n FROM generate_series(1, :rows) AS n",
+    "INSERT INTO block_journal (mal_ip, hostname, op, is_blocked) "
+    "SELECT '10.0.' || (n >> 8 & 255) || '.' || (n & 255), 'host-' || n % :hosts, 'insert', false "
+    "FROM generate_series(1, :rows) AS n",
+    "INSERT INTO ioc_enrichment (ip_address, sightings, refreshed_at) "
+    "SELECT DISTINCT ip_address, 1, now() - (id % 1000) * interval '1 hour' FROM iocs",
+]
+
+
+# values of the hot statement binds, shaped like the agent requests
+HOT_PARAMS = {
+    "apikey": APIKEY,
+    "uuid": uuid.uuid4(),
+    "hostname": 'host-7',
+    "since": 0,
+    "is_blocked": False,
+    "ip_address": '10.0.1.2',
+    "comment": None,
+    "counter": 1,
+    "shard": 0,
+    "connected_agents": 0,
+    "blocked_ips": 0,
+    "active_alerts": 1,
+}
+
+
+class Recorder:
+    """
+    Connection that keeps every statement it executes
+    """
+    def __init__(self, conn, statements: list):
+        self._conn = conn
+        self._statements = statements
+
+    async def execute(self, statement, *args, **kwargs):
+        if not isinstance(statement, TextClause):
+            self._statements.append(statement)
+        return await self._conn.execute(statement, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class RecordingEngine:
+    """
+    Engine whose transactions are all the same recorded connection
+    """
+    def __init__(self, recorder: Recorder):
+        self._recorder = recorder
+
+    @contextlib.asynccontextmanager
+    async def begin(self):
+        yield self._recorder
+
+
+async def hot_paths(conn: Recorder, rows: int) -> None:
+    """
+    Code paths of the admin listings, agent polls and enrichment worker
+    """
+    enrich = EnrichService()
+    middle = encode_cursor(rows // 2)
+    await enrich.list_iochost(1, 50, conn=conn)
+    await enrich.list_iochost(1, 50, hostname='host-7', conn=conn)
+    await enrich.list_iochost(1, 50, is_process=False, conn=conn)
+    await enrich.list_iochost(1, 50, ip='10.0.1.2', conn=conn)
+    await enrich.list_iochost(1, 50, hostname='host-7', conn=conn, cursor=middle)
+    await enrich.list_mal_ip(None, None, conn, 1, 50)
+    await enrich.list_mal_ip('host-7', None, conn, 1, 50)
+    await enrich.list_mal_ip(None, True, conn, 1, 50, cursor=middle)
+    await AdminRead(conn).list_log(1, 50)
+    await AdminRead(conn).list_log(1, 50, cursor=middle)
+
+    await enrich.list_mal_ip_general(APIKEY, 'host-7', None, conn)
+    head = await BlockJournal(conn).head('host-7')
+    await enrich.list_mal_ip_since(APIKEY, 'host-7', head - 50, None, conn)
+
+    worker = EnrichmentWorker(
+        engine=RecordingEngine(conn), enricher=None, batch_size=50, scan_interval=60, lease=600,
+        max_age=24 * 3600, hot_max_age=3600, hot_sightings=100,
+    )
+    await worker.claim()
+
+
+def seq_scans(plan: dict) -> list:
+    """
+    Large tables read with a sequential scan somewhere in a plan
+    """
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in LARGE_TABLES:
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', ()):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def explain(conn, statement) -> dict:
+    """
+    Plan of a statement, through asyncpg so binds keep the casts of the dialect
+    """
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = [compiled.params[name] for name in compiled.positiontup]
+    return await explain_sql(conn, str(compiled), params)
+
+
+async def explain_sql(conn, sql: str, params: list) -> dict:
+    """
+    Plan of a compiled statement and its positional arguments
+    """
+    driver = (await conn.get_raw_connection()).driver_connection
+    plan = await driver.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *params)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def report(plan: dict, sql: str) -> bool:
+    """
+    Print the verdict of one plan
+    :return: the plan reads a large table with a sequential scan
+    """
+    scans = seq_scans(plan)
+    sql = " ".join(sql.split())
+    status = f"SEQ SCAN {','.join(scans)}" if scans else 'ok'
+    print(f"{status:28} {plan['Node Type']:18} {sql[:110]}")
+    return bool(scans)
+
+
+async def main(args) -> int:
+    url = make_url(cfg.db)
+    engine = create_async_engine(url, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    failed = 0
+    try:
+        await migrate(engine)
+        async with engine.begin() as conn:
+            for statement in SEED:
+                await conn.execute(text(statement), {"rows": args.rows, "hosts": HOSTS, "apikey": APIKEY})
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE"))
+
+        statements = []
+        async with engine.connect() as conn:
+            async with conn.begin():
+                await hot_paths(Recorder(conn, statements), args.rows)
+                for statement in statements:
+                    plan = await explain(conn, statement)
+                    failed += report(plan, str(statement.compile(dialect=postgresql.dialect())))
+                for hot in hot_statements.statements.values():
+                    # the exact sql and arguments the registry prepares
+                    plan = await explain_sql(conn, hot.sql, hot.args(HOT_PARAMS))
+                    failed += report(plan, f"[{hot.name}] {hot.sql}")
+                await conn.rollback()
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+    print(f"{len(statements) + len(hot_statements.statements)} statements, {failed} with a sequential scan on a large table")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    sys.exit(asyncio.run(main(parser.parse_args())))
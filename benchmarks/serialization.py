@@ -0,0 +1,109 @@
+"""
+Response serialization benchmark.
+
+Builds ``--rows`` ioc listing rows the way ``/admin/list-ioc`` used to return
+them (``slots=False`` classes, pagination repeated in every row, encoded by
+``jsonable_encoder`` and ``JSONResponse``) and the way it does now (slotted
+classes, pagination in the envelope, ``FastJSONResponse``), then prints the
+memory held by the rows, the encode time and peak and the body size.
+
+    python -m benchmarks.serialization --rows 100000
+"""
+import argparse
+import datetime
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+import attrs
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from helpers.serialize import FastJSONResponse, orjson
+from schemas.admin import GeneralPaginationResponseSchema, ListingIocResponseSchema, ListingIocResponseSchemaPaginate
+
+
+@attrs.define(slots=False)
+class LegacyPagination:
+    total: Optional[int] = attrs.field()
+    page: int = attrs.field()
+    per_page: int = attrs.field()
+    next_cursor: Optional[str] = attrs.field(default=None)
+    total_kind: str = attrs.field(default='exact')
+
+
+@attrs.define(slots=False)
+class LegacyIoc:
+    id: int = attrs.field()
+    ip_address: str = attrs.field()
+    hostname: str = attrs.field()
+    is_process: bool = attrs.field()
+    comment: str = attrs.field()
+    counter: int = attrs.field()
+    pagination: LegacyPagination = attrs.field()
+    labels: Optional[list] = attrs.field(default=None)
+    abuse_score: Optional[int] = attrs.field(default=None)
+    enriched_at: Optional[datetime.datetime] = attrs.field(default=None)
+
+
+def row_values(rows: int):
+    enriched_at = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    for i in range(rows):
+        yield dict(
+            id=i,
+            ip_address=f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            hostname="agent-01",
+            is_process=bool(i & 1),
+            comment="scanner",
+            counter=i % 50,
+            labels=["malicious", "scanner"],
+            abuse_score=i % 100,
+            enriched_at=enriched_at,
+        )
+
+
+def legacy(rows: int):
+    return [
+        LegacyIoc(pagination=LegacyPagination(total=rows, page=1, per_page=rows), **values)
+        for values in row_values(rows)
+    ]
+
+
+def current(rows: int):
+    return ListingIocResponseSchemaPaginate(
+        pagination=GeneralPaginationResponseSchema(total=rows, page=1, per_page=rows),
+        data=[ListingIocResponseSchema(**values) for values in row_values(rows)],
+    )
+
+
+def measure(name: str, build, encode, rows: int) -> None:
+    content = build(rows)
+    started = time.perf_counter()
+    body = encode(content)
+    elapsed = time.perf_counter() - started
+    del content
+
+    # memory is traced in a second run, tracing slows allocations down
+    tracemalloc.start()
+    content = build(rows)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    encode(content)
+    peak = tracemalloc.get_traced_memory()[1] - held
+    tracemalloc.stop()
+    print(f"{name:8} rows {held / 2 ** 20:7.1f} MiB  encode {elapsed:6.2f}s  peak +{peak / 2 ** 20:7.1f} MiB  "
+          f"body {len(body) / 2 ** 20:6.1f} MiB")
+
+
+def main(args) -> int:
+    print(f"{args.rows:,} rows, encoder: {'orjson' if orjson is not None else 'json'}")
+    measure('legacy', legacy, lambda content: JSONResponse(jsonable_encoder(content)).body, args.rows)
+    measure('current', current, lambda content: FastJSONResponse(content).body, args.rows)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    sys.exit(main(parser.parse_args()))
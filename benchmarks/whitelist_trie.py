@@ -0,0 +1,101 @@
+"""
+Whitelist lookup benchmark.
+
+Builds a ``PrefixTrie`` of ``--prefixes`` random IPv4 and IPv6 networks, then
+measures build time and memory, lookup rate on random and on whitelisted addresses,
+in-place add and remove time, and compares lookups with a linear scan of the
+networks. Every trie answer is checked against the linear scan on a sample.
+
+    python -m benchmarks.whitelist_trie --prefixes 100000
+"""
+import argparse
+import ipaddress
+import random
+import sys
+import time
+import tracemalloc
+
+from helpers.prefix_trie import PrefixTrie
+
+
+IPV4_LENGTHS = (16, 20, 22, 24, 24, 26, 28, 29, 30, 32, 32, 32)
+IPV6_LENGTHS = (32, 48, 56, 64, 64, 128)
+
+
+def random_network(rng: random.Random) -> ipaddress._BaseNetwork:
+    if rng.random() < 0.8:
+        length = rng.choice(IPV4_LENGTHS)
+        return ipaddress.IPv4Network((rng.getrandbits(32) >> (32 - length) << (32 - length), length))
+    length = rng.choice(IPV6_LENGTHS)
+    return ipaddress.IPv6Network((rng.getrandbits(128) >> (128 - length) << (128 - length), length))
+
+
+def random_address(rng: random.Random, networks: list) -> ipaddress._BaseAddress:
+    if rng.random() < 0.5:
+        network = rng.choice(networks)
+        return network.network_address + rng.randrange(min(network.num_addresses, 1 << 16))
+    return ipaddress.IPv4Address(rng.getrandbits(32))
+
+
+def rate(count: int, elapsed: float) -> str:
+    return f"{count / elapsed:12,.0f}/s  ({elapsed / count * 1e6:.2f} us each)"
+
+
+def main(args) -> int:
+    rng = random.Random(args.seed)
+    networks = set()
+    while len(networks) < args.prefixes:
+        networks.add(random_network(rng))
+    networks = list(networks)
+    addresses = [random_address(rng, networks) for _ in range(args.lookups)]
+
+    tracemalloc.start()
+    trie = PrefixTrie()
+    started = time.perf_counter()
+    for network in networks:
+        trie.add(network)
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"build    {len(trie):,} prefixes in {elapsed:.2f}s, {size / 2 ** 20:.1f} MiB")
+
+    started = time.perf_counter()
+    hits = sum(trie.match(address) is not None for address in addresses)
+    print(f"lookup   {rate(len(addresses), time.perf_counter() - started)}  hits={hits:,}")
+
+    strings = [str(address) for address in addresses]
+    started = time.perf_counter()
+    for address in strings:
+        trie.match(address)
+    print(f"lookup   {rate(len(strings), time.perf_counter() - started)}  from strings")
+
+    churn = networks[:args.churn]
+    started = time.perf_counter()
+    for network in churn:
+        trie.remove(network)
+    for network in churn:
+        trie.add(network)
+    print(f"update   {rate(2 * len(churn), time.perf_counter() - started)}  remove + add")
+
+    sample = addresses[:args.linear]
+    started = time.perf_counter()
+    expected = [[network for network in networks if address in network] for address in sample]
+    print(f"linear   {rate(len(sample), time.perf_counter() - started)}")
+
+    wrong = 0
+    for address, matches in zip(sample, expected):
+        found = trie.match(address)
+        if (found is None) != (not matches) or (found is not None and found not in matches):
+            wrong += 1
+    print(f"checked  {len(sample)} lookups against the linear scan, {wrong} wrong")
+    return 1 if wrong else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prefixes', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--churn', type=int, default=10000)
+    parser.add_argument('--linear', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=17)
+    sys.exit(main(parser.parse_args()))
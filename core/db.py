@@ -1,6 +1,90 @@
-from sqlalchemy import MetaData
-from sqlalchemy.ext.asyncio import create_async_engine
+from typing import Callable
+
+from sqlalchemy import MetaData, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection
 from api.config import cfg
+from core.pool import InstrumentedPool, pool_stats
+
+
+def _connect_args(url: str) -> dict:
+    """
+    Statement caches of asyncpg, set ``DB_POOL_STATEMENT_CACHE_SIZE=0`` behind
+    a transaction pooling pgbouncer
+    """
+    if make_url(url).get_driver_name() != 'asyncpg':
+        return {}
+    return {
+        "statement_cache_size": cfg.db_pool.statement_cache_size,
+        "prepared_statement_cache_size": cfg.db_pool.statement_cache_size,
+    }
+
 
 meta = MetaData()
-engine = create_async_engine(cfg.db, pool_pre_ping=True)
\ No newline at end of file
+engine = create_async_engine(
+    cfg.db,
+    pool_pre_ping=True,
+    poolclass=InstrumentedPool,
+    pool_size=cfg.db_pool.size,
+    max_overflow=cfg.db_pool.max_overflow,
+    pool_timeout=cfg.db_pool.timeout,
+    pool_recycle=cfg.db_pool.recycle,
+    connect_args=_connect_args(cfg.db),
+)
+
+
+def pool_metrics() -> dict:
+    """
+    Connections in use and checkout waits of the engine pool
+    :return:
+    """
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        **pool_stats.stats(),
+    }
+
+
+def after_commit(conn: AsyncConnection, callback: Callable[[], None]) -> None:
+    """
+    Run a callback once the current transaction of ``conn`` is committed by
+    the database, it is forgotten when the transaction rolls back or the
+    commit fails
+    :param conn:
+    :param callback: plain function, it runs inside the commit call
+    :return:
+    """
+    conn.sync_connection.info.setdefault('after_commit', []).append(callback)
+
+
+def _commit_then_run_callbacks(dialect) -> None:
+    # the "commit" event fires before the DBAPI commit, callbacks must wait
+    # for the commit itself to succeed
+    do_commit = dialect.do_commit
+
+    def commit(dbapi_connection) -> None:
+        try:
+            do_commit(dbapi_connection)
+        except BaseException:
+            dbapi_connection.info.pop('after_commit', None)
+            raise
+        for callback in dbapi_connection.info.pop('after_commit', ()):
+            callback()
+
+    dialect.do_commit = commit
+    dialect.after_commit_installed = True
+
+
+@event.listens_for(Engine, "engine_connect")
+def _install_after_commit(conn) -> None:
+    if not getattr(conn.dialect, 'after_commit_installed', False):
+        _commit_then_run_callbacks(conn.dialect)
+
+
+@event.listens_for(Engine, "rollback")
+def _forget_after_commit(conn) -> None:
+    # an invalidated connection has no info left to read
+    if not conn.invalidated:
+        conn.info.pop('after_commit', None)
@@ -0,0 +1,60 @@
+import time
+
+import attrs
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@attrs.define
+class PoolStats:
+    """
+    Checkout counters of the connection pool.
+
+    A checkout waits when every pooled and overflow connection is in use,
+    ``waiting`` is the number of requests blocked right now and the wait
+    counters show how long getting a connection took.
+    """
+    waiting: int = 0
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    def stats(self) -> dict:
+        """
+        Counters of the pool
+        :return:
+        """
+        return {
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool of the asyncio engine recording checkout waits in
+    ``pool_stats``, the pool is rebuilt on ``dispose`` so the counters live
+    outside of it
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        pool_stats.waiting += 1
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.waiting -= 1
+            elapsed = time.perf_counter() - started
+            pool_stats.checkouts += 1
+            pool_stats.wait_total += elapsed
+            pool_stats.wait_max = max(pool_stats.wait_max, elapsed)
@@ -0,0 +1,292 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+import attrs
+from sqlalchemy import select, func, bindparam, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql.asyncpg import dialect as asyncpg_dialect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import Executable
+
+from api.config import cfg
+from models.admin import AdminModel
+from models.block_journal import BlockJournalModel
+from models.blocked import BlockedModel
+from models.dashboard_stats import DashboardStatsModel
+from models.ioc import IocModel
+from models.ioc_enrichment import IocEnrichmentModel
+
+_dialect = asyncpg_dialect()
+
+
+class HotRecord(asyncpg.Record):
+    """
+    asyncpg record readable by attribute like a SQLAlchemy row
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+@attrs.define
+class HotStatement:
+    """
+    Statement compiled once for asyncpg, with its bind parameters in the
+    order of their ``$n`` placeholders
+    """
+    name: str
+    statement: Executable
+    write: bool
+    sql: str = attrs.field(init=False)
+    _compiled: Any = attrs.field(init=False)
+    _processors: Dict[str, Callable] = attrs.field(init=False)
+
+    def __attrs_post_init__(self):
+        self._compiled = self.statement.compile(dialect=_dialect)
+        self.sql = self._compiled.string
+        if self._compiled.insert_prefetch or self._compiled.update_prefetch:
+            # column defaults computed in Python are only filled in by SQLAlchemy's execution
+            raise ValueError(f"statement {self.name} must set every column having a default")
+        self._processors = {}
+        for bind, name in self._compiled.bind_names.items():
+            processor = bind.type.dialect_impl(_dialect).bind_processor(_dialect)
+            if processor is not None:
+                self._processors[name] = processor
+
+    def args(self, params: dict) -> List[Any]:
+        """
+        Positional arguments of the prepared statement
+        :param params: values by bind name
+        :return:
+        :raises InvalidRequestError: a bind parameter has no value
+        """
+        values = self._compiled.construct_params(params)
+        return [
+            self._processors[name](values[name]) if name in self._processors else values[name]
+            for name in self._compiled.positiontup
+        ]
+
+
+@attrs.define
+class StatementRegistry:
+    """
+    Hot statements of the agent paths, built and compiled once at import.
+
+    On asyncpg they run as server-side prepared statements on the driver
+    connection, prepared once per connection and kept in its pool record, so
+    a request neither builds a query tree nor goes through SQLAlchemy's
+    compiled cache and execution context. Elsewhere, or when
+    ``DB_POOL_STATEMENT_CACHE_SIZE`` is 0 for pgbouncer, the same prebuilt
+    statements run through ``conn.execute``.
+
+    A write only takes the driver path once the transaction is open on the
+    server, the first statement of a transaction goes through SQLAlchemy
+    which begins it, so writes always commit or roll back with the request.
+    """
+    enabled: bool
+    statements: Dict[str, HotStatement] = attrs.field(factory=dict)
+    prepared: int = attrs.field(default=0, init=False)
+    driver_runs: int = attrs.field(default=0, init=False)
+    fallback_runs: int = attrs.field(default=0, init=False)
+
+    def register(self, name: str, statement: Executable, write: bool = False) -> HotStatement:
+        """
+        Add a statement
+        :param name:
+        :param statement: Core statement using ``bindparam`` for every value
+        :param write: the statement changes rows
+        :return:
+        """
+        if name in self.statements:
+            raise ValueError(f"statement {name} is already registered")
+        hot = self.statements[name] = HotStatement(name=name, statement=statement, write=write)
+        return hot
+
+    async def _driver(self, conn: AsyncConnection, hot: HotStatement) -> Optional[Tuple[Any, dict]]:
+        if not self.enabled or conn.dialect.driver != 'asyncpg':
+            return None
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection
+        if hot.write and not driver.is_in_transaction():
+            return None
+        return driver, raw.info.setdefault('hot_statements', {})
+
+    async def _run(self, conn: AsyncConnection, name: str, params: dict, method: str) -> Any:
+        hot = self.statements[name]
+        target = await self._driver(conn, hot)
+        if target is None:
+            self.fallback_runs += 1
+            result = await conn.execute(hot.statement, params)
+            if method == 'execute':
+                return None
+            if method == 'fetch':
+                return result.fetchall()
+            if method == 'fetchrow':
+                return result.first()
+            return result.scalar()
+
+        driver, prepared = target
+        try:
+            return await self._call(driver, prepared, hot, params, method)
+        except asyncpg.InvalidCachedStatementError:
+            # the table changed under the statement, prepare it again
+            prepared.pop(name, None)
+            if driver.is_in_transaction():
+                # the transaction is aborted, the request fails and the next one re-prepares
+                raise
+            return await self._call(driver, prepared, hot, params, method)
+
+    async def _call(self, driver: Any, prepared: dict, hot: HotStatement, params: dict, method: str) -> Any:
+        statement = prepared.get(hot.name)
+        if statement is None:
+            statement = prepared[hot.name] = await driver.prepare(hot.sql, record_class=HotRecord)
+            self.prepared += 1
+        self.driver_runs += 1
+        if method == 'execute':
+            await statement.fetch(*hot.args(params))
+            return None
+        return await getattr(statement, method)(*hot.args(params))
+
+    async def execute(self, conn: AsyncConnection, name: str, **params: Any) -> None:
+        """
+        Run a statement returning no rows
+        :param conn:
+        :param name:
+        :param params:
+        :return:
+        """
+        await self._run(conn, name, params, 'execute')
+
+    async def fetch(self, conn: AsyncConnection, name: str, **params: Any) -> List[Any]:
+        """
+        Run a statement and read all rows
+        :param conn:
+        :param name:
+        :param params:
+        :return: rows readable by attribute
+        """
+        return await self._run(conn, name, params, 'fetch')
+
+    async def first(self, conn: AsyncConnection, name: str, **params: Any) -> Optional[Any]:
+        """
+        Run a statement and read the first row
+        :param conn:
+        :param name:
+        :param params:
+        :return: ``None`` when there is no row
+        """
+        return await self._run(conn, name, params, 'fetchrow')
+
+    async def scalar(self, conn: AsyncConnection, name: str, **params: Any) -> Any:
+        """
+        Run a statement and read the first column of the first row
+        :param conn:
+        :param name:
+        :param params:
+        :return:
+        """
+        return await self._run(conn, name, params, 'fetchval')
+
+    def stats(self) -> dict:
+        """
+        Counters of the registry
+        :return:
+        """
+        return {
+            "statements": len(self.statements),
+            "prepared": self.prepared,
+            "driver_runs": self.driver_runs,
+            "fallback_runs": self.fallback_runs,
+        }
+
+
+hot_statements = StatementRegistry(
+    enabled=cfg.db_pool.statement_cache_size > 0 and make_url(cfg.db).get_driver_name() == 'asyncpg'
+)
+
+hot_statements.register('admin_id_by_apikey', select(
+    AdminModel.c.id
+).where(
+    AdminModel.c.api_key == bindparam('apikey')
+))
+
+hot_statements.register('admin_id_by_uuid', select(
+    AdminModel.c.id
+).where(
+    AdminModel.c.uuid == bindparam('uuid')
+))
+
+hot_statements.register('journal_head', select(
+    func.max(BlockJournalModel.c.seq)
+).where(
+    BlockJournalModel.c.hostname == bindparam('hostname')
+))
+
+hot_statements.register('journal_changed_ips', select(
+    BlockJournalModel.c.mal_ip
+).where(
+    BlockJournalModel.c.hostname == bindparam('hostname'),
+    BlockJournalModel.c.seq > bindparam('since')
+).distinct())
+
+_blocked_columns = (
+    BlockedModel.c.id,
+    BlockedModel.c.mal_ip,
+    BlockedModel.c.hostname,
+    BlockedModel.c.executed_time,
+)
+
+hot_statements.register('blocked_by_host', select(
+    *_blocked_columns
+).where(
+    BlockedModel.c.hostname == bindparam('hostname')
+))
+
+hot_statements.register('blocked_by_host_status', select(
+    *_blocked_columns
+).where(
+    BlockedModel.c.hostname == bindparam('hostname'),
+    BlockedModel.c.is_blocked == bindparam('is_blocked')
+))
+
+_ioc_upsert = insert(IocModel).values(
+    ip_address=bindparam('ip_address'),
+    hostname=bindparam('hostname'),
+    comment=bindparam('comment'),
+    counter=bindparam('counter'),
+    is_process=False,
+)
+hot_statements.register('ioc_upsert', _ioc_upsert.on_conflict_do_update(
+    index_elements=[IocModel.c.ip_address, IocModel.c.hostname],
+    set_={"counter": IocModel.c.counter + _ioc_upsert.excluded.counter}
+).returning(
+    IocModel.c.id,
+    IocModel.c.ip_address,
+    IocModel.c.hostname,
+    literal_column("xmax = 0").label("inserted")
+), write=True)
+
+_stats_add = insert(DashboardStatsModel).values(
+    id=bindparam('shard'),
+    connected_agents=bindparam('connected_agents'),
+    blocked_ips=bindparam('blocked_ips'),
+    active_alerts=bindparam('active_alerts'),
+)
+hot_statements.register('stats_add', _stats_add.on_conflict_do_update(
+    index_elements=[DashboardStatsModel.c.id],
+    set_={
+        name: DashboardStatsModel.c[name] + _stats_add.excluded[name]
+        for name in ('connected_agents', 'blocked_ips', 'active_alerts')
+    }
+), write=True)
+
+hot_statements.register('enrichment_schedule', insert(IocEnrichmentModel).values(
+    ip_address=bindparam('ip_address'),
+    sightings=0,
+).on_conflict_do_nothing(
+    index_elements=[IocEnrichmentModel.c.ip_address]
+), write=True)
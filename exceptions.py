@@ -44,4 +44,43 @@ class GroupNotFoundError(Exception):
     not exist in a dataset, collection, or other similar contexts. It is a
     custom error meant to clarify the specific issue of missing groups and
     allows for more granular exception handling.
-    """
\ No newline at end of file
+    """
+
+class ReputationQuotaExceededError(Exception):
+    """
+    Exception raised when the AbuseIPDB quota is used up and no cached
+    reputation of the requested ip is available.
+    """
+
+class EnrichTimeoutError(Exception):
+    """
+    Exception raised when an enrichment provider does not answer within its
+    timeout.
+    """
+
+class CircuitOpenError(Exception):
+    """
+    Exception raised when a provider is not called because its circuit
+    breaker is open after repeated failures.
+    """
+
+class InvalidCursorError(Exception):
+    """
+    Exception raised when a pagination cursor cannot be decoded.
+    """
+
+class WhitelistedIpError(Exception):
+    """
+    Exception raised when an ip covered by the whitelist is reported or
+    blocked.
+    """
+    def __init__(self, ip: str, entry: str):
+        super().__init__(f"{ip} is whitelisted by {entry}")
+        self.ip = ip
+        self.entry = entry
+
+class HashingBusyError(Exception):
+    """
+    Exception raised when too many password hashes or verifications are
+    already pending.
+    """
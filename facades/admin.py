@@ -1,37 +1,60 @@
-from typing import Optional
+from typing import Optional, List, Any, AsyncIterator
 
 import attrs
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncConnection
 
 from api.config import cfg
+from core.db import pool_metrics
+from core.statements import hot_statements
 from services.admin import AdminRead
 from exceptions import AdminPasswordError
-from helpers.authentication import PasswordHasher
 from helpers.token_maker import TokenMaker
 from schemas.admin import AdminLoginSchema, UpdateAdminSchema
-from services.enrich import EnrichService
-from fastapi import WebSocket
+from services.activity_log import activity_log
+from services.aggregation import blocklist_aggregator
+from services.export import blocklist_exporter
+from services.bulk_enrich import bulk_enricher
+from services.credentials import apikey_resolver, admin_identity
+from services.enrich import EnrichService, ioc_buffer
+from services.enrichment import enrichment_worker
+from services.journal import BlockJournal
+from services.opencti import opencti_lookup
+from services.passwords import hashing_pool
+from services.push import agent_hub
+from services.reputation import reputation_client
+from services.whitelist import WhitelistService, whitelist_index
 @attrs.define
 class Admin:
     """
-    Class for facades admin login
+    Class for facades admin login, methods calling only external services
+    or in-process state need no connection
     """
-    conn: AsyncConnection
+    conn: Optional[AsyncConnection] = None
 
-    async def login(self, data: AdminLoginSchema, hasher: PasswordHasher):
+    async def read_login(self, name: str) -> Optional[Row]:
         """
-        Method for login
+        Get credentials of an admin for ``login``
+        :param name:
+        :return:
+        """
+        return await AdminRead(self.conn).read_login(name)
+
+    async def login(self, data: AdminLoginSchema, credentials: Optional[Row]):
+        """
+        Method for login, it needs no connection
         :param data:
-        :param hasher:
+        :param credentials: row of ``read_login``
         :return:
+        :raises HashingBusyError: too many logins are pending
         """
         data = data.__dict__
         try:
-            check_login = await AdminRead(self.conn).login(data, hasher)
+            uuid_, admin_id = await AdminRead(self.conn).login(data, credentials, hashing_pool)
             token = TokenMaker()
 
             return token.return_token(
-                cfg.password.token_key, check_login
+                cfg.password.token_key, uuid_, admin_id, cfg.jwt.ttl
             )
         except AdminPasswordError as e:
             raise AdminPasswordError
@@ -69,6 +92,14 @@ class Admin:
 
         return await AdminRead(self.conn).read_by_name(name)
 
+    async def resolve_admin_id(self, uuid_: str) -> Optional[int]:
+        """
+        Admin id of a token uuid, cached
+        :param uuid_:
+        :return: ``None`` when no admin has this uuid
+        """
+        return await admin_identity.resolve(self.conn, uuid_)
+
     async def add_group(self, name: str) -> int:
         """
         Adds a new group to the system.
@@ -131,13 +162,21 @@ class Admin:
         """
         return await AdminRead(self.conn).get_apikey(admin_id)
 
-    def enrich(self, ip_address: str):
+    async def enrich(self, ip_address: str):
         """
         Enrich data with opencti data
         :param data:
         :return:
         """
-        return EnrichService().enrich(ip_address)
+        return await EnrichService().enrich(ip_address)
+
+    def enrich_bulk(self, ip_addresses: List[str]) -> AsyncIterator[dict]:
+        """
+        Enrich many ips with opencti and abuseipdb data
+        :param ip_addresses:
+        :return: merged result per ip, in order of completion
+        """
+        return bulk_enricher.enrich(ip_addresses)
 
     async def add_mal_ip(self, ip: str, hostname: str, apikey: str) -> int:
         """
@@ -157,13 +196,24 @@ class Admin:
         """
         return await EnrichService().add_iochost(self.conn, ip, hostname, apikey, comment)
 
-    async def list_mal_ip(self, hostname: Optional[str] = None, is_blocked: Optional[str] = None, page: Optional[int] = None, per_page: Optional[int] = None):
+    async def add_iocs(self, items: List[Any], apikey: str):
+        """
+        Add a batch of malicious ip sightings
+        :param items:
+        :param apikey:
+        :return:
+        """
+        return await EnrichService().add_iochost_batch(self.conn, items, apikey)
+
+    async def list_mal_ip(self, hostname: Optional[str] = None, is_blocked: Optional[str] = None, page: Optional[int] = None, per_page: Optional[int] = None, cursor: Optional[str] = None, total_mode: Optional[str] = None):
         """
         List all malicious ip
         :param hostname:
+        :param cursor:
+        :param total_mode:
         :return:
         """
-        return await EnrichService().list_mal_ip(hostname, is_blocked, self.conn, page, per_page)
+        return await EnrichService().list_mal_ip(hostname, is_blocked, self.conn, page, per_page, cursor, total_mode)
 
     async def list_mal_ip_general(self, hostname: str, is_blocked: bool, apikey: str):
         """
@@ -173,13 +223,77 @@ class Admin:
         """
         return await EnrichService().list_mal_ip_general(apikey, hostname, is_blocked, self.conn)
 
-    async def list_ioc(self,page: Optional[int] = 1, per_page: Optional[int] = 5, hostname: Optional[str] = None, is_blocked: Optional[bool] = False, ip: Optional[str] = None):
+    async def check_cred(self, apikey: str, hostname: str) -> bool:
+        """
+        Check agent credential
+        :param apikey:
+        :param hostname:
+        :return:
+        """
+        return await AdminRead(self.conn).check_cred(apikey, hostname)
+
+    async def blocklist_head(self, hostname: str) -> int:
+        """
+        Current blocklist cursor of a host
+        :param hostname:
+        :return:
+        """
+        return await BlockJournal(self.conn).head(hostname)
+
+    async def blocklist_etag(self, hostname: str, apikey: str, variant: tuple, lossy: bool = False):
+        """
+        ETag of a host blocklist response
+        :param hostname:
+        :param variant:
+        :param lossy:
+        :return:
+        """
+        return await EnrichService().blocklist_etag(apikey, hostname, variant, lossy, self.conn)
+
+    async def list_mal_ip_aggregated(self, hostname: str, is_blocked: bool, apikey: str, mode: str,
+                                     coverage: Optional[float] = None):
+        """
+        List malicious ip collapsed into cidrs
+        :param hostname:
+        :param mode:
+        :param coverage:
+        :return:
+        """
+        return await EnrichService().list_mal_ip_aggregated(apikey, hostname, mode, coverage, is_blocked, self.conn)
+
+    async def export_mal_ip(self, hostname: str, is_blocked: bool, apikey: str, fmt: str,
+                            accept_encoding: Optional[str] = None, mode: Optional[str] = None,
+                            coverage: Optional[float] = None):
+        """
+        Export malicious ip for an agent
+        :param hostname:
+        :param fmt:
+        :param accept_encoding:
+        :param mode:
+        :param coverage:
+        :return:
+        """
+        return await EnrichService().export_mal_ip(apikey, hostname, fmt, accept_encoding, mode, coverage,
+                                                   is_blocked, self.conn)
+
+    async def list_mal_ip_since(self, hostname: str, is_blocked: bool, apikey: str, since: int):
+        """
+        List changes of malicious ip after a cursor
+        :param hostname:
+        :param since:
+        :return:
+        """
+        return await EnrichService().list_mal_ip_since(apikey, hostname, since, is_blocked, self.conn)
+
+    async def list_ioc(self,page: Optional[int] = 1, per_page: Optional[int] = 5, hostname: Optional[str] = None, is_blocked: Optional[bool] = False, ip: Optional[str] = None, cursor: Optional[str] = None, total_mode: Optional[str] = None):
         """
         List all iocs ip
         :param hostname:
+        :param cursor:
+        :param total_mode:
         :return:
         """
-        return await EnrichService().list_iochost(page, per_page, hostname, is_blocked, self.conn, ip)
+        return await EnrichService().list_iochost(page, per_page, hostname, is_blocked, self.conn, ip, cursor, total_mode)
 
     async def block_ip(self, ip: str, hostname: str) -> int:
         """
@@ -207,11 +321,20 @@ class Admin:
 
         return await AdminRead(self.conn).report()
 
-    async def update_me(self, id: int, data: UpdateAdminSchema):
+    async def prepare_update(self, data: UpdateAdminSchema) -> dict:
+        """
+        Values of an admin update, it needs no connection
+        :param data:
+        :return:
+        :raises HashingBusyError: too many password changes are pending
+        """
+        return await AdminRead(self.conn).prepare_update(data, hashing_pool)
+
+    async def update_me(self, id: int, data: dict):
         """
         Update admin
         :param id:
-        :param data:
+        :param data: values of ``prepare_update``
         :return:
         """
 
@@ -225,17 +348,65 @@ class Admin:
         """
         return await AdminRead(self.conn).read_me(id)
 
-    async def list_log(self, page: Optional[int] = 1, per_page: Optional[int] = 5):
+    async def list_log(self, page: Optional[int] = 1, per_page: Optional[int] = 5, cursor: Optional[str] = None, total_mode: Optional[str] = None):
         """
         List all logs
+        :param cursor:
+        :param total_mode:
         :return:
         """
-        return await AdminRead(self.conn).list_log(page, per_page)
+        return await AdminRead(self.conn).list_log(page, per_page, cursor, total_mode)
 
-    def check_reputation(self, ip_address: str):
+    async def check_reputation(self, ip_address: str):
         """
         Check reputation of ip
         :param ip_address:
         :return:
         """
-        return EnrichService().check_reputation(ip_address)
\ No newline at end of file
+        return await EnrichService().check_reputation(ip_address)
+
+    async def add_whitelist(self, entries: List[str]) -> List[str]:
+        """
+        Whitelist ips and cidrs
+        :param entries:
+        :return:
+        """
+        return await WhitelistService().add(self.conn, entries)
+
+    async def delete_whitelist(self, entry: str) -> bool:
+        """
+        Remove a whitelist entry
+        :param entry:
+        :return:
+        """
+        return await WhitelistService().remove(self.conn, entry)
+
+    async def list_whitelist(self) -> List[str]:
+        """
+        List whitelist entries
+        :return:
+        """
+        return await WhitelistService().list_entries(self.conn)
+
+    def metrics(self) -> dict:
+        """
+        In-process counters of this worker
+        :return:
+        """
+        return {
+            "apikey_cache": apikey_resolver.stats(),
+            "admin_identity": admin_identity.stats(),
+            "agent_push": agent_hub.stats(),
+            "ioc_buffer": ioc_buffer.stats(),
+            "activity_log": activity_log.stats(),
+            "abuseipdb": reputation_client.stats(),
+            "opencti": opencti_lookup.stats(),
+            "enrich_breakers": bulk_enricher.stats(),
+            "enrichment": enrichment_worker.stats(),
+            "whitelist": whitelist_index.stats(),
+            "aggregate": blocklist_aggregator.stats(),
+            "export": blocklist_exporter.stats(),
+            "password_hashing": hashing_pool.stats(),
+            "db_pool": pool_metrics(),
+            "hot_statements": hot_statements.stats(),
+        }
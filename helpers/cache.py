@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import attrs
+
+MISSING = object()
+
+
+@attrs.define
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry expiry and LRU eviction
+    """
+    maxsize: int
+    ttl: float
+    hits: int = attrs.field(default=0, init=False)
+    misses: int = attrs.field(default=0, init=False)
+    _data: OrderedDict = attrs.field(factory=OrderedDict, init=False)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Get a live entry, expired entries count as a miss
+        :param key:
+        :param default: returned when the key is missing or expired
+        :return:
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Store an entry, evicting the least recently used one when full
+        :param key:
+        :param value:
+        :param ttl: override the default ttl of the cache
+        :return:
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Drop an entry if present
+        :param key:
+        :return:
+        """
+        self._data.pop(key, None)
+
+    def pop_value(self, value: Any) -> None:
+        """
+        Drop every entry holding the given value
+        :param value:
+        :return:
+        """
+        for key in [key for key, (_, cached) in self._data.items() if cached == value]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        """
+        Drop every entry
+        :return:
+        """
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """
+        Counters of the cache
+        :return:
+        """
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
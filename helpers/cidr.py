@@ -0,0 +1,177 @@
+import bisect
+import socket
+from typing import Dict, Iterable, List, Tuple
+
+from helpers.prefix_trie import Network
+
+MAX_PREFIXLEN = {4: 32, 6: 128}
+FAMILIES = ((4, socket.AF_INET, 4), (6, socket.AF_INET6, 16))
+
+
+def split_families(addresses: Iterable[str]) -> Dict[int, List[int]]:
+    """
+    Sorted unique integer addresses per ip version, invalid addresses are skipped
+    :param addresses:
+    :return:
+    """
+    families = {4: set(), 6: set()}
+    for address in addresses:
+        # inet_pton is an order of magnitude faster than ipaddress on large lists
+        for version, family, _ in FAMILIES:
+            try:
+                families[version].add(int.from_bytes(socket.inet_pton(family, address.strip()), 'big'))
+                break
+            except OSError:
+                continue
+    return {version: sorted(values) for version, values in families.items()}
+
+
+def format_prefixes(blocks: Iterable[Tuple[int, int]], version: int) -> List[str]:
+    """
+    Cidr strings of (first address, prefix length) blocks
+    :param blocks:
+    :param version:
+    :return:
+    """
+    _, family, length = FAMILIES[0] if version == 4 else FAMILIES[1]
+    return [
+        f"{socket.inet_ntop(family, start.to_bytes(length, 'big'))}/{prefixlen}"
+        for start, prefixlen in blocks
+    ]
+
+
+def range_prefixes(start: int, end: int, max_prefixlen: int) -> List[Tuple[int, int]]:
+    """
+    Fewest aligned prefixes covering exactly ``start`` to ``end`` included
+    :param start:
+    :param end:
+    :param max_prefixlen: 32 or 128
+    :return: (first address, prefix length)
+    """
+    prefixes = []
+    while start <= end:
+        # the widest block starting at ``start`` is bounded by its alignment
+        # and by what is left of the range
+        size = start & -start if start else 1 << max_prefixlen
+        left = end - start + 1
+        while size > left:
+            size >>= 1
+        prefixes.append((start, max_prefixlen - size.bit_length() + 1))
+        start += size
+    return prefixes
+
+
+def collapse(blocks: Iterable[Tuple[int, int]], max_prefixlen: int) -> List[Tuple[int, int]]:
+    """
+    Minimal prefixes covering the union of (first address, prefix length) blocks
+    :param blocks:
+    :param max_prefixlen:
+    :return:
+    """
+    ranges = []
+    for start, prefixlen in sorted(blocks):
+        end = start + (1 << (max_prefixlen - prefixlen)) - 1
+        if ranges and start <= ranges[-1][1] + 1:
+            if end > ranges[-1][1]:
+                ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+
+    prefixes = []
+    for start, end in ranges:
+        prefixes.extend(range_prefixes(start, end, max_prefixlen))
+    return prefixes
+
+
+class RangeSet:
+    """
+    Sorted disjoint integer ranges of a set of networks, answers whether a
+    block overlaps any of them with one bisect
+    """
+    __slots__ = ('_starts', '_ends')
+
+    def __init__(self, networks: Iterable[Network], version: int):
+        blocks = [
+            (int(network.network_address), network.prefixlen)
+            for network in networks if network.version == version
+        ]
+        max_prefixlen = MAX_PREFIXLEN[version]
+        self._starts = []
+        self._ends = []
+        for start, prefixlen in collapse(blocks, max_prefixlen):
+            self._starts.append(start)
+            self._ends.append(start + (1 << (max_prefixlen - prefixlen)) - 1)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        index = bisect.bisect_right(self._starts, end) - 1
+        return index >= 0 and self._ends[index] >= start
+
+
+def lossy_prefixes(values: List[int], max_prefixlen: int, min_prefixlen: int, coverage: float,
+                   excluded: RangeSet) -> List[Tuple[int, int]]:
+    """
+    Widest prefixes at least ``coverage`` blocked and overlapping no excluded range.
+
+    ``values`` is split top-down into the contiguous runs sharing a prefix.
+    A run of ``count`` addresses can only reach the coverage within prefixes
+    of at most ``count / coverage`` addresses, so the split jumps straight to
+    that depth instead of walking every bit, and each run is cut with one
+    bisect per sub-run.
+    :param values: sorted unique addresses of one ip version
+    :param max_prefixlen:
+    :param min_prefixlen: no prefix wider than this is produced
+    :param coverage: share of a prefix that must be blocked, in ``(0, 1]``
+    :param excluded: ranges a prefix wider than a single address may not touch
+    :return: (first address, prefix length), disjoint, every address covered
+    """
+    prefixes = []
+    stack = [(0, 0, 0, len(values))] if values else []
+    while stack:
+        key, depth, lo, hi = stack.pop()
+        count = hi - lo
+        size = 1 << (max_prefixlen - depth)
+        start = key << (max_prefixlen - depth)
+        if depth >= min_prefixlen and count >= coverage * size and (
+                count == size or not excluded.overlaps(start, start + size - 1)):
+            prefixes.append((start, depth))
+            continue
+
+        widest = max(int(count / coverage).bit_length() - 1, 0)
+        target = min(max(depth + 1, min_prefixlen, max_prefixlen - widest), max_prefixlen)
+        shift = max_prefixlen - target
+        index = lo
+        while index < hi:
+            sub_key = values[index] >> shift
+            end = bisect.bisect_left(values, (sub_key + 1) << shift, index, hi)
+            stack.append((sub_key, target, index, end))
+            index = end
+    return prefixes
+
+
+def aggregate(addresses: Iterable[str], coverage: float = 1.0, excluded: Iterable[Network] = (),
+              min_prefixlen: Dict[int, int] = None) -> List[str]:
+    """
+    Collapse addresses into prefixes.
+
+    With a ``coverage`` of 1 the prefixes hold exactly the addresses, below 1
+    a prefix is used as soon as that share of it is listed, unless it would
+    cover an ``excluded`` network.
+    :param addresses:
+    :param coverage: share of a prefix that must be listed, in ``(0, 1]``
+    :param excluded: networks lossy prefixes must not cover, e.g. the whitelist
+    :param min_prefixlen: widest lossy prefix per ip version, ``{4: 16, 6: 48}`` when omitted
+    :return: IPv4 cidrs then IPv6 cidrs, each sorted
+    """
+    min_prefixlen = min_prefixlen or {4: 16, 6: 48}
+    excluded = list(excluded)
+    prefixes = []
+    for version, values in split_families(addresses).items():
+        max_prefixlen = MAX_PREFIXLEN[version]
+        if coverage >= 1:
+            blocks = [(value, max_prefixlen) for value in values]
+        else:
+            blocks = lossy_prefixes(
+                values, max_prefixlen, min_prefixlen[version], coverage, RangeSet(excluded, version)
+            )
+        prefixes.extend(format_prefixes(collapse(blocks, max_prefixlen), version))
+    return prefixes
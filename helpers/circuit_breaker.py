@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import attrs
+
+from exceptions import CircuitOpenError
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+@attrs.define
+class CircuitBreaker:
+    """
+    Fail fast on a provider that keeps failing.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    are refused for ``reset_timeout`` seconds, then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+    name: str
+    failure_threshold: int
+    reset_timeout: float
+    failures: int = attrs.field(default=0, init=False)
+    opened_at: Optional[float] = attrs.field(default=None, init=False)
+    _probing: bool = attrs.field(default=False, init=False)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return STATE_HALF_OPEN
+        return STATE_OPEN
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Call the provider through the breaker
+        :param func:
+        :param args:
+        :return: result of ``func``
+        :raises CircuitOpenError: the circuit is open
+        """
+        state = self.state
+        if state == STATE_OPEN or (state == STATE_HALF_OPEN and self._probing):
+            raise CircuitOpenError(self.name)
+
+        self._probing = state == STATE_HALF_OPEN
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            # the caller went away, the provider did not fail
+            raise
+        except Exception:
+            self._failed()
+            raise
+        finally:
+            self._probing = False
+
+        self.failures = 0
+        self.opened_at = None
+        return result
+
+    def _failed(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """
+        State of the breaker
+        :return:
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+        }
@@ -0,0 +1,236 @@
+import gzip
+import hashlib
+import socket
+import struct
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from helpers.cidr import split_families
+
+try:
+    import zstandard
+except ImportError:  # optional, responses fall back to gzip
+    zstandard = None
+
+JSON = 'json'
+IPSET = 'ipset'
+NFT = 'nft'
+BINARY = 'binary'
+
+MEDIA_TYPES = {
+    JSON: 'application/json',
+    IPSET: 'text/x-ipset-restore',
+    NFT: 'text/x-nftables',
+    BINARY: 'application/x-blocklist',
+}
+
+# magic, format version, flags, reserved, ipv4 count, ipv6 count, crc32 of the addresses
+BINARY_MAGIC = b'CFBL'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('>4sBBHIII')
+
+# elements per ``add element`` line of an nft file
+NFT_CHUNK = 4096
+
+
+def negotiate(accept: Optional[str], requested: Optional[str] = None) -> str:
+    """
+    Export format out of an explicit ``format`` parameter or the Accept header
+    :param accept: Accept header
+    :param requested: format parameter, wins over the header
+    :return: one of ``JSON``, ``IPSET``, ``NFT``, ``BINARY``
+    :raises ValueError: unknown requested format
+    """
+    if requested:
+        if requested not in MEDIA_TYPES:
+            raise ValueError(f"Unknown format {requested}")
+        return requested
+
+    by_type = {media_type: name for name, media_type in MEDIA_TYPES.items()}
+    offers = []
+    for position, part in enumerate((accept or '').split(',')):
+        media_type, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type.strip().lower() in by_type and quality > 0:
+            offers.append((-quality, position, by_type[media_type.strip().lower()]))
+    return min(offers)[2] if offers else JSON
+
+
+def make_etag(version: int, *variant) -> str:
+    """
+    Strong ETag of one representation of a versioned resource
+    :param version: changes whenever the resource changes
+    :param variant: everything else the body depends on, e.g. format and encoding
+    :return:
+    """
+    tag = hashlib.blake2b(repr(variant).encode(), digest_size=8).hexdigest()
+    return f'"{version}-{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against the current ETag, weak comparison
+    as RFC 9110 requires for this header
+    :param if_none_match:
+    :param etag:
+    :return:
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(
+        candidate.strip().removeprefix('W/') == etag
+        for candidate in if_none_match.split(',')
+    )
+
+
+def render_ipset(prefixes: Iterable[str], name: str) -> bytes:
+    """
+    ``ipset restore`` script replacing the ``name`` (IPv4) and ``name6`` (IPv6)
+    sets atomically: the entries are loaded in temporary sets swapped in at the end
+    :param prefixes: addresses or cidrs
+    :param name:
+    :return:
+    """
+    families = {4: [], 6: []}
+    for prefix in prefixes:
+        families[6 if ':' in prefix else 4].append(prefix)
+
+    lines = []
+    for version, entries in families.items():
+        set_name = name if version == 4 else f"{name}6"
+        family = 'inet' if version == 4 else 'inet6'
+        options = f"hash:net family {family} maxelem {max(65536, len(entries))}"
+        lines.append(f"create {set_name} {options} -exist")
+        lines.append(f"create {set_name}-new {options} -exist")
+        lines.append(f"flush {set_name}-new")
+        lines.extend(f"add {set_name}-new {entry}" for entry in entries)
+        lines.append(f"swap {set_name}-new {set_name}")
+        lines.append(f"destroy {set_name}-new")
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def render_nft(prefixes: Iterable[str], table: str, name: str) -> bytes:
+    """
+    ``nft -f`` file replacing the ``name4`` and ``name6`` interval sets of the
+    ``inet`` ``table``, nft applies the whole file in one transaction
+    :param prefixes: non overlapping addresses or cidrs
+    :param table:
+    :param name:
+    :return:
+    """
+    families = {4: [], 6: []}
+    for prefix in prefixes:
+        families[6 if ':' in prefix else 4].append(prefix)
+
+    lines = [f"table inet {table} {{"]
+    for version in families:
+        lines.append(f"\tset {name}{version} {{ type ipv{version}_addr; flags interval; }}")
+    lines.append("}")
+    for version, entries in families.items():
+        lines.append(f"flush set inet {table} {name}{version}")
+        for start in range(0, len(entries), NFT_CHUNK):
+            elements = ', '.join(entries[start:start + NFT_CHUNK])
+            lines.append(f"add element inet {table} {name}{version} {{ {elements} }}")
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def render_binary(addresses: Iterable[str]) -> bytes:
+    """
+    Packed blocklist: a header then the sorted IPv4 addresses as 4 big-endian
+    bytes each and the sorted IPv6 addresses as 16 big-endian bytes each
+    :param addresses: single addresses, invalid ones are skipped
+    :return:
+    """
+    families = split_families(addresses)
+    payload = b''.join(value.to_bytes(4, 'big') for value in families[4])
+    payload += b''.join(value.to_bytes(16, 'big') for value in families[6])
+    header = BINARY_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, 0, 0, len(families[4]), len(families[6]), zlib.crc32(payload)
+    )
+    return header + payload
+
+
+def parse_binary(data: bytes) -> List[str]:
+    """
+    Addresses of a packed blocklist, the reverse of ``render_binary``
+    :param data:
+    :return:
+    :raises ValueError: not a packed blocklist, unknown version or corrupted
+    """
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError("Truncated header")
+    magic, version, _, _, count4, count6, checksum = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Not a packed blocklist")
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported version {version}")
+    payload = data[BINARY_HEADER.size:]
+    if len(payload) != count4 * 4 + count6 * 16 or zlib.crc32(payload) != checksum:
+        raise ValueError("Corrupted payload")
+
+    addresses = [socket.inet_ntop(socket.AF_INET, payload[i:i + 4]) for i in range(0, count4 * 4, 4)]
+    offset = count4 * 4
+    addresses.extend(
+        socket.inet_ntop(socket.AF_INET6, payload[i:i + 16]) for i in range(offset, len(payload), 16)
+    )
+    return addresses
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """
+    Encodings of an Accept-Encoding header with their quality
+    :param accept_encoding:
+    :return:
+    """
+    encodings = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        key, _, value = params.strip().partition('=')
+        if key == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding:
+            encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def pick_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Best encoding the client accepts, zstd when the ``zstandard`` package is
+    installed, else gzip
+    :param accept_encoding: Accept-Encoding header
+    :return: ``None`` when the client accepts neither
+    """
+    encodings = accepted_encodings(accept_encoding)
+    if zstandard is not None and encodings.get('zstd', 0) > 0:
+        return 'zstd'
+    if encodings.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str], min_size: int) -> Tuple[bytes, Optional[str]]:
+    """
+    Compress a body
+    :param body:
+    :param encoding: result of ``pick_encoding``
+    :param min_size: smaller bodies are sent as they are
+    :return: body and Content-Encoding, ``None`` when not compressed
+    """
+    if encoding is None or len(body) < min_size:
+        return body, None
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(body), 'zstd'
+    return gzip.compress(body, compresslevel=6, mtime=0), 'gzip'
@@ -0,0 +1,47 @@
+import ipaddress
+import json
+from typing import Any, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from schemas.admin import IocIngestSchema
+
+
+def parse_batch(body: bytes, content_type: str) -> List[Any]:
+    """
+    Decode a batch body, either a JSON array or NDJSON with one object per line
+    :param body:
+    :param content_type:
+    :return: raw items, not validated yet
+    :raises ValueError: when the body is not a JSON array nor NDJSON
+    """
+    text = body.decode('utf-8').strip()
+    if not text:
+        return []
+
+    if 'ndjson' in content_type or not text.startswith('['):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    items = json.loads(text)
+    if not isinstance(items, list):
+        raise ValueError("Body must be a JSON array")
+    return items
+
+
+def validate_item(item: Any) -> Tuple[Optional[IocIngestSchema], Optional[str]]:
+    """
+    Validate one item of a batch
+    :param item:
+    :return: ``(item, None)`` or ``(None, error)``
+    """
+    try:
+        item = IocIngestSchema.model_validate(item)
+        item.ip = str(ipaddress.ip_address(item.ip.strip()))
+    except ValidationError as e:
+        return None, e.errors()[0]['msg']
+    except ValueError as e:
+        return None, str(e)
+
+    if not item.hostname:
+        return None, "hostname is required"
+    return item, None
@@ -0,0 +1,72 @@
+import base64
+import binascii
+import json
+from typing import Optional, Tuple
+
+from sqlalchemy import Column, Select
+
+from exceptions import InvalidCursorError
+
+CURSOR_VERSION = 1
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Opaque cursor pointing after the row ``last_id``
+    :param last_id:
+    :return:
+    """
+    raw = json.dumps({"v": CURSOR_VERSION, "id": last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Id of the last row seen out of a cursor
+    :param cursor:
+    :return:
+    :raises InvalidCursorError: the cursor was not made by ``encode_cursor``
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data["v"] != CURSOR_VERSION or not isinstance(data["id"], int):
+            raise ValueError(cursor)
+        return data["id"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursorError(cursor)
+
+
+def paginate(query: Select, id_column: Column, page: Optional[int], per_page: int,
+             cursor: Optional[str] = None) -> Select:
+    """
+    Page a query ordered by ``id_column`` descending.
+
+    With a cursor the query seeks past the last id seen, which costs the same
+    whatever the depth, otherwise ``page`` is applied with an offset. One row
+    more than ``per_page`` is fetched to tell whether a next page exists, see
+    ``split_page``.
+    :param query:
+    :param id_column:
+    :param page:
+    :param per_page:
+    :param cursor:
+    :return:
+    """
+    query = query.order_by(id_column.desc()).limit(per_page + 1)
+    if cursor:
+        return query.where(id_column < decode_cursor(cursor))
+    return query.offset((page - 1) * per_page)
+
+
+def split_page(rows: list, per_page: int) -> Tuple[list, Optional[str]]:
+    """
+    Rows of the page and cursor of the next one
+    :param rows: rows fetched by a query paged with ``paginate``
+    :param per_page:
+    :return: ``next_cursor`` is ``None`` on the last page
+    """
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor(rows[-1].id)
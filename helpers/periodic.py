@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import attrs
+
+logger = logging.getLogger(__name__)
+
+
+@attrs.define
+class PeriodicTask:
+    """
+    Run a coroutine function in the background every ``interval`` seconds
+    """
+    func: Callable[[], Awaitable[None]]
+    interval: float
+    name: str = 'periodic'
+    _task: Optional[asyncio.Task] = attrs.field(default=None, init=False)
+
+    def start(self) -> None:
+        """
+        Start the background loop, calling twice is a no-op
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        """
+        Cancel the background loop and wait until it is gone
+        :return:
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.func()
+            except Exception:
+                logger.exception("periodic task %s failed", self.name)
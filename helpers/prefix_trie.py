@@ -0,0 +1,101 @@
+import bisect
+import ipaddress
+from typing import Dict, Iterator, List, Optional, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_network(value: str) -> Network:
+    """
+    Network out of a single ip or a cidr, host bits are dropped
+    :param value:
+    :return:
+    :raises ValueError: neither an ip nor a cidr
+    """
+    return ipaddress.ip_network(value.strip(), strict=False)
+
+
+class PrefixTrie:
+    """
+    Binary trie of ip prefixes, one per address family, stored by level.
+
+    Only the nodes ending a stored network matter for a lookup, so every
+    depth of the trie is kept as a hash of those nodes keyed by the prefix
+    bits. A lookup probes the depths holding a network from the shortest,
+    at most one probe per bit of the address (32 for IPv4, 128 for IPv6)
+    whatever the number of networks, and adding or removing a network
+    touches a single depth. Compared with one object per trie node this keeps
+    100k networks in a few MB instead of hundreds.
+    """
+    __slots__ = ('_levels', '_depths', '_size')
+
+    def __init__(self):
+        self._levels: Dict[int, Dict[int, Dict[int, Network]]] = {4: {}, 6: {}}
+        self._depths: Dict[int, List[int]] = {4: [], 6: []}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, network: Network) -> bool:
+        """
+        Store a network
+        :param network:
+        :return: ``False`` when it was already stored
+        """
+        levels = self._levels[network.version]
+        depth = network.prefixlen
+        level = levels.get(depth)
+        if level is None:
+            level = levels[depth] = {}
+            bisect.insort(self._depths[network.version], depth)
+
+        key = int(network.network_address) >> (network.max_prefixlen - depth)
+        if key in level:
+            return False
+        level[key] = network
+        self._size += 1
+        return True
+
+    def remove(self, network: Network) -> bool:
+        """
+        Forget a network, networks inside or around it are kept
+        :param network:
+        :return: ``False`` when it was not stored
+        """
+        levels = self._levels[network.version]
+        depth = network.prefixlen
+        level = levels.get(depth)
+        key = int(network.network_address) >> (network.max_prefixlen - depth)
+        if level is None or level.pop(key, None) is None:
+            return False
+
+        self._size -= 1
+        if not level:
+            del levels[depth]
+            self._depths[network.version].remove(depth)
+        return True
+
+    def match(self, address: Union[str, ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Optional[Network]:
+        """
+        Widest stored network containing an address
+        :param address:
+        :return: ``None`` when no network contains it
+        """
+        if isinstance(address, str):
+            address = ipaddress.ip_address(address)
+        levels = self._levels[address.version]
+        bits, length = int(address), address.max_prefixlen
+        for depth in self._depths[address.version]:
+            network = levels[depth].get(bits >> (length - depth))
+            if network is not None:
+                return network
+        return None
+
+    def __contains__(self, address) -> bool:
+        return self.match(address) is not None
+
+    def __iter__(self) -> Iterator[Network]:
+        for levels in self._levels.values():
+            for level in levels.values():
+                yield from level.values()
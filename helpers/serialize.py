@@ -0,0 +1,113 @@
+import datetime
+import enum
+import json
+import typing
+from typing import Any, Callable, Dict
+
+import attrs
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib json module is used instead
+    orjson = None
+
+_encoders: Dict[type, Callable[[Any], dict]] = {}
+
+
+def _unwrap_optional(hint: Any) -> Any:
+    if typing.get_origin(hint) is typing.Union:
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return hint
+
+
+def _compile(cls: type) -> Callable[[Any], dict]:
+    """
+    Build the encoder of an attrs class as one generated function reading
+    each field by name, nested attrs fields call their own encoder directly
+    """
+    hints = typing.get_type_hints(cls)
+    namespace = {}
+    items = []
+    for field in attrs.fields(cls):
+        hint = _unwrap_optional(hints.get(field.name, Any))
+        value = f"obj.{field.name}"
+        if attrs.has(hint):
+            namespace[f"_{field.name}"] = encoder_for(hint)
+            value = f"_{field.name}({value}) if {value} is not None else None"
+        elif typing.get_origin(hint) in (list, typing.List) and typing.get_args(hint) \
+                and attrs.has(typing.get_args(hint)[0]):
+            namespace[f"_{field.name}"] = encoder_for(typing.get_args(hint)[0])
+            value = f"[_{field.name}(item) for item in {value}] if {value} is not None else None"
+        items.append(f"{field.name!r}: {value}")
+
+    source = f"def encode(obj):\n    return {{{', '.join(items)}}}\n"
+    exec(compile(source, f"<encoder {cls.__qualname__}>", "exec"), namespace)
+    return namespace["encode"]
+
+
+def encoder_for(cls: type) -> Callable[[Any], dict]:
+    """
+    Compiled encoder of an attrs class, built on first use
+    :param cls:
+    :return: function turning an instance into a dict of JSON values
+    """
+    encoder = _encoders.get(cls)
+    if encoder is None:
+        # registered before compiling, a class may nest itself
+        _encoders[cls] = lambda obj: _encoders[cls](obj)
+        try:
+            encoder = _encoders[cls] = _compile(cls)
+        except Exception:
+            del _encoders[cls]
+            raise
+    return encoder
+
+
+def _default(obj: Any) -> Any:
+    encoder = _encoders.get(type(obj))
+    if encoder is not None or attrs.has(type(obj)):
+        return (encoder or encoder_for(type(obj)))(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    JSON of attrs schemas, lists and dicts of them and plain values
+    :param content:
+    :return:
+    """
+    if isinstance(content, list) and content and attrs.has(type(content[0])):
+        cls = type(content[0])
+        encoder = encoder_for(cls)
+        # other items are left to ``_default``
+        content = [encoder(item) if type(item) is cls else item for item in content]
+    elif attrs.has(type(content)):
+        content = encoder_for(type(content))(content)
+
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response of attrs schemas encoded by their compiled encoders, with
+    orjson when it is installed.
+
+    Returning it from a route skips ``jsonable_encoder``, which walks every
+    object reflectively and cannot read slotted classes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
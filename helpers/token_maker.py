@@ -1,31 +1,37 @@
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException
 
 
 class TokenMaker:
-    def create_token(self, key: str, name: str) -> str:
+    def create_token(self, key: str, name: str, admin_id: Optional[int] = None, ttl: float = 3600) -> str:
         """
-        membuat token baru
+        membuat token baru, berlaku selama ``ttl`` detik
         """
-        val: Dict[str, Any] = {"uuid": name}
+        now = int(time.time())
+        val: Dict[str, Any] = {"uuid": name, "iat": now, "exp": now + int(ttl)}
+        if admin_id is not None:
+            val["id"] = admin_id
 
         return jwt.encode(val, key, algorithm="HS256")
 
     def verify_token(self, token: str, key: str) -> dict:
         """
-        memverify token
+        memverify token, token tanpa ``exp`` ditolak
         """
         try:
-            return jwt.decode(token, key, algorithms=["HS256"])
+            return jwt.decode(token, key, algorithms=["HS256"], options={"require_exp": True, "require_iat": True})
         except JWTError as e:
             raise HTTPException(401, {"msg": str(e)}) from e
 
-    def return_token(self, key: str, name: str) -> dict:
+    def return_token(self, key: str, name: str, admin_id: Optional[int] = None, ttl: float = 3600) -> dict:
         """
         return token
         """
         return {
-            "access_token": self.create_token(key, name),
+            "access_token": self.create_token(key, name, admin_id, ttl),
             "type": "bearer",
+            "expires_in": int(ttl),
+            "id": admin_id,
         }
@@ -0,0 +1,76 @@
+import json
+from typing import Optional, Tuple
+
+from sqlalchemy import Table, select, func, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+TOTAL_EXACT = 'exact'
+TOTAL_ESTIMATE = 'estimate'
+TOTAL_NONE = 'none'
+TOTAL_AUTO = 'auto'
+
+
+async def exact_count(conn: AsyncConnection, table: Table, *conditions) -> int:
+    """
+    ``count(*)`` of the rows matching the conditions
+    :param conn:
+    :param table:
+    :param conditions:
+    :return:
+    """
+    return (await conn.execute(select(func.count()).select_from(table).where(*conditions))).scalar()
+
+
+async def estimated_count(conn: AsyncConnection, table: Table, *conditions) -> Optional[int]:
+    """
+    Row count guessed by the planner: ``pg_class.reltuples`` of the table when
+    there is no condition, the rows of the ``EXPLAIN`` plan otherwise
+    :param conn:
+    :param table:
+    :param conditions:
+    :return: ``None`` when there is no estimate, e.g. the table was never analyzed
+    """
+    if conn.dialect.name != 'postgresql':
+        return None
+
+    if not conditions:
+        reltuples = (await conn.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": table.name}
+        )).scalar()
+        return int(reltuples) if reltuples is not None and reltuples >= 0 else None
+
+    # named binds so the filter values are passed as parameters of the EXPLAIN
+    query = select(table.c.id).where(*conditions).compile(dialect=postgresql.dialect(paramstyle='named'))
+    plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), query.params)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+async def count_total(conn: AsyncConnection, table: Table, *conditions, mode: str = TOTAL_AUTO,
+                      exact_threshold: int = 0) -> Tuple[Optional[int], str]:
+    """
+    Total of a listing according to the requested mode.
+
+    ``auto`` counts exactly while the planner expects at most
+    ``exact_threshold`` rows and keeps the estimate above, so a count never
+    scans a large table. An estimate falls back to an exact count when the
+    planner has none.
+    :param conn:
+    :param table:
+    :param conditions: filters of the listing
+    :param mode: ``exact``, ``estimate``, ``none`` or ``auto``
+    :param exact_threshold:
+    :return: total and whether it is ``exact``, an ``estimate`` or ``none``
+    """
+    if mode == TOTAL_NONE:
+        return None, TOTAL_NONE
+
+    if mode != TOTAL_EXACT:
+        estimate = await estimated_count(conn, table, *conditions)
+        if estimate is not None and (mode == TOTAL_ESTIMATE or estimate > exact_threshold):
+            return estimate, TOTAL_ESTIMATE
+
+    return await exact_count(conn, table, *conditions), TOTAL_EXACT
@@ -1,3 +1,5 @@
+from sqlalchemy.dialects.postgresql import insert
+
 from api.config import cfg
 from core.db import engine
 from models.admin import AdminModel
@@ -12,10 +14,13 @@ async def main():
         hasher = PasswordHasher(BasicSalt(cfg.password.salt))
         password_hash = hasher.hash('admin')
         uuid = generate_uuid_from_username('admin')
-        query =  AdminModel.insert().values(
+        # runs on every start of the stack, keep an existing admin as is
+        query =  insert(AdminModel).values(
             name='admin',
             password=password_hash,
             uuid=uuid
+        ).on_conflict_do_nothing(
+            index_elements=[AdminModel.c.name]
         )
 
         return await conn.execute(query)
@@ -1,25 +1,30 @@
 import asyncio
 from core.db import meta, engine
+from migrations.runner import migrate, SchemaMigrationsModel
+# every table must be registered on ``meta`` for ``drop_all`` to see it
 from models.admin import AdminModel
 from models.groups import GroupModel
 from models.ioc import IocModel
 from models.hosts import HostModel
 from models.blocked import BlockedModel
 from models.log import LogsModel
+from models.block_journal import BlockJournalModel
+from models.ioc_enrichment import IocEnrichmentModel
+from models.dashboard_stats import DashboardStatsModel
+from models.whitelists import WhitelistModel
 
 async def main():
+    """
+    Reset a development database: drop every table, then build the schema
+    again with the migrations. Production databases are upgraded with
+    ``python -m migrations.runner``, which never drops anything
+    """
     async with engine.begin() as conn:
 
         await conn.run_sync(meta.drop_all)
-        await conn.run_sync(meta.create_all, tables=[
-            AdminModel,
-            GroupModel,
-            IocModel,
-            HostModel,
-            BlockedModel,
-            LogsModel
-        ] )
+        await conn.run_sync(SchemaMigrationsModel.metadata.drop_all)
 
+    await migrate(engine)
     await engine.dispose()
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+"""
+Versioned, forward-only schema migrations.
+
+Every module of ``migrations.versions`` is one migration, applied once in
+name order and recorded in ``schema_migrations``. A migration defines
+``async def upgrade(conn)`` and runs in its own transaction, unless it sets
+``TRANSACTIONAL = False`` (``CREATE INDEX CONCURRENTLY`` can not run in a
+transaction), then it runs in autocommit and must be safe to run again.
+Migrations never drop data and there is no downgrade, a bad migration is
+fixed by a new one.
+
+    python -m migrations.runner
+"""
+import asyncio
+import importlib
+import logging
+import pkgutil
+from types import ModuleType
+from typing import List
+
+from sqlalchemy import Table, MetaData, Column, Unicode, DateTime, select, func, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_PACKAGE = 'migrations.versions'
+
+# pg_advisory_lock key, one runner at a time when several containers start
+LOCK_KEY = 0x6d6967726174
+
+SchemaMigrationsModel = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Unicode(100), primary_key=True),
+    Column('applied_at', DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+
+def discover() -> List[ModuleType]:
+    """
+    Migration modules in the order they apply
+    :return:
+    """
+    package = importlib.import_module(VERSIONS_PACKAGE)
+    names = sorted(info.name for info in pkgutil.iter_modules(package.__path__))
+    return [importlib.import_module(f"{VERSIONS_PACKAGE}.{name}") for name in names]
+
+
+def version_of(module: ModuleType) -> str:
+    return module.__name__.rsplit('.', 1)[-1]
+
+
+async def create_index_concurrently(conn: AsyncConnection, name: str, definition: str, unique: bool = False) -> None:
+    """
+    Build an index without blocking writes, a leftover invalid index of an
+    interrupted build is dropped and built again
+    :param conn: connection in autocommit
+    :param name: index name
+    :param definition: what follows ``ON``, e.g. ``iocs (hostname, id)``
+    :param unique: build a unique index
+    :return:
+    """
+    valid = (await conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    )).scalar()
+    if valid:
+        return
+    if valid is not None:
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    await conn.execute(text(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+
+async def migrate(engine: AsyncEngine) -> List[str]:
+    """
+    Apply the pending migrations
+    :param engine:
+    :return: versions applied by this run
+    """
+    applied_now = []
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(select(func.pg_advisory_lock(LOCK_KEY)))
+        try:
+            await conn.run_sync(SchemaMigrationsModel.metadata.create_all)
+            applied = set((await conn.execute(select(SchemaMigrationsModel.c.version))).scalars())
+
+            for module in discover():
+                version = version_of(module)
+                if version in applied:
+                    continue
+
+                logger.info("applying migration %s", version)
+                if getattr(module, 'TRANSACTIONAL', True):
+                    async with engine.begin() as tx:
+                        await module.upgrade(tx)
+                        await tx.execute(SchemaMigrationsModel.insert().values(version=version))
+                else:
+                    await module.upgrade(conn)
+                    await conn.execute(SchemaMigrationsModel.insert().values(version=version))
+                applied_now.append(version)
+        finally:
+            await conn.execute(select(func.pg_advisory_unlock(LOCK_KEY)))
+
+    return applied_now
+
+
+async def main():
+    from core.db import engine
+
+    try:
+        for version in await migrate(engine):
+            print(f"applied {version}")
+    finally:
+        await engine.dispose()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
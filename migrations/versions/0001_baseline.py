@@ -0,0 +1,114 @@
+"""
+Tables of the application, only the missing ones are created.
+
+The DDL is written out so this migration keeps creating the same schema
+whatever the models become, later changes go in their own migration: the
+``iocs`` unique key comes with 0002, the listing indexes with 0003.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS admin (
+        id BIGSERIAL NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        password VARCHAR(250) NOT NULL,
+        uuid UUID NOT NULL,
+        level VARCHAR(20),
+        api_key VARCHAR(250),
+        PRIMARY KEY (id, uuid),
+        UNIQUE (name),
+        UNIQUE (api_key)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS groups (
+        id BIGSERIAL NOT NULL,
+        groups VARCHAR(100) NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (groups)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS iocs (
+        id BIGSERIAL NOT NULL,
+        ip_address VARCHAR(100),
+        is_process BOOLEAN,
+        comment TEXT,
+        hostname VARCHAR(100),
+        counter BIGINT,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hosts (
+        id BIGSERIAL NOT NULL,
+        ip_address VARCHAR(100) NOT NULL,
+        hostname VARCHAR(100) NOT NULL,
+        groups BIGINT NOT NULL,
+        os VARCHAR(250) NOT NULL,
+        version_agent VARCHAR(250),
+        PRIMARY KEY (id, os),
+        UNIQUE (ip_address),
+        UNIQUE (hostname),
+        FOREIGN KEY (groups) REFERENCES groups (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS block (
+        id BIGSERIAL NOT NULL,
+        mal_ip VARCHAR(100) NOT NULL,
+        hostname VARCHAR(100) NOT NULL,
+        is_blocked BOOLEAN NOT NULL,
+        executed_time BIGINT,
+        PRIMARY KEY (id),
+        UNIQUE (mal_ip)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS activity_log (
+        id BIGSERIAL NOT NULL,
+        activity VARCHAR(100) NOT NULL,
+        PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS block_journal (
+        seq BIGSERIAL NOT NULL,
+        mal_ip VARCHAR(100) NOT NULL,
+        hostname VARCHAR(100) NOT NULL,
+        op VARCHAR(10) NOT NULL,
+        is_blocked BOOLEAN,
+        PRIMARY KEY (seq)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_block_journal_hostname_seq ON block_journal (hostname, seq)",
+    """
+    CREATE TABLE IF NOT EXISTS ioc_enrichment (
+        ip_address VARCHAR(100) NOT NULL,
+        labels JSON,
+        abuse_score INTEGER,
+        sightings BIGINT NOT NULL,
+        refreshed_at TIMESTAMP WITH TIME ZONE,
+        leased_until TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (ip_address)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_ioc_enrichment_refreshed_at ON ioc_enrichment (refreshed_at ASC NULLS FIRST)",
+    """
+    CREATE TABLE IF NOT EXISTS dashboard_stats (
+        id SMALLINT NOT NULL,
+        connected_agents BIGINT NOT NULL,
+        blocked_ips BIGINT NOT NULL,
+        active_alerts BIGINT NOT NULL,
+        reconciled_at TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (id)
+    )
+    """,
+]
+
+
+async def upgrade(conn: AsyncConnection):
+    for statement in STATEMENTS:
+        await conn.execute(text(statement))
@@ -0,0 +1,43 @@
+"""
+Merge duplicated (ip_address, hostname) iocs into the oldest row, summing
+their counters, then add the unique key used by the ioc upsert.
+
+The unique index is built concurrently and then attached as the constraint,
+so writes to ``iocs`` are only blocked for the short ``ALTER TABLE``. A
+duplicate inserted while the index builds fails the build, running the
+migration again merges it and builds the index again.
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from migrations.runner import create_index_concurrently
+
+TRANSACTIONAL = False
+
+NAME = 'uq_iocs_ip_address_hostname'
+
+
+async def upgrade(conn: AsyncConnection):
+    exists = (await conn.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass('iocs') AND conname = :name"
+    ), {"name": NAME})).scalar()
+    if exists:
+        return
+
+    await conn.execute(text("""
+        WITH ranked AS (
+            SELECT id,
+                   min(id) OVER (PARTITION BY ip_address, hostname) AS keep_id,
+                   sum(counter) OVER (PARTITION BY ip_address, hostname) AS total
+            FROM iocs
+            WHERE ip_address IS NOT NULL AND hostname IS NOT NULL
+        ), merged AS (
+            UPDATE iocs SET counter = ranked.total
+            FROM ranked
+            WHERE iocs.id = ranked.keep_id AND ranked.id = ranked.keep_id
+        )
+        DELETE FROM iocs USING ranked
+        WHERE iocs.id = ranked.id AND ranked.id <> ranked.keep_id
+    """))
+    await create_index_concurrently(conn, NAME, "iocs (ip_address, hostname)", unique=True)
+    await conn.execute(text(f"ALTER TABLE iocs ADD CONSTRAINT {NAME} UNIQUE USING INDEX {NAME}"))
@@ -0,0 +1,23 @@
+"""
+Indexes of the listing, agent and dashboard queries, built concurrently.
+
+- ``iocs (hostname, id)``: list-ioc by host, newest first and by cursor
+- ``iocs (id) WHERE is_process = false``: unprocessed iocs, active alerts
+- ``block (hostname, id)``: list-mal-ip and agent blocklists by host
+- ``block (is_blocked, id)``: list-mal-ip by status, blocked ips count
+
+``iocs.ip_address`` lookups use the ``(ip_address, hostname)`` unique key and
+``block.mal_ip`` its unique key.
+"""
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from migrations.runner import create_index_concurrently
+
+TRANSACTIONAL = False
+
+
+async def upgrade(conn: AsyncConnection):
+    await create_index_concurrently(conn, 'ix_iocs_hostname_id', "iocs (hostname, id)")
+    await create_index_concurrently(conn, 'ix_iocs_unprocessed_id', "iocs (id) WHERE is_process = false")
+    await create_index_concurrently(conn, 'ix_block_hostname_id', "block (hostname, id)")
+    await create_index_concurrently(conn, 'ix_block_is_blocked_id', "block (is_blocked, id)")
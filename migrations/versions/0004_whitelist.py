@@ -0,0 +1,16 @@
+"""
+Whitelist of ips and networks that can not be reported or blocked
+"""
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+async def upgrade(conn: AsyncConnection):
+    await conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS whitelist (
+            id BIGSERIAL NOT NULL,
+            ip VARCHAR(100) NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (ip)
+        )
+    """))
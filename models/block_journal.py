@@ -0,0 +1,13 @@
+from sqlalchemy import Table, Column, BigInteger, Unicode, Boolean, Index
+
+from core.db import meta
+
+BlockJournalModel = Table(
+    'block_journal', meta,
+    Column('seq', BigInteger, primary_key=True, autoincrement=True),
+    Column('mal_ip', Unicode(100), nullable=False, unique=False),
+    Column('hostname', Unicode(100), nullable=False, unique=False),
+    Column('op', Unicode(10), nullable=False),
+    Column('is_blocked', Boolean, nullable=True),
+    Index('ix_block_journal_hostname_seq', 'hostname', 'seq'),
+)
@@ -1,4 +1,4 @@
-from sqlalchemy import Table, Column, BigInteger, Unicode, Boolean
+from sqlalchemy import Table, Column, BigInteger, Unicode, Boolean, Index
 
 from core.db import meta
 
@@ -9,5 +9,7 @@ BlockedModel = Table(
     Column('hostname', Unicode(100), nullable=False, unique=False),
     Column('is_blocked', Boolean, nullable=False, default=False),
     Column('executed_time', BigInteger, nullable=True),
+    Index('ix_block_hostname_id', 'hostname', 'id'),
+    Index('ix_block_is_blocked_id', 'is_blocked', 'id'),
 
 )
@@ -0,0 +1,12 @@
+from sqlalchemy import Table, Column, BigInteger, SmallInteger, DateTime
+
+from core.db import meta
+
+DashboardStatsModel = Table(
+    'dashboard_stats', meta,
+    Column('id', SmallInteger, primary_key=True, autoincrement=False),
+    Column('connected_agents', BigInteger, nullable=False, default=0),
+    Column('blocked_ips', BigInteger, nullable=False, default=0),
+    Column('active_alerts', BigInteger, nullable=False, default=0),
+    Column('reconciled_at', DateTime(timezone=True), nullable=True),
+)
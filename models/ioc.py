@@ -1,4 +1,5 @@
-from sqlalchemy import Table, Column, BigInteger, Unicode, DateTime, ForeignKey, Text, Boolean, UUID, String
+from sqlalchemy import Table, Column, BigInteger, Unicode, DateTime, ForeignKey, Text, Boolean, UUID, String, \
+    UniqueConstraint, Index
 
 from core.db import meta
 
@@ -10,4 +11,8 @@ IocModel = Table(
     Column('comment', Text, nullable=True, unique=False),
     Column('hostname', Unicode(100), nullable=True, unique=False),
     Column('counter', BigInteger, nullable=True, unique=False),
+    UniqueConstraint('ip_address', 'hostname', name='uq_iocs_ip_address_hostname'),
+    Index('ix_iocs_hostname_id', 'hostname', 'id'),
 )
+
+Index('ix_iocs_unprocessed_id', IocModel.c.id, postgresql_where=IocModel.c.is_process == False)
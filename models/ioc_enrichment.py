@@ -0,0 +1,16 @@
+from sqlalchemy import Table, Column, BigInteger, Unicode, DateTime, Integer, JSON, Index
+
+from core.db import meta
+
+IocEnrichmentModel = Table(
+    'ioc_enrichment', meta,
+    Column('ip_address', Unicode(100), primary_key=True),
+    Column('labels', JSON, nullable=True),
+    Column('abuse_score', Integer, nullable=True),
+    Column('sightings', BigInteger, nullable=False, default=0),
+    Column('refreshed_at', DateTime(timezone=True), nullable=True),
+    Column('leased_until', DateTime(timezone=True), nullable=True),
+)
+
+# due rows are claimed oldest first, never enriched ones before all others
+Index('ix_ioc_enrichment_refreshed_at', IocEnrichmentModel.c.refreshed_at.asc().nulls_first())
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional, List
 import attrs
 from pydantic import BaseModel, Field
@@ -20,11 +21,36 @@ class AdminRoleEnum(str, Enum):
     SUPERADMIN = 'superadmin'
     ADMIN = 'admin'
 
-@attrs.define(slots=False)
+class AggregateModeEnum(str, Enum):
+    """
+    Enum for how a blocklist is collapsed into cidrs
+    """
+    EXACT = 'exact'
+    LOSSY = 'lossy'
+
+class ExportFormatEnum(str, Enum):
+    """
+    Enum for the format a blocklist is exported in
+    """
+    JSON = 'json'
+    IPSET = 'ipset'
+    NFT = 'nft'
+    BINARY = 'binary'
+
+class TotalModeEnum(str, Enum):
+    """
+    Enum for how the total of a listing is counted
+    """
+    EXACT = 'exact'
+    ESTIMATE = 'estimate'
+    NONE = 'none'
+    AUTO = 'auto'
+
+@attrs.define
 class ApikeyResponseSchema:
     apikey: str = attrs.field()
 
-@attrs.define(slots=False)
+@attrs.define
 class ListingHostsResponseSchema:
     """
     Class For Listing Hosts Response Schema
@@ -37,7 +63,7 @@ class ListingHostsResponseSchema:
     group_id: int = attrs.field()
     group_name: str = attrs.field()
 
-@attrs.define(slots=False)
+@attrs.define
 class ListMalIpResponseSchema:
     """
     Class For Add Host Schema
@@ -47,27 +73,52 @@ class ListMalIpResponseSchema:
     hostname: str = attrs.field()
     executed_time: BigInteger = attrs.field()
 
-@attrs.define(slots=False)
+@attrs.define
+class BlocklistDeltaResponseSchema:
+    """
+    Changes of a host blocklist after a cursor
+    """
+    cursor: int = attrs.field()
+    full: bool = attrs.field()
+    added: List[ListMalIpResponseSchema] = attrs.field()
+    removed: List[str] = attrs.field()
+
+@attrs.define
+class AggregatedBlocklistResponseSchema:
+    """
+    Host blocklist collapsed into cidrs
+    """
+    cursor: int = attrs.field()
+    mode: str = attrs.field()
+    coverage: Optional[float] = attrs.field()
+    addresses: int = attrs.field()
+    prefixes: List[str] = attrs.field()
+
+@attrs.define
 class ListingMalIpResponseSchemaPaginate:
     """
     Listing ip paginate
     """
     page: int = attrs.field()
     per_page: int = attrs.field()
-    total: int = attrs.field()
+    total: Optional[int] = attrs.field()
     data: List[ListMalIpResponseSchema] = attrs.field()
+    next_cursor: Optional[str] = attrs.field(default=None)
+    total_kind: str = attrs.field(default='exact')
 
 
-@attrs.define(slots=False)
+@attrs.define
 class GeneralPaginationResponseSchema:
     """
     Class For Add Host Schema
     """
-    total: int = attrs.field()
+    total: Optional[int] = attrs.field()
     page: int = attrs.field()
     per_page: int = attrs.field()
+    next_cursor: Optional[str] = attrs.field(default=None)
+    total_kind: str = attrs.field(default='exact')
 
-@attrs.define(slots=False)
+@attrs.define
 class ListingIocResponseSchema:
     """
     Class For Add Host Schema
@@ -78,9 +129,19 @@ class ListingIocResponseSchema:
     is_process: bool = attrs.field()
     comment: str = attrs.field()
     counter: int = attrs.field()
+    labels: Optional[list] = attrs.field(default=None)
+    abuse_score: Optional[int] = attrs.field(default=None)
+    enriched_at: Optional[datetime] = attrs.field(default=None)
+
+@attrs.define
+class ListingIocResponseSchemaPaginate:
+    """
+    Listing ioc paginate
+    """
     pagination: GeneralPaginationResponseSchema = attrs.field()
+    data: List[ListingIocResponseSchema] = attrs.field()
 
-@attrs.define(slots=False)
+@attrs.define
 class ReportResponseSchema:
     """
     Class For Report Response Schema
@@ -97,7 +158,39 @@ class UpdateAdminSchema(BaseModel):
     name: Optional[str] = Field(None)
     password: Optional[str] = Field(None)
 
-@attrs.define(slots=False)
+class IocIngestSchema(BaseModel):
+    """
+    Class For One Item of Batch Ioc Ingestion
+    """
+    ip: str = Field(...)
+    hostname: str = Field(...)
+    comment: Optional[str] = Field(None)
+
+class WhitelistSchema(BaseModel):
+    """
+    Class For Schema Whitelist Entries
+    """
+    entries: List[str] = Field(..., min_length=1)
+
+class BulkEnrichSchema(BaseModel):
+    """
+    Class For Schema Bulk Enrichment
+    """
+    ips: List[str] = Field(..., min_length=1)
+
+@attrs.define
+class IocIngestResultSchema:
+    """
+    Result of One Item of Batch Ioc Ingestion
+    """
+    index: int = attrs.field()
+    status: str = attrs.field()
+    ip: Optional[str] = attrs.field(default=None)
+    hostname: Optional[str] = attrs.field(default=None)
+    id: Optional[int] = attrs.field(default=None)
+    error: Optional[str] = attrs.field(default=None)
+
+@attrs.define
 class ReadAdminSchema:
     """
     Class For Schema Admin Login
@@ -106,7 +199,7 @@ class ReadAdminSchema:
     name: str = attrs.field()
     apikey: str = attrs.field()
 
-@attrs.define(slots=False)
+@attrs.define
 class LogResponseSchema:
     """
     Class For Schema Admin Login
@@ -114,7 +207,7 @@ class LogResponseSchema:
     id: int = attrs.field()
     activity: str = attrs.field()
 
-@attrs.define(slots=False)
+@attrs.define
 class LogActivity:
     """
     Class For Schema Admin Login
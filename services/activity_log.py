@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+
+import attrs
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from api.config import cfg
+from core.db import engine, after_commit
+from models.log import LogsModel
+
+logger = logging.getLogger(__name__)
+
+MODE_ASYNC = 'async'
+MODE_SYNC = 'sync'
+
+ACTIVITY_LENGTH = LogsModel.c.activity.type.length
+
+
+@attrs.define
+class ActivityLogSink:
+    """
+    Activity log writer.
+
+    In async mode records are queued when the request transaction commits and
+    written in bulk with ``COPY`` by a background loop, so logging costs the
+    request nothing. A full queue falls back to a plain insert in the request
+    transaction, records are never dropped. Sync mode always inserts in the
+    request transaction, which is what tests want.
+    """
+    engine: AsyncEngine
+    mode: str
+    queue_size: int
+    batch_size: int
+    flush_interval: float
+    written: int = attrs.field(default=0, init=False)
+    inline: int = attrs.field(default=0, init=False)
+    _queue: deque = attrs.field(factory=deque, init=False)
+    _wake: Optional[asyncio.Event] = attrs.field(default=None, init=False)
+    _task: Optional[asyncio.Task] = attrs.field(default=None, init=False)
+    _stopping: bool = attrs.field(default=False, init=False)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    async def record(self, conn: AsyncConnection, *activities: str) -> None:
+        """
+        Log activities of the current transaction
+        :param conn: connection of the request
+        :param activities:
+        :return:
+        """
+        activities = [activity[:ACTIVITY_LENGTH] for activity in activities]
+        if not activities:
+            return
+
+        # the queue may overshoot by what open transactions still hold, which
+        # is bounded by the pool size
+        if (self.mode == MODE_SYNC or not self.running or not conn.in_transaction()
+                or len(self._queue) >= self.queue_size):
+            self.inline += len(activities)
+            await conn.execute(LogsModel.insert().values([
+                {"activity": activity} for activity in activities
+            ]))
+            return
+
+        after_commit(conn, lambda: self._enqueue(activities))
+
+    def _enqueue(self, activities) -> None:
+        self._queue.extend(activities)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self) -> None:
+        """
+        Write everything queued so far
+        :return:
+        """
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await self._write(batch)
+            except Exception:
+                logger.exception("cannot write %d activity log, retrying on next flush", len(batch))
+                self._queue.extendleft(reversed(batch))
+                return
+            self.written += len(batch)
+
+    async def _write(self, batch) -> None:
+        async with self.engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            if hasattr(driver, 'copy_records_to_table'):
+                await driver.copy_records_to_table(
+                    LogsModel.name, records=[(activity,) for activity in batch], columns=['activity']
+                )
+                return
+            await conn.execute(LogsModel.insert(), [{"activity": activity} for activity in batch])
+            await conn.commit()
+
+    def start(self) -> None:
+        """
+        Start the background writer
+        :return:
+        """
+        if self.mode == MODE_ASYNC and self._task is None:
+            self._wake = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name='activity-log')
+
+    async def stop(self) -> None:
+        """
+        Stop queueing and write what is left
+        :return:
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+        await self.flush()
+
+    def stats(self) -> dict:
+        """
+        Counters of the sink
+        :return:
+        """
+        return {
+            "mode": self.mode,
+            "running": self.running,
+            "queued": len(self._queue),
+            "written": self.written,
+            "inline": self.inline,
+        }
+
+
+activity_log = ActivityLogSink(
+    engine=engine,
+    mode=cfg.activity_log.mode,
+    queue_size=cfg.activity_log.queue_size,
+    batch_size=cfg.activity_log.batch_size,
+    flush_interval=cfg.activity_log.flush_ms / 1000,
+)
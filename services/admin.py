@@ -1,20 +1,24 @@
 import secrets
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 import attrs
-from sqlalchemy import select, func
+from sqlalchemy import select, func, Row
 from sqlalchemy.ext.asyncio import AsyncConnection
-from models.log import LogsModel
 from api.config import cfg
 from exceptions import AdminPasswordError, GroupNotFoundError
-from helpers.authentication import PasswordHasher, BasicSalt
+from services.passwords import HashingPool
+from helpers.cache import MISSING
+from helpers.pagination import paginate, split_page
+from helpers.totals import count_total
 from models.admin import AdminModel
-from models.blocked import BlockedModel
 from models.hosts import HostModel
 from models.groups import GroupModel
-from models.ioc import IocModel
+from models.log import LogsModel
 from schemas.admin import ApikeyResponseSchema, ListingHostsResponseSchema, ReportResponseSchema, UpdateAdminSchema, \
     ReadAdminSchema, LogResponseSchema, GeneralPaginationResponseSchema, LogActivity
+from services.activity_log import activity_log
+from services.credentials import apikey_resolver, admin_identity
+from services.stats import DashboardStats, report_cache, STATS_ID
 
 
 @attrs.define
@@ -24,17 +28,15 @@ class AdminRead:
     """
     conn: AsyncConnection
 
-    async def login(self, data: dict, hasher: PasswordHasher) -> str:
+    async def read_login(self, username: str) -> Optional[Row]:
         """
-        Method for login
-        :param data:
-        :param hasher:
-        :return:
+        Get password hash, uuid and id of an admin
+        :param username:
+        :return: ``None`` when no admin has this name
         """
-        username = data['name']
-        password = data['password']
         query = (
             select(
+                AdminModel.c.id,
                 AdminModel.c.password,
                 AdminModel.c.name,
                 AdminModel.c.uuid
@@ -45,13 +47,23 @@ class AdminRead:
             AdminModel.c.name == username
         )
 
-        result = (await self.conn.execute(query)).first()
+        return (await self.conn.execute(query)).first()
 
-        if not hasher.verify(password, result.password):
+    async def login(self, data: dict, credentials: Optional[Row], hasher: HashingPool) -> Tuple[str, int]:
+        """
+        Method for login, the password is checked without a database
+        connection so none is held while bcrypt runs
+        :param data:
+        :param credentials: row of ``read_login``
+        :param hasher:
+        :return: uuid and id of the admin
+        :raises HashingBusyError: too many logins are pending
+        """
+        password = data['password']
+        if credentials is None or not await hasher.verify(password, credentials.password):
             raise AdminPasswordError
 
-
-        return str(result.uuid)
+        return str(credentials.uuid), credentials.id
 
     async def generate_apikey(self, admin_id: int) -> str:
         """
@@ -71,9 +83,20 @@ class AdminRead:
         """
         try:
             apikey = secrets.token_urlsafe(32)
+            _get_old_apikey = select(
+                AdminModel.c.api_key
+            ).select_from(
+                AdminModel
+            ).where(
+                AdminModel.c.id == admin_id
+            )
+            old_apikey = (await self.conn.execute(_get_old_apikey)).scalar()
+
             query = AdminModel.update().where(AdminModel.c.id == admin_id).values(api_key=apikey)
 
             await self.conn.execute(query)
+            # the old key must stop working on every worker, not when its cache entry expires
+            await apikey_resolver.revoke(self.conn, old_apikey, apikey)
             _get_name_admin = select(
                 AdminModel.c.name
             ).select_from(
@@ -83,11 +106,7 @@ class AdminRead:
             )
 
             name = (await self.conn.execute(_get_name_admin)).first().name
-            query = LogsModel.insert().values(
-                activity=f"Gnerated New API Key by {name}"
-            )
-
-            await self.conn.execute(query)
+            await activity_log.record(self.conn, f"Gnerated New API Key by {name}")
 
             return apikey
         except Exception as e:
@@ -130,18 +149,7 @@ class AdminRead:
         :rtype: bool
         """
 
-        query = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-
-        result = (await self.conn.execute(query)).scalar()
-        if result == 0:
-            return False
-        return True
+        return await apikey_resolver.is_valid(self.conn, apikey)
 
     async def read_by_name(self, name: str):
         """
@@ -177,11 +185,7 @@ class AdminRead:
             groups=name
         )
 
-        query_log = LogsModel.insert().values(
-            activity=f"Added New Group {name}"
-        )
-
-        await self.conn.execute(query_log)
+        await activity_log.record(self.conn, f"Added New Group {name}")
 
 
         return (await self.conn.execute(query)).inserted_primary_key[0]
@@ -227,16 +231,7 @@ class AdminRead:
         :return: A boolean value indicating whether the host was successfully
             added or not.
         """
-        query = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-
-        result = (await self.conn.execute(query)).scalar()
-        if result == 0:
+        if not await apikey_resolver.is_valid(self.conn, apikey):
             return False
 
         _query_get_id_group = select(
@@ -260,13 +255,10 @@ class AdminRead:
             version_agent=version_agent
         )
         _id = (await self.conn.execute(query)).inserted_primary_key[0]
+        await DashboardStats(self.conn).add(connected_agents=1)
+        await activity_log.record(self.conn, f"Added New Host {hostname}")
         await self.conn.commit()
 
-        query_log = LogsModel.insert().values(
-            activity=f"Added New Host {hostname}"
-        )
-
-        await self.conn.execute(query_log)
         return _id
 
     async def check_cred(self, apikey: str, hostname: str) -> bool:
@@ -276,16 +268,7 @@ class AdminRead:
         :param hostname:
         :return:
         """
-        query = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-
-        result = (await self.conn.execute(query)).scalar()
-        if result == 0:
+        if not await apikey_resolver.is_valid(self.conn, apikey):
             return False
 
         query = select(
@@ -307,61 +290,51 @@ class AdminRead:
         Counting report
         :return:
         """
+        report = report_cache.get(STATS_ID)
+        if report is not MISSING:
+            return report
 
-        query = select(
-            func.count(HostModel.c.id)
-        ).select_from(
-            HostModel
-        )
-
-        total_host = (await self.conn.execute(query)).scalar()
-
-        query = select(
-            func.count(BlockedModel.c.id)
-        ).select_from(
-            BlockedModel
-        ).where(
-            BlockedModel.c.is_blocked == True
-        )
-
-        total_blocked = (await self.conn.execute(query)).scalar()
+        stats = DashboardStats(self.conn)
+        report = await stats.read()
+        if report is None:
+            await stats.reconcile()
+            report = await stats.read()
 
-        query = select(
-            func.count(IocModel.c.id)
-        ).select_from(
-            IocModel
-        ).where(
-            IocModel.c.is_process == False
-        )
+        report_cache.set(STATS_ID, report)
+        return report
 
-        total_alerts = (await self.conn.execute(query)).scalar()
-
-        return ReportResponseSchema(
-            connected_agents=total_host,
-            blocked_ips=total_blocked,
-            active_alerts=total_alerts,
-        )
-
-    async def update_me(self,id: int, data: UpdateAdminSchema):
+    async def prepare_update(self, data: UpdateAdminSchema, hasher: HashingPool) -> dict:
         """
-        Update admin
+        Values of an admin update, the password is hashed without a database
+        connection so none is held while bcrypt runs
         :param data:
+        :param hasher:
         :return:
-
+        :raises HashingBusyError: too many password changes are pending
         """
         data = data.__dict__
 
         #remove key when none or empty
         data = {k: v for k, v in data.items() if v is not None and v != ''}
         if 'password' in data:
-            hasher = PasswordHasher(BasicSalt(cfg.password.salt))
-            data['password'] = hasher.hash(data['password'])
+            data['password'] = await hasher.hash(data['password'])
+
+        return data
+
+    async def update_me(self, id: int, data: dict):
+        """
+        Update admin
+        :param id:
+        :param data: values of ``prepare_update``
+        :return:
 
+        """
         query = AdminModel.update().where(AdminModel.c.id == id).values(
             **data
         )
 
         await self.conn.execute(query)
+        await admin_identity.revoke(self.conn, id)
         await self.conn.commit()
         return True
 
@@ -388,9 +361,11 @@ class AdminRead:
             apikey=data.api_key
         )
 
-    async def list_log(self, page: Optional[int] = 1, per_page: Optional[int] = 5) -> LogActivity:
+    async def list_log(self, page: Optional[int] = 1, per_page: Optional[int] = 5, cursor: Optional[str] = None, total_mode: Optional[str] = None) -> LogActivity:
         """
         List all logs
+        :param cursor: ``next_cursor`` of the previous page, replaces ``page``
+        :param total_mode: how the total is counted, see ``count_total``
         :return:
         """
         query = (
@@ -401,20 +376,15 @@ class AdminRead:
                 LogsModel
             )
         )
-        query = query.order_by(LogsModel.c.id.desc())
+        query = paginate(query, LogsModel.c.id, page, per_page, cursor)
 
-        _query_total = select(
-            func.count(LogsModel.c.id)
-        ).select_from(
-            LogsModel
+        total, total_kind = await count_total(
+            self.conn, LogsModel,
+            mode=total_mode or cfg.totals.mode, exact_threshold=cfg.totals.exact_threshold
         )
 
-        query = query.limit(per_page).offset((page - 1) * per_page)
-
-        total = (await self.conn.execute(_query_total)).scalar()
-
 
-        data = (await self.conn.execute(query)).fetchall()
+        data, next_cursor = split_page((await self.conn.execute(query)).fetchall(), per_page)
 
 
 
@@ -422,7 +392,9 @@ class AdminRead:
             pagination=GeneralPaginationResponseSchema(
                 total=total,
                 page=page,
-                per_page=per_page
+                per_page=per_page,
+                next_cursor=next_cursor,
+                total_kind=total_kind
             ),
             data=[LogResponseSchema(
                 id=log.id,
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import attrs
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.config import cfg
+from helpers.cache import TTLCache, MISSING
+from helpers.cidr import aggregate
+from models.blocked import BlockedModel
+from schemas.admin import AggregatedBlocklistResponseSchema, AggregateModeEnum
+from services.journal import BlockJournal
+from services.whitelist import whitelist_index
+
+
+@attrs.define
+class BlocklistAggregator:
+    """
+    Host blocklists collapsed into cidrs, memoized per blocklist version.
+
+    Every change of a host blocklist adds a journal entry, so the journal head
+    together with the whitelist version identifies what a collapse would
+    return. Agents polling an unchanged blocklist only cost the head lookup,
+    the rows are read and collapsed once per version on the default executor
+    so a large list does not stall the event loop. A head of 0 is also read
+    once every journal entry of a host is pruned, it is not a version and
+    such results are not memoized.
+    """
+    cache: TTLCache
+    min_prefixlen: Dict[int, int]
+    default_coverage: float
+    computed: int = attrs.field(default=0, init=False)
+
+    async def version(self, conn: AsyncConnection, hostname: str, is_blocked: Optional[bool],
+                      mode: AggregateModeEnum, coverage: Optional[float] = None) -> Tuple:
+        """
+        Key of what ``aggregated`` returns, it only moves when the output may change
+        :param conn:
+        :param hostname:
+        :param is_blocked:
+        :param mode:
+        :param coverage:
+        :return: (hostname, is_blocked, journal head, whitelist version, coverage)
+        :raises ValueError: coverage is not in ``(0, 100]``
+        """
+        if mode == AggregateModeEnum.EXACT:
+            coverage = None
+        else:
+            coverage = self.default_coverage if coverage is None else coverage
+            if not 0 < coverage <= 100:
+                raise ValueError("coverage must be in (0, 100]")
+
+        # head is read before the rows, a change committed in between only
+        # makes the next poll compute again
+        head = await BlockJournal(conn).head(hostname)
+        if coverage:
+            await whitelist_index.ensure_loaded(conn)
+        return hostname, is_blocked, head, whitelist_index.version if coverage else None, coverage
+
+    async def aggregated(self, conn: AsyncConnection, hostname: str, is_blocked: Optional[bool],
+                         mode: AggregateModeEnum, coverage: Optional[float] = None,
+                         version: Optional[Tuple] = None) -> AggregatedBlocklistResponseSchema:
+        """
+        Blocklist of a host as cidrs
+        :param conn:
+        :param hostname:
+        :param is_blocked:
+        :param mode: ``exact`` keeps the same addresses, ``lossy`` also covers
+            the rest of a prefix once ``coverage`` percent of it is listed
+        :param coverage: percent, the configured default when omitted
+        :param version: result of ``version`` when the caller already read it
+        :return:
+        :raises ValueError: coverage is not in ``(0, 100]``
+        """
+        key = version or await self.version(conn, hostname, is_blocked, mode, coverage)
+        _, _, head, _, coverage = key
+        result = self.cache.get(key) if head else MISSING
+        if result is not MISSING:
+            return result
+        excluded = list(whitelist_index.trie) if coverage else []
+
+        query = select(BlockedModel.c.mal_ip).where(BlockedModel.c.hostname == hostname)
+        if is_blocked is not None:
+            query = query.where(BlockedModel.c.is_blocked == is_blocked)
+        addresses = (await conn.execute(query)).scalars().all()
+
+        loop = asyncio.get_running_loop()
+        prefixes = await loop.run_in_executor(
+            None, aggregate, addresses, (coverage or 100) / 100, excluded, self.min_prefixlen
+        )
+        self.computed += 1
+
+        result = AggregatedBlocklistResponseSchema(
+            cursor=head,
+            mode=mode.value,
+            coverage=coverage,
+            addresses=len(addresses),
+            prefixes=prefixes,
+        )
+        if head:
+            self.cache.set(key, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Counters of the aggregator
+        :return:
+        """
+        return {
+            "cache": self.cache.stats(),
+            "computed": self.computed,
+        }
+
+
+blocklist_aggregator = BlocklistAggregator(
+    cache=TTLCache(maxsize=cfg.aggregate.cache_size, ttl=cfg.aggregate.cache_ttl),
+    min_prefixlen={4: cfg.aggregate.min_prefix_v4, 6: cfg.aggregate.min_prefix_v6},
+    default_coverage=cfg.aggregate.coverage,
+)
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable
+
+import attrs
+
+from api.config import cfg
+from exceptions import CircuitOpenError, ReputationQuotaExceededError
+from helpers.circuit_breaker import CircuitBreaker
+from services.opencti import opencti_lookup
+from services.reputation import reputation_client
+
+
+@attrs.define
+class Provider:
+    """
+    Enrichment provider called by the bulk enricher
+    """
+    name: str
+    lookup: Callable[[str], Awaitable[Any]]
+    timeout: float
+    breaker: CircuitBreaker
+
+
+@attrs.define
+class BulkEnricher:
+    """
+    Enrich many ips at once.
+
+    Every ip is looked up on all providers concurrently, the number of ips in
+    flight is bounded by one semaphore shared by all requests of the worker.
+    Each provider call has its own timeout and goes through the provider's
+    circuit breaker, so a dead provider is reported right away instead of
+    being waited on for every ip.
+    """
+    providers: list
+    concurrency: int
+    _semaphore: asyncio.Semaphore = attrs.field(init=False)
+
+    def __attrs_post_init__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def _call(self, provider: Provider, ip_address: str) -> dict:
+        try:
+            result = await provider.breaker.call(
+                lambda: asyncio.wait_for(provider.lookup(ip_address), provider.timeout)
+            )
+        except CircuitOpenError:
+            return {"status": "unavailable", "error": "circuit open"}
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "error": f"no answer within {provider.timeout}s"}
+        except ReputationQuotaExceededError:
+            return {"status": "error", "error": "quota exceeded"}
+        except Exception as e:
+            return {"status": "error", "error": str(e) or type(e).__name__}
+        return {"status": "ok", "result": result}
+
+    async def _enrich_one(self, ip_address: str) -> dict:
+        async with self._semaphore:
+            results = await asyncio.gather(
+                *(self._call(provider, ip_address) for provider in self.providers)
+            )
+        item = {"ip": ip_address}
+        item.update({provider.name: result for provider, result in zip(self.providers, results)})
+        return item
+
+    async def enrich(self, ip_addresses: Iterable[str]) -> AsyncIterator[dict]:
+        """
+        Enrich ips, yielding the merged result of an ip as soon as it is done
+        :param ip_addresses:
+        :return:
+        """
+        tasks = [asyncio.create_task(self._enrich_one(ip)) for ip in dict.fromkeys(ip_addresses)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Breaker state per provider
+        :return:
+        """
+        return {provider.name: provider.breaker.stats() for provider in self.providers}
+
+
+bulk_enricher = BulkEnricher(
+    providers=[
+        Provider(
+            name="opencti",
+            lookup=opencti_lookup.labels,
+            timeout=cfg.bulk_enrich.opencti_timeout,
+            breaker=CircuitBreaker(
+                name="opencti",
+                failure_threshold=cfg.bulk_enrich.failure_threshold,
+                reset_timeout=cfg.bulk_enrich.reset_timeout,
+            ),
+        ),
+        Provider(
+            name="abuseipdb",
+            lookup=reputation_client.check,
+            timeout=cfg.bulk_enrich.abuseipdb_timeout,
+            breaker=CircuitBreaker(
+                name="abuseipdb",
+                failure_threshold=cfg.bulk_enrich.failure_threshold,
+                reset_timeout=cfg.bulk_enrich.reset_timeout,
+            ),
+        ),
+    ],
+    concurrency=cfg.bulk_enrich.concurrency,
+)
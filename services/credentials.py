@@ -0,0 +1,211 @@
+import json
+import uuid
+from typing import Optional
+
+import attrs
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.config import cfg
+from core.db import after_commit
+from core.statements import hot_statements
+from exceptions import AdminIsNotLoginError
+from helpers.cache import TTLCache, MISSING
+
+APIKEY_CHANNEL = 'apikey_revoked'
+ADMIN_CHANNEL = 'admin_revoked'
+
+
+@attrs.define
+class ApiKeyResolver:
+    """
+    Resolve agent API key to the admin owning it.
+
+    Valid keys are kept in ``valid``, unknown keys are remembered for a short
+    time in ``invalid`` so a flood of bad keys does not reach the database.
+    Both caches are bounded and separate, bad keys can not evict good ones.
+    """
+    valid: TTLCache
+    invalid: TTLCache
+
+    async def resolve(self, conn: AsyncConnection, apikey: Optional[str]) -> Optional[int]:
+        """
+        Get admin id of an API key
+        :param conn:
+        :param apikey:
+        :return: ``None`` when the key is unknown
+        """
+        if not apikey:
+            return None
+
+        admin_id = self.valid.get(apikey)
+        if admin_id is not MISSING:
+            return admin_id
+
+        if self.invalid.get(apikey) is not MISSING:
+            return None
+
+        row = await hot_statements.first(conn, 'admin_id_by_apikey', apikey=apikey)
+
+        if row is None:
+            self.invalid.set(apikey, True)
+            return None
+
+        self.valid.set(apikey, row.id)
+        return row.id
+
+    async def require(self, conn: AsyncConnection, apikey: Optional[str]) -> int:
+        """
+        Get admin id of an API key that must be valid
+        :param conn:
+        :param apikey:
+        :return:
+        :raises AdminIsNotLoginError: the key is unknown
+        """
+        admin_id = await self.resolve(conn, apikey)
+        if admin_id is None:
+            raise AdminIsNotLoginError
+        return admin_id
+
+    async def is_valid(self, conn: AsyncConnection, apikey: Optional[str]) -> bool:
+        """
+        Check whether an API key belongs to an admin
+        :param conn:
+        :param apikey:
+        :return:
+        """
+        return await self.resolve(conn, apikey) is not None
+
+    def invalidate(self, *apikeys: Optional[str]) -> None:
+        """
+        Forget cached results of the given keys
+        :param apikeys:
+        :return:
+        """
+        for apikey in apikeys:
+            if apikey:
+                self.valid.pop(apikey)
+                self.invalid.pop(apikey)
+
+    async def revoke(self, conn: AsyncConnection, *apikeys: Optional[str]) -> None:
+        """
+        Forget the given keys once the transaction changing them commits, on
+        this worker and, through ``NOTIFY``, on every other worker
+        :param conn:
+        :param apikeys:
+        :return:
+        """
+        apikeys = [apikey for apikey in apikeys if apikey]
+        after_commit(conn, lambda: self.invalidate(*apikeys))
+        await conn.execute(select(func.pg_notify(APIKEY_CHANNEL, json.dumps(apikeys))))
+
+    def revoked(self, payload: str) -> None:
+        """
+        Handle a revocation sent by a worker
+        :param payload: JSON list of keys
+        :return:
+        """
+        self.invalidate(*json.loads(payload))
+
+    def clear(self) -> None:
+        """
+        Forget every cached key, used when revocations may have been missed
+        :return:
+        """
+        self.valid.clear()
+        self.invalid.clear()
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the resolver
+        :return:
+        """
+        return {
+            "valid": self.valid.stats(),
+            "invalid": self.invalid.stats(),
+        }
+
+
+@attrs.define
+class AdminIdentityResolver:
+    """
+    Resolve the uuid of an admin token to the admin id.
+
+    Tokens carry the id themselves, this lookup only serves tokens without
+    it. Results are cached for a short time and dropped by admin id when the
+    admin is updated, the uuid of a token is not known at that point.
+    """
+    cache: TTLCache
+
+    async def resolve(self, conn: AsyncConnection, uuid_: str) -> Optional[int]:
+        """
+        Get admin id of a token uuid
+        :param conn:
+        :param uuid_:
+        :return: ``None`` when no admin has this uuid
+        """
+        try:
+            parsed = uuid.UUID(uuid_)
+        except (TypeError, ValueError, AttributeError):
+            return None
+        admin_id = self.cache.get(str(parsed))
+        if admin_id is not MISSING:
+            return admin_id
+
+        row = await hot_statements.first(conn, 'admin_id_by_uuid', uuid=parsed)
+        if row is None:
+            return None
+
+        self.cache.set(str(parsed), row.id)
+        return row.id
+
+    def invalidate(self, *admin_ids: int) -> None:
+        """
+        Forget every cached uuid resolving to the given admins
+        :param admin_ids:
+        :return:
+        """
+        for admin_id in admin_ids:
+            self.cache.pop_value(admin_id)
+
+    async def revoke(self, conn: AsyncConnection, *admin_ids: int) -> None:
+        """
+        Forget the given admins once the transaction changing them commits, on
+        this worker and, through ``NOTIFY``, on every other worker
+        :param conn:
+        :param admin_ids:
+        :return:
+        """
+        after_commit(conn, lambda: self.invalidate(*admin_ids))
+        await conn.execute(select(func.pg_notify(ADMIN_CHANNEL, json.dumps(list(admin_ids)))))
+
+    def revoked(self, payload: str) -> None:
+        """
+        Handle a revocation sent by a worker
+        :param payload: JSON list of admin ids
+        :return:
+        """
+        self.invalidate(*json.loads(payload))
+
+    def clear(self) -> None:
+        """
+        Forget every cached uuid, used when revocations may have been missed
+        :return:
+        """
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        """
+        Hit and miss counters of the resolver
+        :return:
+        """
+        return self.cache.stats()
+
+
+apikey_resolver = ApiKeyResolver(
+    valid=TTLCache(cfg.apikey.cache_size, cfg.apikey.ttl),
+    invalid=TTLCache(cfg.apikey.cache_size, cfg.apikey.negative_ttl),
+)
+admin_identity = AdminIdentityResolver(
+    cache=TTLCache(cfg.jwt.identity_cache_size, cfg.jwt.identity_ttl),
+)
@@ -1,20 +1,64 @@
 from datetime import datetime
-from typing import Optional, List
-import json
+from typing import Optional, List, Any
 import attrs
-import pycti
-from sqlalchemy import select, func
+from sqlalchemy import select, func, literal_column, Table
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncConnection
-import requests
 from api.config import cfg
-from exceptions import AdminIsNotLoginError
-from models.admin import AdminModel
+from core.db import engine
+from core.statements import hot_statements
+from helpers.export import make_etag
+from helpers.ingest import validate_item
+from helpers.pagination import paginate, split_page
+from helpers.totals import count_total
 from models.blocked import BlockedModel
 
 from models.ioc import IocModel
-from models.log import LogsModel
+from models.ioc_enrichment import IocEnrichmentModel
 from schemas.admin import ListMalIpResponseSchema, ListingIocResponseSchema, GeneralPaginationResponseSchema, \
-    ListingMalIpResponseSchemaPaginate
+    ListingMalIpResponseSchemaPaginate, BlocklistDeltaResponseSchema, IocIngestResultSchema, \
+    AggregatedBlocklistResponseSchema, AggregateModeEnum, ListingIocResponseSchemaPaginate
+from services.activity_log import activity_log
+from services.aggregation import blocklist_aggregator
+from services.export import blocklist_exporter, ExportedBlocklist
+from services.credentials import apikey_resolver
+from services.enrichment import enrichment_worker
+from services.stats import DashboardStats
+from services.whitelist import whitelist_index, whitelist_entry
+from services.ioc_buffer import IocSightingBuffer
+from services.opencti import opencti_lookup
+from services.reputation import reputation_client
+from services.journal import BlockJournal, JOURNAL_INSERT, JOURNAL_STATUS
+
+
+# asyncpg accepts at most 32767 bind parameters per statement
+UPSERT_CHUNK = 5000
+
+
+def ioc_upsert_query(rows: List[dict], table: Table = IocModel):
+    """
+    One statement that creates iocs or adds to their counter, relying on the
+    unique (ip_address, hostname) key so concurrent sightings never lose an
+    increment
+    :param rows: dict with ip_address, hostname, comment and counter
+    :param table: ``IocModel`` or a table with the same shape
+    :return: insert returning id, ip_address, hostname and whether the row is new
+    """
+    # same lock order for every writer, so concurrent batches can not deadlock
+    rows = sorted(rows, key=lambda row: (row["ip_address"], row["hostname"]))
+    query = insert(table).values([
+        {**row, "is_process": False} for row in rows
+    ])
+
+    return query.on_conflict_do_update(
+        index_elements=[table.c.ip_address, table.c.hostname],
+        set_={"counter": table.c.counter + query.excluded.counter}
+    ).returning(
+        table.c.id,
+        table.c.ip_address,
+        table.c.hostname,
+        literal_column("xmax = 0").label("inserted")
+    )
 
 
 @attrs.define
@@ -22,37 +66,22 @@ class EnrichService:
     """
     Enrich data with opencti data
     """
-    opencti =  pycti.OpenCTIApiClient(cfg.opencti.url, cfg.opencti.token)
-
-
-    def check_reputation(self, ip_address: str):
-        url = "https://api.abuseipdb.com/api/v2/check"
-
-        headers = {
-            "Key": cfg.abuseipdb_api_key,
-            "Accept": "application/json"
-        }
 
-        querystring = {
-            'ipAddress': ip_address,
-            'maxAgeInDays': '90'
-        }
-
-        response = requests.request("GET", url, headers=headers, params=querystring)
-
-        decodedResponse = json.loads(response.text)
-
-        return decodedResponse
+    async def check_reputation(self, ip_address: str) -> dict:
+        """
+        Check reputation of ip on AbuseIPDB
+        :param ip_address:
+        :return:
+        """
+        return await reputation_client.check(ip_address)
 
-    def enrich(self, ip_address: str):
+    async def enrich(self, ip_address: str):
         """
         Enrich data with opencti data
         :param data:
         :return:
         """
-        data = self.opencti.stix_cyber_observable.list(search=ip_address)
-
-        return data[0]['objectLabel'] if data else None
+        return await opencti_lookup.labels(ip_address)
 
     async def add_iochost(self,conn: AsyncConnection, ip_address: str, hostname: str, apikey: str, comment: Optional[str] = None) -> int:
         """
@@ -62,67 +91,119 @@ class EnrichService:
         :param hostname:
         :param apikey:
         :return:
+        :raises WhitelistedIpError:
         """
 
-        query = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-
-        result = (await conn.execute(query)).scalar()
-        if result == 0:
+        if not await apikey_resolver.is_valid(conn, apikey):
             return False
 
-        _query_check_counter = select(
-            IocModel.c.counter
-        ).select_from(
-            IocModel
-        ).where(
-            IocModel.c.ip_address == ip_address,
-            IocModel.c.hostname == hostname
-        )
-
-        #TODO abis di edit
+        await whitelist_index.check(conn, ip_address)
 
-        counter = (await conn.execute(_query_check_counter)).scalar()
+        if ioc_buffer.offer(ip_address, hostname, comment if comment else None):
+            return True
 
-        if counter is None:
-            query = IocModel.insert().values(
-                ip_address=ip_address,
-                hostname=hostname,
-                is_process=False,
-                comment=comment if comment else None,
-                counter=counter + 1 if counter else 1
-            )
+        rows = await self.write_sightings(conn, [{
+            "ip_address": ip_address,
+            "hostname": hostname,
+            "comment": comment if comment else None,
+            "counter": 1,
+        }])
+        row = rows[(ip_address, hostname)]
+        ioc_buffer.remember(conn, rows)
 
-            query_log = LogsModel.insert().values(
-                activity=f"Add ioc {ip_address} to watch list",
-            )
-            await conn.execute(query_log)
+        return row.id if row.inserted else True
 
-            return (await conn.execute(query)).inserted_primary_key[0]
+    async def write_sightings(self, conn: AsyncConnection, sightings: List[dict]) -> dict:
+        """
+        Upsert summed sightings and log them
+        :param conn:
+        :param sightings: dict with ip_address, hostname, comment and counter, one per (ip, hostname)
+        :return: upserted row by (ip_address, hostname)
+        """
+        rows = {}
+        if len(sightings) == 1:
+            # a single sighting from ``add_iochost``, served by a prepared statement
+            row = await hot_statements.first(conn, 'ioc_upsert', **sightings[0])
+            rows[(row.ip_address, row.hostname)] = row
         else:
+            for offset in range(0, len(sightings), UPSERT_CHUNK):
+                query = ioc_upsert_query(sightings[offset:offset + UPSERT_CHUNK])
+                rows.update({(row.ip_address, row.hostname): row for row in await conn.execute(query)})
 
-            query = IocModel.update().where(
-                IocModel.c.ip_address == ip_address
-            ).values(
-                counter=counter + 1
-            )
-            query_log = LogsModel.insert().values(
-                activity=f"Add ioc {ip_address} to watch list",
-            )
-            await conn.execute(query_log)
-            await conn.execute(query)
-            return True
+        inserted = [row.ip_address for row in rows.values() if row.inserted]
+        await DashboardStats(conn).add(active_alerts=len(inserted))
+        await enrichment_worker.schedule(conn, inserted)
+        await activity_log.record(conn, *[
+            f"Add ioc {sighting['ip_address']} to watch list" for sighting in sightings
+        ])
+
+        return rows
 
 
-    async def list_iochost(self,page: Optional[int] = 1, per_page: Optional[int] = 5, hostname: Optional[str] = None, is_process: Optional[bool] = None, conn: AsyncConnection = None, ip: Optional[str] = None) -> List[ListingIocResponseSchema]:
+    async def add_iochost_batch(self, conn: AsyncConnection, items: List[Any], apikey: str) -> List[IocIngestResultSchema]:
+        """
+        Add many ioc sightings in one transaction.
+
+        Sightings are summed per (ip, hostname) first, then written with a single
+        multi-row upsert whatever the batch size.
+        :param conn:
+        :param items: raw items of the batch
+        :param apikey:
+        :return: result per item, in the order of the batch
+        """
+        await apikey_resolver.require(conn, apikey)
+
+        results = []
+        sightings = {}
+        for index, raw in enumerate(items):
+            item, error = validate_item(raw)
+            if error:
+                results.append(IocIngestResultSchema(index=index, status="invalid", error=error))
+                continue
+
+            whitelisted = await whitelist_index.match(conn, item.ip)
+            if whitelisted is not None:
+                results.append(IocIngestResultSchema(
+                    index=index, status="whitelisted", ip=item.ip, hostname=item.hostname,
+                    error=f"whitelisted by {whitelist_entry(whitelisted)}"
+                ))
+                continue
+
+            key = (item.ip, item.hostname)
+            entry = sightings.setdefault(key, {"count": 0, "comment": item.comment})
+            entry["count"] += 1
+            results.append(IocIngestResultSchema(index=index, status="updated", ip=item.ip, hostname=item.hostname))
+
+        if not sightings:
+            return results
+
+        rows = await self.write_sightings(conn, [
+            {
+                "ip_address": ip,
+                "hostname": hostname,
+                "comment": entry["comment"],
+                "counter": entry["count"],
+            } for (ip, hostname), entry in sightings.items()
+        ])
+        ioc_buffer.remember(conn, rows)
+
+        announced = set()
+        for result in results:
+            row = rows.get((result.ip, result.hostname))
+            if row is None:
+                continue
+            result.id = row.id
+            if row.inserted and row.id not in announced:
+                result.status = "created"
+                announced.add(row.id)
+        return results
+
+    async def list_iochost(self,page: Optional[int] = 1, per_page: Optional[int] = 5, hostname: Optional[str] = None, is_process: Optional[bool] = None, conn: AsyncConnection = None, ip: Optional[str] = None, cursor: Optional[str] = None, total_mode: Optional[str] = None) -> ListingIocResponseSchemaPaginate:
         """
         List all iocs ip
         :param hostname:
+        :param cursor: ``next_cursor`` of the previous page, replaces ``page``
+        :param total_mode: how the total is counted, see ``count_total``
         :return:
         """
         query = select(
@@ -131,38 +212,38 @@ class EnrichService:
             IocModel.c.hostname,
             IocModel.c.is_process,
             IocModel.c.comment,
-            IocModel.c.counter
+            IocModel.c.counter,
+            IocEnrichmentModel.c.labels,
+            IocEnrichmentModel.c.abuse_score,
+            IocEnrichmentModel.c.refreshed_at
         ).select_from(
-            IocModel
+            IocModel.outerjoin(
+                IocEnrichmentModel, IocEnrichmentModel.c.ip_address == IocModel.c.ip_address
+            )
         )
 
-        #pagination
-        query = query.limit(per_page).offset((page - 1) * per_page)
-
+        conditions = []
         if hostname:
-            query = query.where(
+            conditions.append(
                 IocModel.c.hostname == hostname
             )
 
         if is_process is not None:
-            query = query.where(
+            conditions.append(
                 IocModel.c.is_process == is_process
             )
         if ip is not None:
-            query = query.where(
+            conditions.append(
                 IocModel.c.ip_address == ip
             )
 
-        query = query.order_by(IocModel.c.id.desc())
-        data = (await conn.execute(query)).fetchall()
+        query = paginate(query.where(*conditions), IocModel.c.id, page, per_page, cursor)
+        data, next_cursor = split_page((await conn.execute(query)).fetchall(), per_page)
 
-        _query_total = select(
-            func.count(IocModel.c.id)
-        ).select_from(
-            IocModel
+        total, total_kind = await count_total(
+            conn, IocModel, *conditions,
+            mode=total_mode or cfg.totals.mode, exact_threshold=cfg.totals.exact_threshold
         )
-
-        total = (await conn.execute(_query_total)).scalar()
         all = []
         for row in data:
             all.append(
@@ -173,15 +254,21 @@ class EnrichService:
                     is_process=row.is_process,
                     comment=row.comment,
                     counter=row.counter,
-                    pagination=GeneralPaginationResponseSchema(
-                        total=total,
-                        page=page,
-                        per_page=per_page
-                    )
-
+                    labels=row.labels,
+                    abuse_score=row.abuse_score,
+                    enriched_at=row.refreshed_at,
                 )
             )
-        return all
+        return ListingIocResponseSchemaPaginate(
+            pagination=GeneralPaginationResponseSchema(
+                total=total,
+                page=page,
+                per_page=per_page,
+                next_cursor=next_cursor,
+                total_kind=total_kind
+            ),
+            data=all
+        )
 
 
     async def add_mal_ip(self,conn: AsyncConnection, ip: str, hostname: str, apikey: str) -> int:
@@ -190,37 +277,32 @@ class EnrichService:
         :param ip:
         :param hostname:
         :return:
+        :raises WhitelistedIpError:
         """
 
-        query = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-
-        result = (await conn.execute(query)).scalar()
-        if result == 0:
+        if not await apikey_resolver.is_valid(conn, apikey):
             return False
 
+        await whitelist_index.check(conn, ip)
+
         query = BlockedModel.insert().values(
             mal_ip=ip,
             hostname=hostname,
         )
 
-        query_log = LogsModel.insert().values(
-            activity=f"Add malicious ip {ip} to firewall",
-        )
+        await activity_log.record(conn, f"Add malicious ip {ip} to firewall")
 
-        await conn.execute(query_log)
+        _id = (await conn.execute(query)).inserted_primary_key[0]
+        await BlockJournal(conn).record(JOURNAL_INSERT, ip, hostname, False)
 
-        return (await conn.execute(query)).inserted_primary_key[0]
+        return _id
 
-    async def list_mal_ip(self, hostname: Optional[str] = None, is_blocked: Optional[bool] = None, conn: AsyncConnection = None, page: Optional[int] = 1, per_page: Optional[int] = 5,) -> List[ListingMalIpResponseSchemaPaginate]:
+    async def list_mal_ip(self, hostname: Optional[str] = None, is_blocked: Optional[bool] = None, conn: AsyncConnection = None, page: Optional[int] = 1, per_page: Optional[int] = 5, cursor: Optional[str] = None, total_mode: Optional[str] = None) -> List[ListingMalIpResponseSchemaPaginate]:
         """
         List all malicious ip
         :param hostname:
+        :param cursor: ``next_cursor`` of the previous page, replaces ``page``
+        :param total_mode: how the total is counted, see ``count_total``
         :return:
         """
         query = select(
@@ -232,24 +314,24 @@ class EnrichService:
             BlockedModel
         )
 
-        query = query.limit(per_page).offset((page - 1) * per_page)
-
+        conditions = []
         if hostname:
-            query = query.where(
+            conditions.append(
                 BlockedModel.c.hostname == hostname
             )
 
         if is_blocked is not None:
-            query = query.where(
+            conditions.append(
                 BlockedModel.c.is_blocked == is_blocked
             )
 
-        data = (await conn.execute(query)).fetchall()
-
-
-        query_total = func.count(BlockedModel.c.id)
+        query = paginate(query.where(*conditions), BlockedModel.c.id, page, per_page, cursor)
+        data, next_cursor = split_page((await conn.execute(query)).fetchall(), per_page)
 
-        total = (await conn.execute(query_total)).scalar()
+        total, total_kind = await count_total(
+            conn, BlockedModel, *conditions,
+            mode=total_mode or cfg.totals.mode, exact_threshold=cfg.totals.exact_threshold
+        )
         all = []
         for row in data:
             all.append(
@@ -265,7 +347,9 @@ class EnrichService:
             page=page,
             per_page=per_page,
             total=total,
-            data=all
+            data=all,
+            next_cursor=next_cursor,
+            total_kind=total_kind
         )
         return final_result
 
@@ -276,36 +360,158 @@ class EnrichService:
         :param hostname:
         :return:
         """
-        query_check = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-        result = (await conn.execute(query_check)).scalar()
-        if result == 0:
-            raise AdminIsNotLoginError
+        await apikey_resolver.require(conn, apikey)
 
-        query = select(
-            BlockedModel.c.id,
-            BlockedModel.c.mal_ip,
-            BlockedModel.c.hostname,
-            BlockedModel.c.executed_time
-        ).select_from(
-            BlockedModel
-        )
+        return await self._list_blocked(conn, hostname, is_blocked)
 
-        if hostname:
-            query = query.where(
-                BlockedModel.c.hostname == hostname
+    async def blocklist_etag(self, apikey: str, hostname: str, variant: tuple, lossy: bool = False,
+                             conn: AsyncConnection = None) -> Optional[str]:
+        """
+        ETag of a host blocklist response, only the journal head is read.
+
+        ``block_ip``, ``add_mal_ip`` and ``update_status`` all add a journal
+        entry of the host, so its head changes whenever the blocklist does.
+        :param apikey:
+        :param hostname:
+        :param variant: request parameters the body depends on
+        :param lossy: the body also depends on the whitelist
+        :param conn:
+        :return: ``None`` when the host has no journal head to derive it from
+        """
+        await apikey_resolver.require(conn, apikey)
+
+        head = await BlockJournal(conn).head(hostname)
+        if not head:
+            return None
+        if lossy:
+            await whitelist_index.ensure_loaded(conn)
+            variant += (whitelist_index.digest,)
+        return make_etag(head, hostname, *variant)
+
+    async def list_mal_ip_aggregated(self, apikey: str, hostname: str, mode: AggregateModeEnum,
+                                     coverage: Optional[float] = None, is_blocked: Optional[bool] = None,
+                                     conn: AsyncConnection = None) -> AggregatedBlocklistResponseSchema:
+        """
+        Host blocklist collapsed into cidrs
+        :param apikey:
+        :param hostname:
+        :param mode:
+        :param coverage: percent of a prefix that must be listed in ``lossy`` mode
+        :param is_blocked:
+        :param conn:
+        :return:
+        :raises ValueError: invalid coverage
+        """
+        await apikey_resolver.require(conn, apikey)
+
+        return await blocklist_aggregator.aggregated(conn, hostname, is_blocked, mode, coverage)
+
+    async def export_mal_ip(self, apikey: str, hostname: str, fmt: str, accept_encoding: Optional[str] = None,
+                            mode: Optional[AggregateModeEnum] = None, coverage: Optional[float] = None,
+                            is_blocked: Optional[bool] = None, conn: AsyncConnection = None) -> ExportedBlocklist:
+        """
+        Host blocklist rendered for an agent
+        :param apikey:
+        :param hostname:
+        :param fmt: ``ipset``, ``nft`` or ``binary``
+        :param accept_encoding:
+        :param mode: aggregation of the text formats
+        :param coverage:
+        :param is_blocked:
+        :param conn:
+        :return:
+        :raises ValueError: invalid coverage, or an aggregated binary export
+        """
+        await apikey_resolver.require(conn, apikey)
+
+        return await blocklist_exporter.export(conn, hostname, is_blocked, fmt, accept_encoding, mode, coverage)
+
+    async def list_mal_ip_since(self, apikey: str, hostname: str, since: int, is_blocked: Optional[bool] = None,
+                                conn: AsyncConnection = None) -> BlocklistDeltaResponseSchema:
+        """
+        Delta of the host blocklist after a cursor from a previous poll.
+
+        An unchanged list costs a single lookup of the journal head, when the
+        cursor is unknown or already pruned the full list is returned instead.
+        :param apikey:
+        :param hostname:
+        :param since: cursor returned by the previous poll
+        :param is_blocked:
+        :param conn:
+        :return:
+        """
+        await apikey_resolver.require(conn, apikey)
+
+        journal = BlockJournal(conn)
+        # head is read before the rows, a change committed in between is sent
+        # again on the next poll instead of being lost
+        head = await journal.head(hostname)
+        if since == head and since > 0:
+            return BlocklistDeltaResponseSchema(cursor=head, full=False, added=[], removed=[])
+
+        if await journal.is_expired(hostname, since, head):
+            return BlocklistDeltaResponseSchema(
+                cursor=head,
+                full=True,
+                added=await self._list_blocked(conn, hostname, is_blocked),
+                removed=[]
             )
 
-        if is_blocked is not None:
-            query = query.where(
-                BlockedModel.c.is_blocked == is_blocked
+        changed = await journal.changed_ips(hostname, since)
+        added = await self._list_blocked(conn, hostname, is_blocked, changed) if changed else []
+        present = {row.ip_address for row in added}
+
+        return BlocklistDeltaResponseSchema(
+            cursor=head,
+            full=False,
+            added=added,
+            removed=[ip for ip in changed if ip not in present]
+        )
+
+    async def _list_blocked(self, conn: AsyncConnection, hostname: Optional[str] = None,
+                            is_blocked: Optional[bool] = None,
+                            ips: Optional[List[str]] = None) -> List[ListMalIpResponseSchema]:
+        """
+        Read block rows of a host
+        :param conn:
+        :param hostname:
+        :param is_blocked:
+        :param ips: only read these ip
+        :return:
+        """
+        if hostname and ips is None:
+            # the agent poll, served by a prepared statement
+            if is_blocked is None:
+                data = await hot_statements.fetch(conn, 'blocked_by_host', hostname=hostname)
+            else:
+                data = await hot_statements.fetch(
+                    conn, 'blocked_by_host_status', hostname=hostname, is_blocked=is_blocked
+                )
+        else:
+            query = select(
+                BlockedModel.c.id,
+                BlockedModel.c.mal_ip,
+                BlockedModel.c.hostname,
+                BlockedModel.c.executed_time
+            ).select_from(
+                BlockedModel
             )
-        data = (await conn.execute(query)).fetchall()
+
+            if hostname:
+                query = query.where(
+                    BlockedModel.c.hostname == hostname
+                )
+
+            if is_blocked is not None:
+                query = query.where(
+                    BlockedModel.c.is_blocked == is_blocked
+                )
+
+            if ips is not None:
+                query = query.where(
+                    BlockedModel.c.mal_ip.in_(ips)
+                )
+            data = (await conn.execute(query)).fetchall()
 
         all = []
         for row in data:
@@ -326,7 +532,10 @@ class EnrichService:
         :param hostname:
         :param conn:
         :return:
+        :raises WhitelistedIpError:
         """
+        await whitelist_index.check(conn, ip)
+
         query = select(
             BlockedModel.c.id
         ).select_from(
@@ -342,23 +551,26 @@ class EnrichService:
         query = IocModel.update().values(
             is_process=True
         ).where(
-            IocModel.c.ip_address == ip
+            IocModel.c.ip_address == ip,
+            IocModel.c.is_process == False
+        ).returning(
+            IocModel.c.id
         )
 
-        await conn.execute(query)
+        processed = len((await conn.execute(query)).fetchall())
+        await DashboardStats(conn).add(active_alerts=-processed)
 
         query = BlockedModel.insert().values(
             mal_ip=ip,
             hostname=hostname,
         )
 
-        query_log = LogsModel.insert().values(
-            activity=f"Block malicious ip {ip}",
-        )
+        await activity_log.record(conn, f"Block malicious ip {ip}")
 
-        await conn.execute(query_log)
+        _id = (await conn.execute(query)).inserted_primary_key[0]
+        await BlockJournal(conn).record(JOURNAL_INSERT, ip, hostname, False)
 
-        return (await conn.execute(query)).inserted_primary_key[0]
+        return _id
 
 
     async def update_status(self, ip: str, status: bool,apikey: str, conn: AsyncConnection) -> int:
@@ -370,34 +582,47 @@ class EnrichService:
         :return:
         """
 
-        query = select(
-            func.count(AdminModel.c.id)
-        ).select_from(
-            AdminModel
-        ).where(
-            AdminModel.c.api_key == apikey
-        )
-
-        result = (await conn.execute(query)).scalar()
-        if result == 0:
-            raise AdminIsNotLoginError
+        await apikey_resolver.require(conn, apikey)
 
         time = int(datetime.now().timestamp())
 
-        query = BlockedModel.update().where(
+        previous = select(
+            BlockedModel.c.id,
+            BlockedModel.c.is_blocked
+        ).where(
             BlockedModel.c.mal_ip == ip
+        ).with_for_update().cte('previous')
+
+        query = BlockedModel.update().where(
+            BlockedModel.c.id == previous.c.id
         ).values(
             is_blocked=status,
             executed_time=time
+        ).returning(
+            BlockedModel.c.hostname,
+            previous.c.is_blocked.label('was_blocked')
         )
 
 
-        query_log = LogsModel.insert().values(
-            activity=f"Update status of malicious ip {ip} to {status}",
-        )
-
-        await conn.execute(query_log)
+        await activity_log.record(conn, f"Update status of malicious ip {ip} to {status}")
 
 
-        await conn.execute(query)
+        journal = BlockJournal(conn)
+        blocked = 0
+        for row in (await conn.execute(query)).fetchall():
+            blocked += bool(status) - bool(row.was_blocked)
+            await journal.record(JOURNAL_STATUS, ip, row.hostname, status)
+        await DashboardStats(conn).add(blocked_ips=blocked)
         return True
+
+
+ioc_buffer = IocSightingBuffer(
+    engine=engine,
+    writer=lambda conn, rows: EnrichService().write_sightings(conn, rows),
+    flush_interval=cfg.ioc_buffer.flush_ms / 1000,
+    max_entries=cfg.ioc_buffer.max_entries,
+    max_pending=cfg.ioc_buffer.max_pending,
+    max_known=cfg.ioc_buffer.max_known,
+    overflow=cfg.ioc_buffer.overflow,
+    max_retries=cfg.ioc_buffer.max_retries,
+)
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+import attrs
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from api.config import cfg
+from core.db import engine, after_commit
+from core.statements import hot_statements
+from models.ioc import IocModel
+from models.ioc_enrichment import IocEnrichmentModel
+from services.bulk_enrich import BulkEnricher, bulk_enricher
+
+logger = logging.getLogger(__name__)
+
+
+def abuse_score(reputation: dict) -> Optional[int]:
+    """
+    Confidence score out of an AbuseIPDB check response
+    :param reputation:
+    :return:
+    """
+    data = reputation.get('data') if isinstance(reputation, dict) else None
+    return data.get('abuseConfidenceScore') if isinstance(data, dict) else None
+
+
+@attrs.define
+class EnrichmentWorker:
+    """
+    Background enrichment of ioc ips.
+
+    Every new ioc ip gets an ``ioc_enrichment`` row in the ingest transaction,
+    the worker picks due rows, looks them up on OpenCTI and AbuseIPDB and
+    stores labels and abuse score, so listing iocs never calls a provider.
+    A row is due when it was never enriched, when it is older than
+    ``max_age`` or, for ips seen at least ``hot_sightings`` times across
+    hosts right now, older than ``hot_max_age``. Rows are leased with ``SKIP LOCKED`` so several api
+    workers share the load, a lookup that fails keeps its lease and is
+    retried once the lease expired.
+    """
+    engine: AsyncEngine
+    enricher: BulkEnricher
+    batch_size: int
+    scan_interval: float
+    lease: float
+    max_age: float
+    hot_max_age: float
+    hot_sightings: int
+    enriched: int = attrs.field(default=0, init=False)
+    failed: int = attrs.field(default=0, init=False)
+    _wake: Optional[asyncio.Event] = attrs.field(default=None, init=False)
+    _task: Optional[asyncio.Task] = attrs.field(default=None, init=False)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def schedule(self, conn: AsyncConnection, ip_addresses: Iterable[str]) -> None:
+        """
+        Queue ips of new iocs for enrichment, in the transaction that adds them
+        :param conn:
+        :param ip_addresses:
+        :return:
+        """
+        rows = [{"ip_address": ip} for ip in sorted(set(ip_addresses))]
+        if not rows:
+            return
+        if len(rows) == 1:
+            await hot_statements.execute(conn, 'enrichment_schedule', **rows[0])
+        else:
+            await conn.execute(
+                insert(IocEnrichmentModel).values(rows).on_conflict_do_nothing(
+                    index_elements=[IocEnrichmentModel.c.ip_address]
+                )
+            )
+        if self.running:
+            after_commit(conn, self._wake.set)
+
+    async def backfill(self) -> None:
+        """
+        Queue ips of iocs stored before enrichment existed
+        :return:
+        """
+        async with self.engine.begin() as conn:
+            missing = select(IocModel.c.ip_address).distinct().where(
+                IocModel.c.ip_address.is_not(None),
+                ~select(IocEnrichmentModel.c.ip_address).where(
+                    IocEnrichmentModel.c.ip_address == IocModel.c.ip_address
+                ).exists()
+            )
+            await conn.execute(
+                insert(IocEnrichmentModel).from_select(['ip_address'], missing).on_conflict_do_nothing(
+                    index_elements=[IocEnrichmentModel.c.ip_address]
+                )
+            )
+
+    async def claim(self) -> List[str]:
+        """
+        Lease the next due ips
+        :return:
+        """
+        now = func.now()
+        table = IocEnrichmentModel
+        # live count, an ip getting hot after its last refresh is due sooner
+        sightings = select(func.coalesce(func.sum(IocModel.c.counter), 0)).where(
+            IocModel.c.ip_address == table.c.ip_address
+        ).scalar_subquery()
+        due = select(table.c.ip_address).where(
+            or_(table.c.leased_until.is_(None), table.c.leased_until < now),
+            or_(
+                table.c.refreshed_at.is_(None),
+                table.c.refreshed_at < now - timedelta(seconds=self.max_age),
+                and_(
+                    table.c.refreshed_at < now - timedelta(seconds=self.hot_max_age),
+                    sightings >= self.hot_sightings,
+                ),
+            ),
+        ).order_by(
+            table.c.refreshed_at.asc().nulls_first()
+        ).limit(self.batch_size).with_for_update(skip_locked=True)
+
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(table).where(
+                    table.c.ip_address.in_(due.scalar_subquery())
+                ).values(
+                    leased_until=now + timedelta(seconds=self.lease)
+                ).returning(table.c.ip_address)
+            )
+            return result.scalars().all()
+
+    async def _store(self, conn: AsyncConnection, item: dict) -> bool:
+        labels, reputation = item['opencti'], item['abuseipdb']
+        if labels['status'] != 'ok' and reputation['status'] != 'ok':
+            return False
+
+        values = {
+            "refreshed_at": func.now(),
+            "leased_until": None,
+            "sightings": select(func.coalesce(func.sum(IocModel.c.counter), 0)).where(
+                IocModel.c.ip_address == item['ip']
+            ).scalar_subquery(),
+        }
+        if labels['status'] == 'ok':
+            values['labels'] = labels['result']
+        if reputation['status'] == 'ok' and not reputation['result'].get('stale'):
+            values['abuse_score'] = abuse_score(reputation['result'])
+
+        await conn.execute(
+            update(IocEnrichmentModel).where(
+                IocEnrichmentModel.c.ip_address == item['ip']
+            ).values(**values)
+        )
+        return True
+
+    async def run_once(self) -> int:
+        """
+        Enrich one batch of due ips
+        :return: number of ips leased
+        """
+        ips = await self.claim()
+        if not ips:
+            return 0
+        async for item in self.enricher.enrich(ips):
+            async with self.engine.begin() as conn:
+                if await self._store(conn, item):
+                    self.enriched += 1
+                else:
+                    self.failed += 1
+        return len(ips)
+
+    def start(self) -> None:
+        """
+        Start the background worker
+        :return:
+        """
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name='ioc-enrichment')
+
+    async def stop(self) -> None:
+        """
+        Stop the worker, ips leased by an interrupted batch are retried later
+        :return:
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await self.backfill()
+        except Exception:
+            logger.exception("cannot backfill ioc enrichment")
+        while True:
+            try:
+                while await self.run_once() >= self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("ioc enrichment batch failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.scan_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        """
+        Counters of the worker
+        :return:
+        """
+        return {
+            "running": self.running,
+            "enriched": self.enriched,
+            "failed": self.failed,
+        }
+
+
+enrichment_worker = EnrichmentWorker(
+    engine=engine,
+    enricher=bulk_enricher,
+    batch_size=cfg.enrichment.batch_size,
+    scan_interval=cfg.enrichment.scan_interval,
+    lease=cfg.enrichment.lease,
+    max_age=cfg.enrichment.max_age,
+    hot_max_age=cfg.enrichment.hot_max_age,
+    hot_sightings=cfg.enrichment.hot_sightings,
+)
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Optional, Tuple
+
+import attrs
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.config import cfg
+from helpers.cache import TTLCache, MISSING
+from helpers.export import BINARY, IPSET, MEDIA_TYPES, compress, pick_encoding, render_binary, render_ipset, \
+    render_nft
+from models.blocked import BlockedModel
+from schemas.admin import AggregateModeEnum
+from services.aggregation import blocklist_aggregator
+from services.journal import BlockJournal
+
+
+@attrs.define
+class ExportedBlocklist:
+    """
+    Rendered blocklist ready to be sent
+    """
+    body: bytes
+    media_type: str
+    encoding: Optional[str]
+    cursor: int
+
+
+@attrs.define
+class BlocklistExporter:
+    """
+    Host blocklists rendered for agents as an ``ipset restore`` script, an
+    ``nft -f`` file or a packed binary list.
+
+    The text formats load the exact cidr collapse of the blocklist (or the
+    lossy one when asked), the binary format holds the single addresses.
+    Rendered and compressed bodies are memoized per blocklist version and
+    encoding, so polls of an unchanged blocklist are served from memory.
+    """
+    cache: TTLCache
+    ipset_name: str
+    nft_table: str
+    nft_set: str
+    compress_min: int
+    rendered: int = attrs.field(default=0, init=False)
+
+    async def export(self, conn: AsyncConnection, hostname: str, is_blocked: Optional[bool], fmt: str,
+                     accept_encoding: Optional[str] = None, mode: Optional[AggregateModeEnum] = None,
+                     coverage: Optional[float] = None) -> ExportedBlocklist:
+        """
+        Render the blocklist of a host
+        :param conn:
+        :param hostname:
+        :param is_blocked:
+        :param fmt: ``IPSET``, ``NFT`` or ``BINARY``
+        :param accept_encoding: Accept-Encoding header of the agent
+        :param mode: aggregation of the text formats, ``exact`` when omitted
+        :param coverage: percent of a prefix that must be listed in ``lossy`` mode
+        :return:
+        :raises ValueError: invalid coverage, or an aggregated binary export
+        """
+        if fmt == BINARY:
+            if mode is not None:
+                raise ValueError("binary export holds single addresses and cannot be aggregated")
+            version = (hostname, is_blocked, await BlockJournal(conn).head(hostname))
+        else:
+            mode = mode or AggregateModeEnum.EXACT
+            version = await blocklist_aggregator.version(conn, hostname, is_blocked, mode, coverage)
+
+        encoding = pick_encoding(accept_encoding)
+        key = (fmt, encoding) + version
+        # a head of 0 does not identify the content, see ``BlocklistAggregator``
+        exported = self.cache.get(key) if version[2] else MISSING
+        if exported is not MISSING:
+            return exported
+
+        loop = asyncio.get_running_loop()
+        if fmt == BINARY:
+            query = select(BlockedModel.c.mal_ip).where(BlockedModel.c.hostname == hostname)
+            if is_blocked is not None:
+                query = query.where(BlockedModel.c.is_blocked == is_blocked)
+            addresses = (await conn.execute(query)).scalars().all()
+            body = await loop.run_in_executor(None, render_binary, addresses)
+        else:
+            aggregated = await blocklist_aggregator.aggregated(conn, hostname, is_blocked, mode, coverage, version)
+            if fmt == IPSET:
+                body = await loop.run_in_executor(None, render_ipset, aggregated.prefixes, self.ipset_name)
+            else:
+                body = await loop.run_in_executor(
+                    None, render_nft, aggregated.prefixes, self.nft_table, self.nft_set
+                )
+
+        body, encoding = await loop.run_in_executor(None, compress, body, encoding, self.compress_min)
+        self.rendered += 1
+
+        exported = ExportedBlocklist(body=body, media_type=MEDIA_TYPES[fmt], encoding=encoding, cursor=version[2])
+        if version[2]:
+            self.cache.set(key, exported)
+        return exported
+
+    def stats(self) -> dict:
+        """
+        Counters of the exporter
+        :return:
+        """
+        return {
+            "cache": self.cache.stats(),
+            "rendered": self.rendered,
+        }
+
+
+blocklist_exporter = BlocklistExporter(
+    cache=TTLCache(maxsize=cfg.export.cache_size, ttl=cfg.export.cache_ttl),
+    ipset_name=cfg.export.ipset_name,
+    nft_table=cfg.export.nft_table,
+    nft_set=cfg.export.nft_set,
+    compress_min=cfg.export.compress_min,
+)
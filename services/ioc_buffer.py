@@ -0,0 +1,195 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import attrs
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from core.db import after_commit
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_BYPASS = 'bypass'
+OVERFLOW_DROP = 'drop'
+
+
+@attrs.define
+class IocSightingBuffer:
+    """
+    Write-behind buffer of ioc sightings.
+
+    Sightings of an already known (ip, hostname) are summed in memory and
+    written with one batched upsert every ``flush_interval`` seconds, or as
+    soon as ``max_entries`` keys are pending. A key seen for the first time is
+    never buffered so a new ioc shows up right away.
+
+    A failed flush keeps its rows for the next one. Rows that failed
+    ``max_retries`` flushes are written one per transaction so a bad row can
+    not hold back the others, and dropped when that fails ``max_retries``
+    times too.
+    """
+    engine: AsyncEngine
+    writer: Callable[[AsyncConnection, List[dict]], Awaitable[None]]
+    flush_interval: float
+    max_entries: int
+    max_pending: int
+    max_known: int
+    overflow: str = OVERFLOW_BYPASS
+    max_retries: int = 3
+    bypassed: int = attrs.field(default=0, init=False)
+    dropped: int = attrs.field(default=0, init=False)
+    flushed: int = attrs.field(default=0, init=False)
+    failed: int = attrs.field(default=0, init=False)
+    _pending: Dict[Tuple[str, str], List] = attrs.field(factory=dict, init=False)
+    _known: OrderedDict = attrs.field(factory=OrderedDict, init=False)
+    _wake: Optional[asyncio.Event] = attrs.field(default=None, init=False)
+    _lock: Optional[asyncio.Lock] = attrs.field(default=None, init=False)
+    _task: Optional[asyncio.Task] = attrs.field(default=None, init=False)
+    _stopping: bool = attrs.field(default=False, init=False)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    def offer(self, ip_address: str, hostname: str, comment: Optional[str] = None) -> bool:
+        """
+        Try to buffer one sighting
+        :param ip_address:
+        :param hostname:
+        :param comment:
+        :return: ``False`` when the caller must write the sighting itself
+        """
+        key = (ip_address, hostname)
+        if not self.running or key not in self._known:
+            return False
+
+        self._known.move_to_end(key)
+        entry = self._pending.get(key)
+        if entry is not None:
+            entry[0] += 1
+            return True
+
+        if len(self._pending) >= self.max_pending:
+            if self.overflow == OVERFLOW_DROP:
+                self.dropped += 1
+                return True
+            self.bypassed += 1
+            return False
+
+        # sightings, comment, failed flushes
+        self._pending[key] = [1, comment, 0]
+        if len(self._pending) >= self.max_entries:
+            self._wake.set()
+        return True
+
+    def remember(self, conn: AsyncConnection, keys: Iterable[Tuple[str, str]]) -> None:
+        """
+        Mark keys as stored in the database once the transaction writing them
+        commits, their next sightings can be buffered
+        :param conn:
+        :param keys: (ip_address, hostname) pairs
+        :return:
+        """
+        after_commit(conn, lambda keys=list(keys): self._remember(keys))
+
+    def _remember(self, keys: List[Tuple[str, str]]) -> None:
+        for key in keys:
+            self._known[key] = True
+            self._known.move_to_end(key)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    async def flush(self) -> None:
+        """
+        Write every pending sighting, with one upsert for the rows that never
+        failed and one per row for the others
+        :return:
+        """
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            batch = {key: entry for key, entry in pending.items() if entry[2] < self.max_retries}
+            if batch:
+                await self._write(batch)
+            for key, entry in pending.items():
+                if key not in batch:
+                    await self._write({key: entry})
+
+    async def _write(self, pending: Dict[Tuple[str, str], List]) -> None:
+        rows = [
+            {"ip_address": ip, "hostname": hostname, "comment": comment, "counter": count}
+            for (ip, hostname), (count, comment, _) in pending.items()
+        ]
+        try:
+            async with self.engine.begin() as conn:
+                await self.writer(conn, rows)
+        except Exception:
+            logger.exception("cannot flush %d ioc sightings", len(rows))
+            self.failed += len(rows)
+            for key, (count, comment, failures) in pending.items():
+                failures += 1
+                entry = self._pending.get(key)
+                if failures >= 2 * self.max_retries:
+                    logger.error("dropping %d sightings of %s on %s after %d failed flushes", count, *key, failures)
+                    self.dropped += count
+                elif entry is not None:
+                    entry[0] += count
+                    entry[2] = max(entry[2], failures)
+                elif len(self._pending) < self.max_pending:
+                    self._pending[key] = [count, comment, failures]
+                else:
+                    self.dropped += count
+            return
+        self.flushed += len(rows)
+
+    def start(self) -> None:
+        """
+        Start the flush loop
+        :return:
+        """
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name='ioc-sighting-buffer')
+
+    async def stop(self) -> None:
+        """
+        Stop buffering and write what is still pending
+        :return:
+        """
+        if self._task is None:
+            return
+        # new sightings go straight to the database from now on, the loop is
+        # not cancelled so a flush in progress is never cut in half
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+        await self.flush()
+
+    def stats(self) -> dict:
+        """
+        Counters of the buffer
+        :return:
+        """
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "known": len(self._known),
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "bypassed": self.bypassed,
+            "dropped": self.dropped,
+        }
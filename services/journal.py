@@ -0,0 +1,144 @@
+import json
+from typing import List, Optional
+
+import attrs
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.statements import hot_statements
+from models.block_journal import BlockJournalModel
+
+JOURNAL_INSERT = 'insert'
+JOURNAL_STATUS = 'status'
+JOURNAL_REMOVE = 'remove'
+
+NOTIFY_CHANNEL = 'block_journal'
+
+
+@attrs.define
+class BlockJournal:
+    """
+    Append-only change journal of the ``block`` table.
+
+    Every mutation of a block row gets a monotonically increasing ``seq``,
+    agents keep the last seq they saw as a cursor and only ask for what
+    changed after it.
+    """
+    conn: AsyncConnection
+
+    async def record(self, op: str, ip: str, hostname: str, is_blocked: Optional[bool] = None) -> int:
+        """
+        Record one mutation of a block row and notify listening workers, the
+        notification is delivered by Postgres only when the transaction commits
+        :param op: one of ``JOURNAL_INSERT``, ``JOURNAL_STATUS``, ``JOURNAL_REMOVE``
+        :param ip:
+        :param hostname:
+        :param is_blocked: status of the row after the mutation
+        :return: seq of the journal entry
+        """
+        # seq is handed out at insert but becomes visible at commit, writers of
+        # a host take turns until commit so a cursor never skips a later commit
+        await self.conn.execute(select(func.pg_advisory_xact_lock(func.hashtext(hostname))))
+
+        query = BlockJournalModel.insert().values(
+            op=op,
+            mal_ip=ip,
+            hostname=hostname,
+            is_blocked=is_blocked,
+        )
+        seq = (await self.conn.execute(query)).inserted_primary_key[0]
+
+        payload = json.dumps({
+            "type": "change",
+            "hostname": hostname,
+            "cursor": seq,
+            "op": op,
+            "ip": ip,
+            "is_blocked": is_blocked,
+        })
+        await self.conn.execute(select(func.pg_notify(NOTIFY_CHANNEL, payload)))
+
+        return seq
+
+    async def head(self, hostname: str) -> int:
+        """
+        Latest seq for a host, served from the (hostname, seq) index
+        :param hostname:
+        :return: 0 when the host has no journal entry yet
+        """
+        return await hot_statements.scalar(self.conn, 'journal_head', hostname=hostname) or 0
+
+    async def floor(self, hostname: str) -> int:
+        """
+        Oldest seq still kept for a host, every later entry of the host is kept
+        :param hostname:
+        :return: 0 when the host has no journal entry
+        """
+        query = select(
+            func.min(BlockJournalModel.c.seq)
+        ).select_from(
+            BlockJournalModel
+        ).where(
+            BlockJournalModel.c.hostname == hostname
+        )
+
+        return (await self.conn.execute(query)).scalar() or 0
+
+    async def changed_ips(self, hostname: str, since: int) -> List[str]:
+        """
+        Distinct ip touched for a host after the cursor
+        :param hostname:
+        :param since:
+        :return:
+        """
+        rows = await hot_statements.fetch(self.conn, 'journal_changed_ips', hostname=hostname, since=since)
+        return [row.mal_ip for row in rows]
+
+    async def is_expired(self, hostname: str, since: int, head: int) -> bool:
+        """
+        Check whether a cursor can no longer be served as a delta, either
+        because it was never issued or because entries of the host after it
+        may be pruned
+        :param hostname:
+        :param since: cursor sent by the agent
+        :param head: current head of the host
+        :return:
+        """
+        if since <= 0 or since > head:
+            return True
+
+        return since < await self.floor(hostname)
+
+    async def prune(self, retention: int) -> int:
+        """
+        Drop journal entries older than the last ``retention`` seq.
+
+        The newest entry of each host at or below the cutoff is kept, so a
+        quiet host keeps its head and its cursor, and the oldest entry of a
+        host marks from where its deltas are complete.
+        :param retention:
+        :return: number of deleted entries
+        """
+        query = select(
+            func.max(BlockJournalModel.c.seq)
+        ).select_from(
+            BlockJournalModel
+        )
+        latest = (await self.conn.execute(query)).scalar()
+        if not latest:
+            return 0
+
+        cutoff = latest - retention
+        kept = BlockJournalModel.alias('kept')
+        newest = select(
+            func.max(kept.c.seq)
+        ).where(
+            kept.c.hostname == BlockJournalModel.c.hostname,
+            kept.c.seq <= cutoff
+        ).scalar_subquery()
+        query = BlockJournalModel.delete().where(
+            BlockJournalModel.c.seq <= cutoff,
+            BlockJournalModel.c.seq < newest
+        )
+
+        return (await self.conn.execute(query)).rowcount
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import attrs
+
+from api.config import cfg
+from exceptions import EnrichTimeoutError
+from helpers.cache import TTLCache, MISSING
+
+
+@attrs.define
+class OpenCtiLookup:
+    """
+    Label lookup of an ip on OpenCTI.
+
+    pycti is blocking, calls run on a bounded thread pool with a timeout so the
+    event loop keeps serving agents, the client must time out its requests as
+    well since a thread can not be cancelled. Labels are cached per ip and
+    concurrent lookups of the same ip share a single upstream call. The client is only
+    built by ``client_factory`` on the first lookup, importing this module
+    neither imports pycti nor connects to OpenCTI.
+    """
+    client_factory: Callable[[], Any]
+    workers: int
+    timeout: float
+    cache: TTLCache
+    client: Optional[Any] = None
+    upstream_calls: int = attrs.field(default=0, init=False)
+    _client_lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+    _executor: Optional[ThreadPoolExecutor] = attrs.field(default=None, init=False)
+    _inflight: Dict[str, asyncio.Future] = attrs.field(factory=dict, init=False)
+
+    async def labels(self, ip_address: str) -> Optional[list]:
+        """
+        Labels of the first observable matching the ip
+        :param ip_address:
+        :return: ``None`` when OpenCTI does not know the ip
+        :raises EnrichTimeoutError: OpenCTI did not answer in time
+        """
+        labels = self.cache.get(ip_address)
+        if labels is not MISSING:
+            return labels
+
+        future = self._inflight.get(ip_address)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(ip_address))
+            self._inflight[ip_address] = future
+            future.add_done_callback(lambda _: self._inflight.pop(ip_address, None))
+
+        # a cancelled caller must not cancel the lookup other callers wait on
+        return await asyncio.shield(future)
+
+    async def _fetch(self, ip_address: str) -> Optional[list]:
+        loop = asyncio.get_running_loop()
+        try:
+            labels = await asyncio.wait_for(
+                loop.run_in_executor(self._get_executor(), self._search, ip_address), self.timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise EnrichTimeoutError from e
+
+        self.cache.set(ip_address, labels)
+        return labels
+
+    def _search(self, ip_address: str) -> Optional[list]:
+        self.upstream_calls += 1
+        data = self._get_client().stix_cyber_observable.list(search=ip_address)
+
+        return data[0]['objectLabel'] if data else None
+
+    def _get_client(self) -> Any:
+        if self.client is None:
+            with self._client_lock:
+                if self.client is None:
+                    self.client = self.client_factory()
+        return self.client
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='opencti')
+        return self._executor
+
+    def close(self) -> None:
+        """
+        Stop the thread pool
+        :return:
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        """
+        Counters of the lookup
+        :return:
+        """
+        return {
+            "cache": self.cache.stats(),
+            "upstream_calls": self.upstream_calls,
+            "inflight": len(self._inflight),
+        }
+
+
+def connect_opencti():
+    """
+    Build the pycti client, pycti is heavy to import and connects on creation.
+
+    pycti sends every request with a 300 s timeout, an abandoned lookup would
+    keep its worker thread that long. Requests are sent with the lookup
+    timeout instead so a hung call frees its thread soon after giving up.
+    :return:
+    """
+    import pycti
+    from requests.adapters import HTTPAdapter
+
+    class TimeoutAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            kwargs['timeout'] = cfg.opencti.timeout
+            return super().send(request, **kwargs)
+
+    client = pycti.OpenCTIApiClient(cfg.opencti.url, cfg.opencti.token, perform_health_check=False)
+    adapter = TimeoutAdapter()
+    client.session.mount('http://', adapter)
+    client.session.mount('https://', adapter)
+    if not client.health_check():
+        raise ValueError("OpenCTI API is not reachable")
+    return client
+
+
+opencti_lookup = OpenCtiLookup(
+    client_factory=connect_opencti,
+    workers=cfg.opencti.workers,
+    timeout=cfg.opencti.timeout,
+    cache=TTLCache(cfg.opencti.cache_size, cfg.opencti.cache_ttl),
+)
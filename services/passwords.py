@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import attrs
+
+from api.config import cfg
+from exceptions import HashingBusyError
+from helpers.authentication import BasicSalt, PasswordHasher
+
+
+@attrs.define
+class HashingPool:
+    """
+    bcrypt hashing and verification off the event loop.
+
+    bcrypt is slow on purpose and releases the GIL, calls run on a small
+    thread pool shared by the worker so agents keep being served while
+    admins log in. At most ``max_pending`` calls may wait for or use the
+    pool, the next ones fail at once with ``HashingBusyError`` instead of
+    queueing behind a credential-stuffing burst.
+    """
+    hasher: PasswordHasher
+    workers: int
+    max_pending: int
+    pending: int = attrs.field(default=0, init=False)
+    rejected: int = attrs.field(default=0, init=False)
+    _executor: Optional[ThreadPoolExecutor] = attrs.field(default=None, init=False)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Check a password against its hash
+        :param plain_password:
+        :param hashed_password:
+        :return:
+        :raises HashingBusyError: too many calls are already pending
+        """
+        return await self._run(self.hasher.verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password
+        :param password:
+        :return:
+        :raises HashingBusyError: too many calls are already pending
+        """
+        return await self._run(self.hasher.hash, password)
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashingBusyError
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    def close(self) -> None:
+        """
+        Stop the thread pool
+        :return:
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        """
+        Counters of the pool
+        :return:
+        """
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+
+hashing_pool = HashingPool(
+    hasher=PasswordHasher(BasicSalt(cfg.password.salt)),
+    workers=cfg.password.hash_workers,
+    max_pending=cfg.password.max_pending,
+)
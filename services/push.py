@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+import asyncpg
+import attrs
+from sqlalchemy.engine import make_url
+
+from api.config import cfg
+from services.credentials import ADMIN_CHANNEL, APIKEY_CHANNEL, admin_identity, apikey_resolver
+from services.journal import NOTIFY_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+
+@attrs.define(eq=False)
+class AgentChannel:
+    """
+    One connected agent.
+
+    Pending messages wait in a bounded queue, when the agent reads slower than
+    changes arrive the queue is replaced by a single ``resync`` message and the
+    agent catches up with ``/general/list-ips?since=<cursor>``.
+    """
+    hostname: str
+    queue: asyncio.Queue
+    overflowed: bool = False
+
+    def offer(self, message: dict) -> None:
+        """
+        Queue a message without ever blocking the publisher
+        :param message:
+        :return:
+        """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+    def hello(self, cursor: int) -> None:
+        """
+        Put the ``hello`` message first. The channel subscribes before the
+        cursor is read, so changes queued meanwhile are kept only when they
+        come after the cursor
+        :param cursor: journal head of the host
+        :return:
+        """
+        queued = []
+        while not self.queue.empty():
+            queued.append(self.queue.get_nowait())
+        self.overflowed = False
+        self.queue.put_nowait({"type": "hello", "cursor": cursor})
+        for message in queued:
+            if message["type"] != "change" or message["cursor"] > cursor:
+                self.offer(message)
+
+    async def next(self) -> dict:
+        """
+        Wait for the next message of this agent
+        :return:
+        """
+        message = await self.queue.get()
+        if message["type"] == "resync":
+            self.overflowed = False
+        return message
+
+
+@attrs.define
+class AgentHub:
+    """
+    Registry of agent websocket connected to this worker
+    """
+    queue_size: int
+    _channels: Dict[str, Set[AgentChannel]] = attrs.field(factory=dict, init=False)
+
+    def subscribe(self, hostname: str) -> AgentChannel:
+        """
+        Register a new connection of a host
+        :param hostname:
+        :return:
+        """
+        channel = AgentChannel(hostname, asyncio.Queue(self.queue_size))
+        self._channels.setdefault(hostname, set()).add(channel)
+        return channel
+
+    def unsubscribe(self, channel: AgentChannel) -> None:
+        """
+        Forget a closed connection
+        :param channel:
+        :return:
+        """
+        channels = self._channels.get(channel.hostname)
+        if channels is None:
+            return
+        channels.discard(channel)
+        if not channels:
+            del self._channels[channel.hostname]
+
+    def publish(self, hostname: str, message: dict) -> None:
+        """
+        Send a message to every connection of a host
+        :param hostname:
+        :param message:
+        :return:
+        """
+        for channel in self._channels.get(hostname, ()):
+            channel.offer(message)
+
+    def resync_all(self) -> None:
+        """
+        Ask every agent of this worker to catch up by polling, used when
+        changes may have been missed
+        :return:
+        """
+        for channels in self._channels.values():
+            for channel in channels:
+                channel.offer({"type": "resync"})
+
+    def stats(self) -> dict:
+        """
+        Connection counters of this worker
+        :return:
+        """
+        return {
+            "hosts": len(self._channels),
+            "connections": sum(len(channels) for channels in self._channels.values()),
+            "overflowed": sum(channel.overflowed for channels in self._channels.values() for channel in channels),
+        }
+
+
+@attrs.define
+class BlockChangeListener:
+    """
+    LISTEN on the journal channel and forward every change to the local hub.
+
+    The journal sends ``NOTIFY`` inside the writing transaction, so Postgres only
+    delivers it after commit and to every worker, not only the one that wrote it.
+    Other channels sharing the connection are added with ``listen``.
+    """
+    hub: AgentHub
+    dsn: str
+    retry_interval: float = 5
+    _listeners: Dict[str, Callable[[str], None]] = attrs.field(factory=dict, init=False)
+    _resyncs: List[Callable[[], None]] = attrs.field(factory=list, init=False)
+    _conn: Optional[asyncpg.Connection] = attrs.field(default=None, init=False)
+    _task: Optional[asyncio.Task] = attrs.field(default=None, init=False)
+
+    def start(self) -> None:
+        """
+        Start listening in the background
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='block-change-listener')
+
+    async def stop(self) -> None:
+        """
+        Stop listening and close the connection
+        :return:
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+    def listen(self, channel: str, callback: Callable[[str], None], resync: Callable[[], None]) -> None:
+        """
+        Listen on another channel, must be called before ``start``
+        :param channel:
+        :param callback: called with the payload of every notification
+        :param resync: called after a reconnect, notifications sent meanwhile are lost
+        :return:
+        """
+        self._listeners[channel] = callback
+        self._resyncs.append(resync)
+
+    def _dispatch(self, conn, pid, channel, payload: str) -> None:
+        change = json.loads(payload)
+        self.hub.publish(change.pop("hostname"), change)
+
+    def _notified(self, conn, pid, channel, payload: str) -> None:
+        self._listeners[channel](payload)
+
+    async def _run(self) -> None:
+        connected_once = False
+        while True:
+            try:
+                if self._conn is None or self._conn.is_closed():
+                    self._conn = await asyncpg.connect(self.dsn)
+                    await self._conn.add_listener(NOTIFY_CHANNEL, self._dispatch)
+                    for channel in self._listeners:
+                        await self._conn.add_listener(channel, self._notified)
+                    if connected_once:
+                        # notifications sent while we were away are lost
+                        self.hub.resync_all()
+                        for resync in self._resyncs:
+                            resync()
+                    connected_once = True
+            except Exception:
+                logger.exception("cannot listen on %s, retrying", NOTIFY_CHANNEL)
+                if self._conn is not None and not self._conn.is_closed():
+                    self._conn.terminate()
+                self._conn = None
+            await asyncio.sleep(self.retry_interval)
+
+
+agent_hub = AgentHub(cfg.push.queue_size)
+block_change_listener = BlockChangeListener(
+    agent_hub, make_url(cfg.db).set(drivername='postgresql').render_as_string(hide_password=False)
+)
+block_change_listener.listen(APIKEY_CHANNEL, apikey_resolver.revoked, apikey_resolver.clear)
+block_change_listener.listen(ADMIN_CHANNEL, admin_identity.revoked, admin_identity.clear)
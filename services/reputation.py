@@ -0,0 +1,150 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+import attrs
+
+from api.config import cfg
+from exceptions import ReputationQuotaExceededError
+from helpers.cache import TTLCache, MISSING
+
+
+@attrs.define
+class ReputationClient:
+    """
+    AbuseIPDB client.
+
+    Requests go through one pooled ``requests.Session`` on a small dedicated
+    thread pool so the event loop never waits on the network. Results are
+    cached per ip, a successful lookup stays fresh for ``positive_ttl`` and an
+    upstream error for ``negative_ttl``. Once the quota is used up, cached
+    results are served even when stale until the quota resets.
+    """
+    api_key: str
+    base_url: str
+    connect_timeout: float
+    read_timeout: float
+    positive_ttl: float
+    negative_ttl: float
+    pool_size: int
+    cache: TTLCache
+    quota_reset: float = attrs.field(default=0, init=False)
+    upstream_calls: int = attrs.field(default=0, init=False)
+    _session: Optional[Any] = attrs.field(default=None, init=False)
+    _executor: Optional[ThreadPoolExecutor] = attrs.field(default=None, init=False)
+
+    @property
+    def quota_exhausted(self) -> bool:
+        return time.time() < self.quota_reset
+
+    async def check(self, ip_address: str) -> dict:
+        """
+        Reputation of an ip
+        :param ip_address:
+        :return: decoded AbuseIPDB response, with ``stale`` set when it is
+            served from an expired cache entry
+        :raises ReputationQuotaExceededError: quota is used up and the ip is not cached
+        """
+        entry = self.cache.get(ip_address)
+        if entry is not MISSING:
+            fetched_at, ok, data = entry
+            if time.monotonic() - fetched_at < (self.positive_ttl if ok else self.negative_ttl):
+                return data
+
+        if self.quota_exhausted:
+            if entry is MISSING:
+                raise ReputationQuotaExceededError
+            return {**entry[2], "stale": True}
+
+        loop = asyncio.get_running_loop()
+        ok, data = await loop.run_in_executor(self._get_executor(), self._fetch, self._get_session(), ip_address)
+        if ok is None:
+            # rate limited by upstream
+            if entry is MISSING:
+                raise ReputationQuotaExceededError
+            return {**entry[2], "stale": True}
+
+        self.cache.set(ip_address, (time.monotonic(), ok, data))
+        return data
+
+    def _fetch(self, session, ip_address: str):
+        """
+        Blocking call to AbuseIPDB, runs on the client thread pool
+        :return: ``(ok, data)``, ``ok`` is ``None`` when rate limited
+        """
+        self.upstream_calls += 1
+        response = session.get(
+            f"{self.base_url}/check",
+            params={'ipAddress': ip_address, 'maxAgeInDays': '90'},
+            timeout=(self.connect_timeout, self.read_timeout),
+        )
+        self._track_quota(response)
+
+        if response.status_code == 429:
+            return None, None
+        # upstream outage is not an answer about the ip, it is not cached
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response.ok, response.json()
+
+    def _track_quota(self, response) -> None:
+        headers = response.headers
+        if response.status_code == 429:
+            self.quota_reset = time.time() + float(headers.get('Retry-After', 60))
+        elif headers.get('X-RateLimit-Remaining') == '0':
+            self.quota_reset = float(headers.get('X-RateLimit-Reset', time.time() + 60))
+
+    def _get_session(self):
+        if self._session is None:
+            # requests is only needed once the first lookup happens
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.headers.update({"Key": self.api_key, "Accept": "application/json"})
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix='abuseipdb')
+        return self._executor
+
+    def close(self) -> None:
+        """
+        Release pooled connections and threads
+        :return:
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def stats(self) -> dict:
+        """
+        Counters of the client
+        :return:
+        """
+        return {
+            "cache": self.cache.stats(),
+            "upstream_calls": self.upstream_calls,
+            "quota_exhausted": self.quota_exhausted,
+        }
+
+
+reputation_client = ReputationClient(
+    api_key=cfg.abuseipdb_api_key,
+    base_url=cfg.abuseipdb.url,
+    connect_timeout=cfg.abuseipdb.connect_timeout,
+    read_timeout=cfg.abuseipdb.read_timeout,
+    positive_ttl=cfg.abuseipdb.positive_ttl,
+    negative_ttl=cfg.abuseipdb.negative_ttl,
+    pool_size=cfg.abuseipdb.pool_size,
+    cache=TTLCache(cfg.abuseipdb.cache_size, cfg.abuseipdb.stale_ttl),
+)
@@ -0,0 +1,108 @@
+import random
+from typing import Optional
+
+import attrs
+from sqlalchemy import select, func, cast, BigInteger
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from api.config import cfg
+from core.db import after_commit
+from core.statements import hot_statements
+from helpers.cache import TTLCache, MISSING
+from models.blocked import BlockedModel
+from models.dashboard_stats import DashboardStatsModel
+from models.hosts import HostModel
+from models.ioc import IocModel
+from schemas.admin import ReportResponseSchema
+
+STATS_ID = 1
+
+report_cache = TTLCache(1, cfg.stats.cache_ttl)
+
+
+@attrs.define
+class DashboardStats:
+    """
+    Counters of the dashboard, spread over ``shards`` rows of ``dashboard_stats``.
+
+    Write paths add their deltas in their own transaction to a random shard,
+    so concurrent requests rarely wait on the same row lock, and the report
+    sums the shards. ``reconcile`` recounts the tables into shard 0 and zeroes
+    the others to correct any drift.
+    """
+    conn: AsyncConnection
+    shards: int = cfg.stats.shards
+
+    async def add(self, connected_agents: int = 0, blocked_ips: int = 0, active_alerts: int = 0) -> None:
+        """
+        Add deltas to a random shard in the current transaction
+        :param connected_agents:
+        :param blocked_ips:
+        :param active_alerts:
+        :return:
+        """
+        if not (connected_agents or blocked_ips or active_alerts):
+            return
+
+        await hot_statements.execute(
+            self.conn, 'stats_add', shard=random.randrange(self.shards), connected_agents=connected_agents,
+            blocked_ips=blocked_ips, active_alerts=active_alerts
+        )
+        after_commit(self.conn, report_cache.clear)
+
+    async def read(self) -> Optional[ReportResponseSchema]:
+        """
+        Current counters
+        :return: ``None`` when the counters were never reconciled
+        """
+        row = (await self.conn.execute(
+            select(
+                cast(func.sum(DashboardStatsModel.c.connected_agents), BigInteger).label('connected_agents'),
+                cast(func.sum(DashboardStatsModel.c.blocked_ips), BigInteger).label('blocked_ips'),
+                cast(func.sum(DashboardStatsModel.c.active_alerts), BigInteger).label('active_alerts'),
+                func.max(DashboardStatsModel.c.reconciled_at).label('reconciled_at'),
+            )
+        )).first()
+        if row.reconciled_at is None:
+            return None
+
+        return ReportResponseSchema(
+            connected_agents=row.connected_agents,
+            blocked_ips=row.blocked_ips,
+            active_alerts=row.active_alerts,
+        )
+
+    async def reconcile(self) -> None:
+        """
+        Recount the counters from the tables.
+
+        Every shard row is created then locked first, writers committing
+        meanwhile wait for it, so their deltas land on top of a count that
+        already saw them.
+        :return:
+        """
+        await self.conn.execute(
+            insert(DashboardStatsModel).values([{"id": shard} for shard in range(self.shards)]).on_conflict_do_nothing()
+        )
+        await self.conn.execute(select(DashboardStatsModel.c.id).with_for_update())
+
+        counts = {
+            "connected_agents": select(func.count(HostModel.c.id)).scalar_subquery(),
+            "blocked_ips": select(func.count(BlockedModel.c.id)).where(
+                BlockedModel.c.is_blocked == True
+            ).scalar_subquery(),
+            "active_alerts": select(func.count(IocModel.c.id)).where(
+                IocModel.c.is_process == False
+            ).scalar_subquery(),
+            "reconciled_at": func.now(),
+        }
+        await self.conn.execute(
+            DashboardStatsModel.update().where(DashboardStatsModel.c.id == 0).values(**counts)
+        )
+        await self.conn.execute(
+            DashboardStatsModel.update().where(DashboardStatsModel.c.id != 0).values(
+                connected_agents=0, blocked_ips=0, active_alerts=0, reconciled_at=None
+            )
+        )
+        after_commit(self.conn, report_cache.clear)
@@ -0,0 +1,229 @@
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import attrs
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from core.db import engine, after_commit
+from exceptions import WhitelistedIpError
+from helpers.prefix_trie import PrefixTrie, Network, parse_network
+from models.whitelists import WhitelistModel
+
+logger = logging.getLogger(__name__)
+
+
+def whitelist_entry(network: Network) -> str:
+    """
+    Stored form of a network, a single address is kept without its prefix length
+    :param network:
+    :return:
+    """
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+
+def entry_hash(network: Network) -> int:
+    """
+    64 bit hash of a network, stable across processes unlike ``hash``
+    :param network:
+    :return:
+    """
+    return int.from_bytes(hashlib.blake2b(str(network).encode(), digest_size=8).digest(), 'big')
+
+
+@attrs.define
+class WhitelistIndex:
+    """
+    In-memory prefix trie of the ``whitelist`` table.
+
+    Changes made by this worker are applied to the trie when their
+    transaction commits, changes of other workers are picked up by ``sync``,
+    which only reads the table when its (count, max id, sum of ids)
+    fingerprint moved and then adds and removes the differing entries.
+    ``version`` moves on every change of the trie, ``digest`` only depends on
+    the entries so it is the same in every worker holding the same whitelist.
+    """
+    engine: AsyncEngine
+    trie: PrefixTrie = attrs.field(factory=PrefixTrie)
+    loaded: bool = attrs.field(default=False, init=False)
+    version: int = attrs.field(default=0, init=False)
+    digest: int = attrs.field(default=0, init=False)
+    _entries: Dict[int, Network] = attrs.field(factory=dict, init=False)
+    _fingerprint: Optional[Tuple] = attrs.field(default=None, init=False)
+
+    async def check(self, conn: AsyncConnection, ip_address: str) -> None:
+        """
+        Refuse a whitelisted ip
+        :param conn: used to load the whitelist on first use
+        :param ip_address:
+        :return:
+        :raises WhitelistedIpError: a whitelist entry contains the ip
+        """
+        network = await self.match(conn, ip_address)
+        if network is not None:
+            raise WhitelistedIpError(ip_address, whitelist_entry(network))
+
+    async def match(self, conn: AsyncConnection, ip_address: str) -> Optional[Network]:
+        """
+        Whitelist entry containing an ip
+        :param conn: used to load the whitelist on first use
+        :param ip_address:
+        :return: ``None`` when the ip is not whitelisted or not an ip
+        """
+        await self.ensure_loaded(conn)
+        try:
+            return self.trie.match(ip_address.strip())
+        except ValueError:
+            return None
+
+    async def ensure_loaded(self, conn: AsyncConnection) -> None:
+        """
+        Load the whitelist unless it already is
+        :param conn:
+        :return:
+        """
+        if not self.loaded:
+            await self._load(conn)
+
+    def added(self, conn: AsyncConnection, rows: Iterable[Tuple[int, Network]]) -> None:
+        """
+        Apply entries inserted by the current transaction once it commits
+        :param conn:
+        :param rows: (id, network)
+        :return:
+        """
+        rows = list(rows)
+        after_commit(conn, lambda: self._apply(rows, []))
+
+    def removed(self, conn: AsyncConnection, ids: Iterable[int]) -> None:
+        """
+        Apply entries deleted by the current transaction once it commits
+        :param conn:
+        :param ids:
+        :return:
+        """
+        ids = list(ids)
+        after_commit(conn, lambda: self._apply([], ids))
+
+    def _apply(self, added: List[Tuple[int, Network]], removed: List[int]) -> None:
+        if added or removed:
+            self.version += 1
+        for id_ in removed:
+            network = self._entries.pop(id_, None)
+            if network is not None and self.trie.remove(network):
+                self.digest ^= entry_hash(network)
+        for id_, network in added:
+            self._entries[id_] = network
+            if self.trie.add(network):
+                self.digest ^= entry_hash(network)
+        # the next sync reads the fingerprint again
+        self._fingerprint = None
+
+    async def _fingerprint_of(self, conn: AsyncConnection) -> Tuple:
+        row = (await conn.execute(select(
+            func.count(WhitelistModel.c.id),
+            func.max(WhitelistModel.c.id),
+            func.sum(WhitelistModel.c.id),
+        ))).first()
+        return tuple(row)
+
+    async def _load(self, conn: AsyncConnection) -> None:
+        fingerprint = await self._fingerprint_of(conn)
+        rows = (await conn.execute(select(WhitelistModel.c.id, WhitelistModel.c.ip))).fetchall()
+        stored = {}
+        for row in rows:
+            try:
+                stored[row.id] = parse_network(row.ip)
+            except ValueError:
+                logger.warning("ignoring invalid whitelist entry %r", row.ip)
+
+        self._apply(
+            [(id_, network) for id_, network in stored.items() if self._entries.get(id_) != network],
+            [id_ for id_ in self._entries if id_ not in stored],
+        )
+        self._fingerprint = fingerprint
+        self.loaded = True
+
+    async def sync(self) -> None:
+        """
+        Pick up whitelist changes of other workers
+        :return:
+        """
+        async with self.engine.connect() as conn:
+            if self.loaded and await self._fingerprint_of(conn) == self._fingerprint:
+                return
+            await self._load(conn)
+
+    def stats(self) -> dict:
+        """
+        Size of the trie
+        :return:
+        """
+        return {
+            "loaded": self.loaded,
+            "prefixes": len(self.trie),
+        }
+
+
+@attrs.define
+class WhitelistService:
+    """
+    Manage whitelisted ips and networks
+    """
+
+    async def add(self, conn: AsyncConnection, entries: List[str]) -> List[str]:
+        """
+        Whitelist ips and cidrs
+        :param conn:
+        :param entries:
+        :return: stored entries, already whitelisted ones included
+        :raises ValueError: an entry is neither an ip nor a cidr
+        """
+        networks = {}
+        for entry in entries:
+            network = parse_network(entry)
+            networks[whitelist_entry(network)] = network
+        if not networks:
+            return []
+
+        rows = (await conn.execute(
+            insert(WhitelistModel).values([
+                {"ip": entry} for entry in sorted(networks)
+            ]).on_conflict_do_nothing(
+                index_elements=[WhitelistModel.c.ip]
+            ).returning(WhitelistModel.c.id, WhitelistModel.c.ip)
+        )).fetchall()
+        whitelist_index.added(conn, [(row.id, networks[row.ip]) for row in rows])
+        return list(networks)
+
+    async def remove(self, conn: AsyncConnection, entry: str) -> bool:
+        """
+        Remove an entry from the whitelist
+        :param conn:
+        :param entry: ip or cidr as given when it was added
+        :return: ``False`` when it was not whitelisted
+        :raises ValueError: the entry is neither an ip nor a cidr
+        """
+        query = WhitelistModel.delete().where(
+            WhitelistModel.c.ip == whitelist_entry(parse_network(entry))
+        ).returning(WhitelistModel.c.id)
+
+        ids = [row.id for row in await conn.execute(query)]
+        whitelist_index.removed(conn, ids)
+        return bool(ids)
+
+    async def list_entries(self, conn: AsyncConnection) -> List[str]:
+        """
+        Every whitelist entry
+        :param conn:
+        :return:
+        """
+        query = select(WhitelistModel.c.ip).order_by(WhitelistModel.c.id)
+        return [row.ip for row in await conn.execute(query)]
+
+
+whitelist_index = WhitelistIndex(engine=engine)